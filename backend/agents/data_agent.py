@@ -1,5 +1,9 @@
+import os
 import pandas as pd
 import numpy as np
+from collections import Counter
+from typing import Dict, Iterator, Optional, BinaryIO, Tuple
+from services.metrics_service import metrics
 
 class DataCleaningAgent:
     def __init__(self):
@@ -20,12 +24,151 @@ class DataCleaningAgent:
             'waste_generated_kg',
             'company_size'
         ]
+        
+        # Defaults for features missing from an upload
+        self.feature_defaults = {feature: 0.0 for feature in self.expected_features}
+        self.feature_defaults['company_size'] = 10.0
+        
+        # Columns that name the facility a row belongs to; kept as the cleaned frame's index
+        self.identifier_columns = ['facility_id', 'facility_name', 'facility', 'site_name', 'site', 'company_name']
+        
+        self.parquet_extensions = {'.parquet', '.pq'}
+        self.arrow_extensions = {'.arrow', '.feather', '.ipc'}
+        
+        # Resolved column plans keyed by header signature; uploads reuse a handful of templates
+        self._schema_cache: Dict[Tuple[str, ...], Dict[str, Optional[str]]] = {}
+    
+    def resolve_schema(self, columns) -> Dict[str, Optional[str]]:
+        """Map each expected feature to the upload column that feeds it (None means use the default)"""
+        signature = tuple(str(col) for col in columns)
+        plan = self._schema_cache.get(signature)
+        if plan is None:
+            aliases = {}
+            for source, target in self.column_mappings.items():
+                if source in signature:
+                    aliases.setdefault(target, source)
+            plan = {
+                feature: feature if feature in signature else aliases.get(feature)
+                for feature in self.expected_features
+            }
+            self._schema_cache[signature] = plan
+        return plan
+
+    def identifier_column(self, columns) -> Optional[str]:
+        for col in self.identifier_columns:
+            if col in columns:
+                return col
+        return None
+
+    def read_clean(self, file_obj: BinaryIO) -> pd.DataFrame:
+        """
+        Fast path for CSV uploads: parse only the mapped columns as float32 and impute in one pass.
+        Falls back to the pandas path when a needed column is not numeric.
+        """
+        read_options = self._read_options(file_obj)
+        plan = read_options.pop("plan")
+        id_col = read_options.pop("id_col")
+        try:
+            if not any(plan.values()):
+                raise ValueError("No expected feature columns in upload")
+            with metrics.timer("csv_parse", agent="data"):
+                df = pd.read_csv(file_obj, **read_options)
+        except ValueError:
+            file_obj.seek(0)
+            with metrics.timer("csv_parse", agent="data"):
+                df = pd.read_csv(file_obj)
+            return self.clean(df)
+        return self.clean_columns({feature: df[source].to_numpy() if source is not None else None
+                                   for feature, source in plan.items()}, len(df),
+                                  index=df[id_col].to_numpy() if id_col else None)
+
+    @metrics.timed("arrow_read", agent="data")
+    def read_arrow(self, file_obj: BinaryIO, fmt: str = "parquet") -> pd.DataFrame:
+        """
+        Parquet / Arrow IPC uploads: only the mapped columns are read, and float32 columns
+        without nulls are viewed straight from the Arrow buffers before landing in the feature matrix.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            names = pq.read_schema(file_obj).names
+            plan = self.resolve_schema(names)
+            id_col = self.identifier_column(names)
+            file_obj.seek(0)
+            usecols = sorted({source for source in plan.values() if source is not None} | ({id_col} if id_col else set()))
+            table = pq.read_table(file_obj, columns=usecols)
+        else:
+            import pyarrow.ipc as ipc
+            try:
+                table = ipc.open_file(file_obj).read_all()
+            except pa.ArrowInvalid:
+                file_obj.seek(0)
+                table = ipc.open_stream(file_obj).read_all()
+            plan = self.resolve_schema(table.column_names)
+            id_col = self.identifier_column(table.column_names)
+        
+        columns = {}
+        for feature, source in plan.items():
+            if source is None:
+                columns[feature] = None
+                continue
+            column = table.column(source)
+            if column.type != pa.float32():
+                column = pc.cast(column, pa.float32())
+            # Nulls become NaN and are imputed with the rest
+            columns[feature] = column.combine_chunks().to_numpy(zero_copy_only=False)
+        index = table.column(id_col).to_numpy(zero_copy_only=False).astype(str) if id_col else None
+        return self.clean_columns(columns, table.num_rows, index=index)
+
+    def upload_format(self, filename: str = "") -> str:
+        """'parquet', 'arrow' or 'csv', from the file extension (CSV unless it says otherwise)"""
+        ext = os.path.splitext(filename or "")[1].lower()
+        if ext in self.parquet_extensions:
+            return "parquet"
+        if ext in self.arrow_extensions:
+            return "arrow"
+        return "csv"
+
+    def read_upload(self, file_obj: BinaryIO, filename: str = "") -> pd.DataFrame:
+        """Dispatch an upload to the reader for its format"""
+        fmt = self.upload_format(filename)
+        if fmt == "csv":
+            return self.read_clean(file_obj)
+        return self.read_arrow(file_obj, fmt)
+
+    @metrics.timed("clean", agent="data")
+    def clean_columns(self, columns: Dict[str, Optional[np.ndarray]], n_rows: int, index=None) -> pd.DataFrame:
+        """Assemble mapped feature columns into one float32 matrix and mean-impute NaNs in a single pass"""
+        # Fortran order keeps each feature contiguous and lets pandas wrap the matrix without copying
+        matrix = np.empty((n_rows, len(self.expected_features)), dtype=np.float32, order='F')
+        for j, feature in enumerate(self.expected_features):
+            values = columns.get(feature)
+            if values is None:
+                matrix[:, j] = self.feature_defaults[feature]
+                continue
+            matrix[:, j] = values
+            missing = np.isnan(matrix[:, j])
+            if missing.any():
+                present = matrix[~missing, j]
+                matrix[missing, j] = present.mean(dtype=np.float64) if len(present) else np.nan
+        frame = pd.DataFrame(matrix, columns=self.expected_features, copy=False)
+        if index is not None:
+            frame.index = pd.Index(index, name='facility')
+        return frame
     
     def map_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         """Map various column names to expected model features"""
         # Create a copy to avoid modifying original
         df = df.copy()
         
+        # Facility names ride along as the index
+        id_col = self.identifier_column(df.columns)
+        if id_col is not None:
+            df = df.set_index(id_col)
+            df.index = df.index.astype(str).rename('facility')
+        
         # Rename columns based on mapping
         df = df.rename(columns=self.column_mappings)
         
@@ -45,22 +188,117 @@ class DataCleaningAgent:
         
         return df
     
-    def clean(self, df: pd.DataFrame) -> pd.DataFrame:
+    def row_to_dict(self, df: pd.DataFrame, index: int = 0) -> Dict:
+        """One cleaned row as plain Python values, float32 noise trimmed back to the parsed decimals"""
+        row = {}
+        for col, value in df.iloc[index].items():
+            if isinstance(value, (float, np.floating)) and df[col].dtype == np.float32:
+                value = float(f"{value:.7g}")
+            row[col] = value
+        return row
+
+    @metrics.timed("clean", agent="data")
+    def clean(self, df: pd.DataFrame, fill_values: Optional[Dict] = None) -> pd.DataFrame:
         # First map columns to expected schema
         df = self.map_columns(df)
         
-        # Handle missing values
+        # Handle missing values (precomputed fills keep chunked input consistent with the whole file)
         numeric_cols = df.select_dtypes(include=[np.number]).columns
-        df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].mean())
+        if fill_values is None:
+            df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].mean())
+        else:
+            df[numeric_cols] = df[numeric_cols].fillna({col: fill_values[col] for col in numeric_cols if col in fill_values})
         
         # Fill non-numeric with mode
         non_numeric_cols = df.select_dtypes(exclude=[np.number]).columns
         for col in non_numeric_cols:
-            if len(df[col].mode()) > 0:
+            if fill_values is not None:
+                if fill_values.get(col) is not None:
+                    df[col] = df[col].fillna(fill_values[col])
+            elif len(df[col].mode()) > 0:
                 df[col] = df[col].fillna(df[col].mode()[0])
             
         return df
 
+    def column_stats(self, chunks: Iterator[pd.DataFrame]) -> Dict:
+        """First pass over chunked input: running sums/counts for means and value counts for modes"""
+        sums = {feature: 0.0 for feature in self.expected_features}
+        counts = {feature: 0 for feature in self.expected_features}
+        value_counts: Dict[str, Counter] = {}
+        rows = 0
+        
+        for chunk in chunks:
+            chunk = self.map_columns(chunk)
+            rows += len(chunk)
+            for col in self.expected_features:
+                if pd.api.types.is_numeric_dtype(chunk[col]):
+                    sums[col] += float(chunk[col].sum())
+                    counts[col] += int(chunk[col].count())
+                else:
+                    value_counts.setdefault(col, Counter()).update(chunk[col].dropna().tolist())
+        
+        return {"rows": rows, "sums": sums, "counts": counts, "value_counts": value_counts}
+
+    def fill_values(self, stats: Dict) -> Dict:
+        """Turn running statistics into the same fills clean() computes on a whole frame"""
+        fills = {}
+        for col in self.expected_features:
+            if col in stats["value_counts"]:
+                counter = stats["value_counts"][col]
+                if counter:
+                    top = max(counter.values())
+                    # pandas mode() breaks ties by returning the smallest value
+                    fills[col] = sorted(value for value, n in counter.items() if n == top)[0]
+                else:
+                    fills[col] = None
+            elif stats["counts"][col] > 0:
+                fills[col] = stats["sums"][col] / stats["counts"][col]
+            else:
+                fills[col] = np.nan
+        return fills
+
+    def iter_clean_chunks(self, file_obj: BinaryIO, chunk_size: int = 100000, on_stats=None) -> Iterator[pd.DataFrame]:
+        """
+        Two-pass streaming clean of a seekable CSV file object.
+        Peak memory is bounded by chunk_size rather than the file size.
+        """
+        read_options = self._read_options(file_obj)
+        plan = read_options.pop("plan")
+        read_options.pop("id_col")
+        try:
+            stats = self.column_stats(pd.read_csv(file_obj, chunksize=chunk_size, **read_options))
+        except ValueError:
+            # A mapped column holds text; parse everything and let clean() take the mode
+            file_obj.seek(0)
+            read_options = {}
+            stats = self.column_stats(pd.read_csv(file_obj, chunksize=chunk_size))
+            # A whole-file read makes a column text if any row is; chunks that happened to parse
+            # as numbers must be read as text too, or fills and values drift from clean()
+            mixed = [col for col in stats["value_counts"] if stats["counts"][col] > 0]
+            if mixed:
+                read_options = {"dtype": {plan[col]: str for col in mixed}}
+                file_obj.seek(0)
+                stats = self.column_stats(pd.read_csv(file_obj, chunksize=chunk_size, **read_options))
+        fills = self.fill_values(stats)
+        if on_stats is not None:
+            on_stats(stats)
+        
+        file_obj.seek(0)
+        for chunk in pd.read_csv(file_obj, chunksize=chunk_size, **read_options):
+            yield self.clean(chunk, fill_values=fills)
+
+    def _read_options(self, file_obj: BinaryIO) -> Dict:
+        """usecols/dtype for read_csv so only mapped columns are parsed, as float32"""
+        header = pd.read_csv(file_obj, nrows=0).columns
+        file_obj.seek(0)
+        plan = self.resolve_schema(header)
+        id_col = self.identifier_column(header)
+        feature_cols = sorted({source for source in plan.values() if source is not None})
+        dtype = {col: np.float32 for col in feature_cols}
+        if id_col is not None:
+            dtype[id_col] = str
+        return {"plan": plan, "id_col": id_col, "usecols": list(dtype), "dtype": dtype}
+
     def normalize(self, df: pd.DataFrame) -> pd.DataFrame:
         # Simple min-max normalization for demonstration
         numeric_cols = df.select_dtypes(include=[np.number]).columns
@@ -1,33 +1,49 @@
-from typing import List, Dict
-from models.schemas import OptimizationSuggestion
+from typing import Callable, List, Dict, Optional
+from models.schemas import OptimizationSuggestion, WhatIfResponse
+from services.llm_service import LLMGateway, LLM_MODEL_NAME
+from services.llm_cache import LLMCache
+from services.llm_batcher import LLMBatcher, strip_code_fence
+from services.metrics_service import metrics
+from agents.optimization_rules import OptimizationRuleEngine, RuleEvaluation
+from agents.scenario_engine import ScenarioEngine
 
 import os
 import json
+import logging
+import numpy as np
+import pandas as pd
 import google.generativeai as genai
 
+logger = logging.getLogger(__name__)
+
 class OptimizationAgent:
-    def __init__(self):
+    def __init__(self, gateway: LLMGateway = None, cache: LLMCache = None,
+                 predictor: Callable[[pd.DataFrame], np.ndarray] = None, model_ready: Callable[[], bool] = None):
         self._setup_llm()
+        self.gateway = gateway or LLMGateway()
+        self.cache = cache
+        self.batcher = LLMBatcher(self.gateway, cache=cache)
+        self.rule_engine = OptimizationRuleEngine.from_env()
+        # Batch scoring function of the prediction model; without it savings fall back to fixed fractions
+        self.predictor = predictor
+        self.model_ready = model_ready
+        self.scenarios = ScenarioEngine.from_env()
 
     def _setup_llm(self):
         api_key = os.getenv("GOOGLE_API_KEY")
         if api_key:
             try:
                 genai.configure(api_key=api_key)
-                self.llm_model = genai.GenerativeModel('gemini-2.5-flash')
-                print("Optimization Agent LLM initialized.")
+                self.llm_model = genai.GenerativeModel(LLM_MODEL_NAME)
+                logger.info("Optimization Agent LLM initialized.")
             except Exception as e:
-                print(f"Failed to initialize Optimization LLM: {e}")
+                logger.error("Failed to initialize Optimization LLM: %s", e)
                 self.llm_model = None
         else:
             self.llm_model = None
 
-    def optimize(self, data: Dict[str, float], current_emission: float) -> List[OptimizationSuggestion]:
-        suggestions = []
-        
-        if self.llm_model:
-            try:
-                prompt = f"""
+    def _build_prompt(self, data: Dict[str, float], current_emission: float) -> str:
+        return f"""
                 Act as a Sustainability Consultant.
                 Based on the following data and total emission, suggest 3 specific optimization strategies to reduce carbon footprint.
                 
@@ -41,63 +57,137 @@ class OptimizationAgent:
                 
                 Do not include markdown formatting like ```json ... ```. Just the raw JSON array.
                 """
-                response = self.llm_model.generate_content(prompt)
-                text = response.text.strip()
-                
-                # Clean up markdown if present
-                if text.startswith("```json"):
-                    text = text[7:]
-                elif text.startswith("```"):
-                    text = text[3:]
-                if text.endswith("```"):
-                    text = text[:-3]
-                
-                data_json = json.loads(text.strip())
-                for item in data_json:
-                    suggestions.append(OptimizationSuggestion(**item))
-                
+
+    def _parse_suggestions(self, text: str) -> List[OptimizationSuggestion]:
+        # Clean up markdown if present
+        data_json = json.loads(strip_code_fence(text))
+        return [OptimizationSuggestion(**item) for item in data_json]
+
+    def _suggestions_key(self, data: Dict[str, float], current_emission: float) -> Optional[str]:
+        if self.cache is None or not self.llm_model:
+            return None
+        return self.cache.make_key("optimize", data, current_emission, LLM_MODEL_NAME)
+
+    @staticmethod
+    def _decode_suggestions(cached: Optional[str]) -> Optional[List[OptimizationSuggestion]]:
+        return None if cached is None else [OptimizationSuggestion(**item) for item in json.loads(cached)]
+
+    def _cached_suggestions(self, data: Dict[str, float], current_emission: float):
+        """Returns (cache_key, cached suggestions or None)"""
+        cache_key = self._suggestions_key(data, current_emission)
+        if cache_key is None:
+            return None, None
+        return cache_key, self._decode_suggestions(self.cache.get(cache_key))
+
+    async def _cached_suggestions_async(self, data: Dict[str, float], current_emission: float):
+        cache_key = self._suggestions_key(data, current_emission)
+        if cache_key is None:
+            return None, None
+        return cache_key, self._decode_suggestions(await self.cache.get_async(cache_key))
+
+    def _store_suggestions(self, cache_key, suggestions: List[OptimizationSuggestion]):
+        if cache_key is not None:
+            self.cache.set(cache_key, json.dumps([s.model_dump() for s in suggestions]))
+
+    @metrics.timed("optimize", agent="optimization")
+    def optimize(self, data: Dict[str, float], current_emission: float) -> List[OptimizationSuggestion]:
+        if self.llm_model:
+            cache_key, cached = self._cached_suggestions(data, current_emission)
+            if cached:
+                return cached
+            try:
+                response = self.llm_model.generate_content(self._build_prompt(data, current_emission))
+                suggestions = self._parse_suggestions(response.text)
                 if suggestions:
+                    self._store_suggestions(cache_key, suggestions)
                     return suggestions
             except Exception as e:
-                print(f"LLM optimization failed: {e}")
+                logger.warning("LLM optimization failed: %s", e)
                 # Fallback to heuristics if LLM fails
         
-        # Heuristic Fallback
-        energy = data.get('energy_usage_kwh', 0)
-        fuel = data.get('fuel_consumption_liters', 0)
-        distance = data.get('distance_traveled_km', 0)
+        metrics.inc("fallbacks_total", kind="optimize")
+        return self._heuristic_suggestions(data, current_emission)
+
+    @metrics.timed("optimize", agent="optimization")
+    async def optimize_async(self, data: Dict[str, float], current_emission: float) -> List[OptimizationSuggestion]:
+        """Same as optimize() but never blocks the event loop; times out to the heuristic"""
+        cache_key, cached = await self._cached_suggestions_async(data, current_emission)
+        if cached:
+            return cached
         
-        # Simple heuristic for savings
-        if energy > 1000:
-            saving = current_emission * 0.10 # 10%
-            suggestions.append(OptimizationSuggestion(
-                category="Energy",
-                suggestion="Switch to LED lighting and optimize HVAC schedules.",
-                potential_saving_kg=saving
-            ))
-            
-        if fuel > 500:
-            saving = current_emission * 0.15 # 15%
-            suggestions.append(OptimizationSuggestion(
-                category="Fuel",
-                suggestion="Upgrade fleet to electric vehicles or hybrid models.",
-                potential_saving_kg=saving
-            ))
-            
-        if distance > 500:
-            saving = current_emission * 0.05 # 5%
-            suggestions.append(OptimizationSuggestion(
-                category="Logistics",
-                suggestion="Optimize delivery routes using route planning software.",
-                potential_saving_kg=saving
-            ))
-            
-        if not suggestions:
-            saving = current_emission * 0.02
-            suggestions.append(OptimizationSuggestion(
-                category="General",
-                suggestion="Conduct a detailed energy audit.",
-                potential_saving_kg=saving
-            ))
-            
-        return suggestions
+        text = await self.gateway.generate(self.llm_model, self._build_prompt(data, current_emission))
+        if text:
+            try:
+                suggestions = self._parse_suggestions(text)
+                if suggestions:
+                    if cache_key is not None:
+                        await self.cache.set_async(cache_key, json.dumps([s.model_dump() for s in suggestions]))
+                    return suggestions
+            except Exception as e:
+                logger.warning("LLM optimization failed: %s", e)
+        
+        metrics.inc("fallbacks_total", kind="optimize")
+        return self._heuristic_suggestions(data, current_emission)
+
+    def has_model(self) -> bool:
+        """A predictor is wired and its model is loaded; otherwise savings use the rules' fixed fractions"""
+        return self.predictor is not None and (self.model_ready is None or self.model_ready())
+
+    @metrics.timed("rules", agent="optimization")
+    def evaluate_batch(self, data: pd.DataFrame, emissions) -> RuleEvaluation:
+        """Vectorized heuristic over a whole batch; materialize rows with .suggestions(i)"""
+        evaluation = self.rule_engine.evaluate(data, emissions)
+        if self.has_model() and isinstance(data, pd.DataFrame):
+            try:
+                evaluation.savings = self.scenarios.rule_savings(data, evaluation.masks, evaluation.rules,
+                                                                 self.predictor, evaluation.savings)
+            except Exception as e:
+                logger.warning("Model-based rule savings failed, using fixed fractions: %s", e)
+        return evaluation
+
+    @metrics.timed("what_if", agent="optimization")
+    def what_if(self, data: Dict[str, float], budget: Optional[float] = None, top_k: int = 5) -> WhatIfResponse:
+        """Score the scenario grid for one facility in a single model call"""
+        if not self.has_model():
+            raise ValueError("What-if analysis needs a prediction model")
+        return self.scenarios.evaluate(data, self.predictor, budget=budget, top_k=top_k)
+
+    def suggest_many(self, data: pd.DataFrame, emissions) -> List[List[OptimizationSuggestion]]:
+        """Suggestions for many rows at once (batch reports); no per-row LLM round trips"""
+        evaluation = self.evaluate_batch(data, emissions)
+        return [evaluation.suggestions(i) for i in range(len(evaluation))]
+
+    BATCH_INSTRUCTIONS = """Act as a Sustainability Consultant.
+For every row below, suggest up to 3 specific strategies to reduce its carbon footprint.
+Return strictly a raw JSON array (no markdown) with one object per row:
+{"row_id": <row_id>, "suggestions": [{"category": "<Energy|Fuel|Logistics|...>", "suggestion": "<actionable advice>", "potential_saving_fraction": <share of the row's emission saved, 0-1>}]}"""
+
+    @metrics.timed("suggest_batch", agent="optimization")
+    async def suggest_batch(self, records: List[Dict[str, float]], emissions) -> List[List[OptimizationSuggestion]]:
+        """LLM suggestions for many rows in a few packed prompts; rows without an answer get the rule engine"""
+        def parse_item(item, record, emission):
+            # Savings come back as fractions so one answer fits every row in a dedup bucket
+            return [
+                OptimizationSuggestion(
+                    category=s["category"],
+                    suggestion=s["suggestion"],
+                    potential_saving_kg=float(s["potential_saving_fraction"]) * emission,
+                )
+                for s in item["suggestions"]
+            ] or None
+
+        results = await self.batcher.run(self.llm_model, "optimize", records, emissions,
+                                         self.BATCH_INSTRUCTIONS, parse_item)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            fallback = self.evaluate_batch(pd.DataFrame([records[i] for i in missing]),
+                                           [float(emissions[i]) for i in missing])
+            for j, i in enumerate(missing):
+                results[i] = fallback.suggestions(j)
+        return results
+
+    def _heuristic_suggestions(self, data: Dict[str, float], current_emission: float) -> List[OptimizationSuggestion]:
+        # Heuristic Fallback (rule table in agents/optimization_rules.py)
+        if self.has_model():
+            return self.evaluate_batch(pd.DataFrame([data]), [current_emission]).suggestions(0)
+        return self.rule_engine.evaluate_record(data, current_emission)
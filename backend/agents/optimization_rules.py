@@ -0,0 +1,147 @@
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from models.schemas import OptimizationSuggestion
+
+# Rule table for the heuristic optimizer. Each rule fires when `feature <operator> threshold`.
+# With a model available its saving is the predicted effect of cutting `feature` by `reduction`
+# (see agents/scenario_engine.py); otherwise it saves `saving_fraction` of the row's emission.
+DEFAULT_RULES = [
+    {
+        "category": "Energy",
+        "suggestion": "Switch to LED lighting and optimize HVAC schedules.",
+        "feature": "energy_usage_kwh", "operator": ">", "threshold": 1000, "saving_fraction": 0.10, "reduction": 0.2,
+    },
+    {
+        "category": "Fuel",
+        "suggestion": "Upgrade fleet to electric vehicles or hybrid models.",
+        "feature": "fuel_consumption_liters", "operator": ">", "threshold": 500, "saving_fraction": 0.15, "reduction": 0.3,
+    },
+    {
+        "category": "Logistics",
+        "suggestion": "Optimize delivery routes using route planning software.",
+        "feature": "distance_traveled_km", "operator": ">", "threshold": 500, "saving_fraction": 0.05, "reduction": 0.1,
+    },
+]
+
+# Applied to rows no other rule matched
+DEFAULT_FALLBACK = {
+    "category": "General",
+    "suggestion": "Conduct a detailed energy audit.",
+    "saving_fraction": 0.02,
+}
+
+OPERATORS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal}
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value)
+
+def _check_text(entry: Dict, name: str, key: str):
+    if not isinstance(entry.get(key), str) or not entry[key].strip():
+        raise ValueError(f"{name} needs a non-empty {key!r}")
+
+def _check_fraction(entry: Dict, name: str, key: str):
+    if not _is_number(entry.get(key)) or not 0 <= entry[key] <= 1:
+        raise ValueError(f"{name} needs {key!r} between 0 and 1, got {entry.get(key)!r}")
+
+def _validate_rule(rule: Dict, name: str):
+    """Reject a malformed rule when the table is loaded rather than on the first request it breaks"""
+    for key in ("category", "suggestion", "feature"):
+        _check_text(rule, name, key)
+    if rule["operator"] not in OPERATORS:
+        raise ValueError(f"{name} has unsupported operator {rule['operator']!r}")
+    if not _is_number(rule.get("threshold")):
+        raise ValueError(f"{name} needs a numeric 'threshold', got {rule.get('threshold')!r}")
+    _check_fraction(rule, name, "saving_fraction")
+    if rule.get("reduction") is not None:
+        _check_fraction(rule, name, "reduction")
+
+def _validate_fallback(fallback: Dict):
+    for key in ("category", "suggestion"):
+        _check_text(fallback, "Fallback rule", key)
+    _check_fraction(fallback, "Fallback rule", "saving_fraction")
+
+class RuleEvaluation:
+    """Masks and savings for a whole batch; suggestion objects are only built when asked for"""
+
+    def __init__(self, rules: List[Dict], masks: np.ndarray, savings: np.ndarray):
+        self.rules = rules          # rule table with the fallback as the last entry
+        self.masks = masks          # (n_rows, n_rules) bool
+        self.savings = savings      # (n_rows, n_rules) float, zero where the rule did not fire
+
+    def __len__(self):
+        return len(self.masks)
+
+    @property
+    def total_savings(self) -> np.ndarray:
+        return self.savings.sum(axis=1)
+
+    def suggestions(self, row: int) -> List[OptimizationSuggestion]:
+        return [
+            OptimizationSuggestion(
+                category=self.rules[j]["category"],
+                suggestion=self.rules[j]["suggestion"],
+                potential_saving_kg=float(self.savings[row, j]),
+            )
+            for j in np.flatnonzero(self.masks[row])
+        ]
+
+    def summary(self) -> List[Dict]:
+        """Per-rule counts and savings across the batch"""
+        return [
+            {
+                "category": rule["category"],
+                "suggestion": rule["suggestion"],
+                "rows": int(self.masks[:, j].sum()),
+                "potential_saving_kg": float(self.savings[:, j].sum()),
+            }
+            for j, rule in enumerate(self.rules)
+        ]
+
+class OptimizationRuleEngine:
+    """Evaluates every rule threshold as a NumPy mask over the whole feature matrix"""
+
+    def __init__(self, rules: Optional[List[Dict]] = None, fallback: Optional[Dict] = None):
+        self.rules = [dict(rule) for rule in (rules if rules is not None else DEFAULT_RULES)]
+        self.fallback = dict(fallback if fallback is not None else DEFAULT_FALLBACK)
+        for j, rule in enumerate(self.rules):
+            rule.setdefault("operator", ">")
+            _validate_rule(rule, f"Rule {j} ({rule.get('category', '?')})")
+        _validate_fallback(self.fallback)
+        self.features = sorted({rule["feature"] for rule in self.rules})
+        self.fractions = np.array([rule["saving_fraction"] for rule in self.rules] + [self.fallback["saving_fraction"]])
+
+    @classmethod
+    def from_file(cls, path: str) -> "OptimizationRuleEngine":
+        with open(path) as f:
+            config = json.load(f)
+        return cls(rules=config.get("rules"), fallback=config.get("fallback"))
+
+    @classmethod
+    def from_env(cls) -> "OptimizationRuleEngine":
+        path = os.getenv("OPTIMIZATION_RULES_PATH")
+        return cls.from_file(path) if path else cls()
+
+    def evaluate(self, data: pd.DataFrame, emissions) -> RuleEvaluation:
+        """data holds one row per facility; missing rule features count as 0"""
+        emissions = np.asarray(emissions, dtype=np.float64)
+        n_rows = len(emissions)
+        masks = np.zeros((n_rows, len(self.rules) + 1), dtype=bool)
+        for j, rule in enumerate(self.rules):
+            if rule["feature"] in data:
+                values = np.asarray(data[rule["feature"]], dtype=np.float64)
+            else:
+                values = np.zeros(n_rows)
+            masks[:, j] = OPERATORS[rule["operator"]](values, rule["threshold"])
+        masks[:, -1] = ~masks[:, :-1].any(axis=1)
+
+        savings = masks * (emissions[:, None] * self.fractions[None, :])
+        return RuleEvaluation(self.rules + [self.fallback], masks, savings)
+
+    def evaluate_record(self, record: Dict[str, float], emission: float) -> List[OptimizationSuggestion]:
+        frame = {feature: [record.get(feature, 0)] for feature in self.features}
+        return self.evaluate(frame, [emission]).suggestions(0)
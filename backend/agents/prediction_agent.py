@@ -1,85 +1,559 @@
 import joblib
+import logging
+import threading
+from contextlib import contextmanager
 import pandas as pd
 import os
 import numpy as np
+from typing import List, Optional
+from services.forest_engine import ForestEngine
+from services.llm_service import LLMGateway, LLM_MODEL_NAME
+from services.llm_cache import LLMCache
+from services.llm_batcher import LLMBatcher
+from services.metrics_service import metrics
+from services.prediction_cache import PredictionCache
+from services.attribution import Attribution
+
+logger = logging.getLogger(__name__)
+
+# Batches up to this many rows use the NumPy engine; beyond it sklearn's compiled predict is faster
+ENGINE_MAX_BATCH_ROWS = int(os.getenv("ENGINE_MAX_BATCH_ROWS", "512"))
+# Significant figures rows must share before a batched LLM explanation is reused between them
+EXPLAIN_BUCKET_DIGITS = int(os.getenv("LLM_EXPLAIN_BUCKET_DIGITS", "4"))
+
+class LoadedModel:
+    """One model version (sklearn estimator and/or forest engine); swapped into the agent as a unit"""
+
+    def __init__(self, model=None, engine: ForestEngine = None, model_path: str = None, version: str = None):
+        self.model = model
+        self.engine = engine
+        self.model_path = model_path
+        self.version = version
+        self._forest = None
+        self._model_lock = threading.Lock()
+        self._model_failed = False
+
+    @property
+    def is_ready(self) -> bool:
+        return self.model is not None or self.engine is not None
+
+    @property
+    def feature_names(self):
+        if self.engine is not None and self.engine.feature_names is not None:
+            return list(self.engine.feature_names)
+        if self.model is not None and hasattr(self.model, "feature_names_in_"):
+            return list(self.model.feature_names_in_)
+        return None
+
+    @property
+    def forest(self):
+        """Flattened forest for attribution; built on first use when serving through sklearn"""
+        if self.engine is not None:
+            return self.engine
+        if self._forest is None and hasattr(self.model, "estimators_"):
+            self._forest = ForestEngine.from_model(self.model)
+        return self._forest
+
+    def predict_vector(self, vector) -> float:
+        """One row given in feature_names order"""
+        if self.engine is not None:
+            return self.engine.predict_one(vector)
+        return float(self.model.predict(pd.DataFrame([vector], columns=self.feature_names))[0])
+
+    def feature_matrix(self, data: pd.DataFrame) -> np.ndarray:
+        if self.engine.feature_names is not None:
+            data = data[self.engine.feature_names]
+        return data.to_numpy(dtype=np.float32)
+
+    def batch_model(self):
+        """
+        The sklearn estimator for large batches. Started from the memory-mapped artifact, the pickle
+        is only loaded by the first large batch; None when it is missing or fails to load.
+        """
+        if self.model is not None or self._model_failed or not self.model_path:
+            return self.model
+        with self._model_lock:
+            if self.model is None and not self._model_failed:
+                try:
+                    self.model = joblib.load(self.model_path)
+                    logger.info("Model loaded for batch scoring from %s", self.model_path)
+                except Exception as e:
+                    logger.warning("Batch model unavailable, scoring with the forest engine: %s", e)
+                    self._model_failed = True
+        return self.model
+
+    def predict_frame(self, data: pd.DataFrame) -> np.ndarray:
+        if self.engine is not None and len(data) <= ENGINE_MAX_BATCH_ROWS:
+            return self.engine.predict(self.feature_matrix(data))
+        model = self.batch_model()
+        if model is not None:
+            if self.engine is not None and self.engine.feature_names is not None:
+                data = data[self.engine.feature_names]
+            return model.predict(data)
+        return self.engine.predict(self.feature_matrix(data))
 
 class EmissionPredictionAgent:
-    def __init__(self, model_path: str = None):
+    def __init__(self, model_path: str = None, use_engine: bool = None, gateway: LLMGateway = None, cache: LLMCache = None,
+                 model_version: str = None, prediction_cache: PredictionCache = None):
         if model_path is None:
             # Construct absolute path relative to this file
             base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            self.model_path = os.path.join(base_dir, "ml", "models", "carbon_emission_model.pkl")
-        else:
-            self.model_path = model_path
+            model_path = os.path.join(base_dir, "ml", "models", "carbon_emission_model.pkl")
+        
+        if use_engine is None:
+            use_engine = os.getenv("USE_FOREST_ENGINE", "1") != "0"
+        self.use_engine = use_engine
             
-        self.model = None
-        self._load_model()
+        # Everything prediction reads lives on one object, so a hot swap is a single assignment
+        self._loaded = self._load(model_path, model_version)
+        # Repeat feature vectors (recurring upload templates) skip the forest; PREDICTION_CACHE_SIZE=0 disables
+        if prediction_cache is None and int(os.getenv("PREDICTION_CACHE_SIZE", "100000")) > 0:
+            prediction_cache = PredictionCache()
+        self.prediction_cache = prediction_cache
         self._setup_llm()
+        # Explanations come from tree-path attributions; EXPLAIN_LLM_POLISH=1 has the LLM reword them
+        self.llm_polish = os.getenv("EXPLAIN_LLM_POLISH", "0") == "1"
+        self.gateway = gateway or LLMGateway()
+        self.cache = cache
+        self.batcher = LLMBatcher(self.gateway, cache=cache)
+        self.shadow = None
+        # One scoring pool per worker count; a lease keeps a pool alive across a model swap
+        self._pools = {}
+        self._pool_leases = {}
+        self._retired_pools = set()
+        self._pool_lock = threading.Lock()
+
+    @property
+    def model(self):
+        return self._loaded.model
+
+    @property
+    def engine(self) -> ForestEngine:
+        return self._loaded.engine
+
+    @property
+    def model_path(self) -> str:
+        return self._loaded.model_path
+
+    @property
+    def model_version(self) -> str:
+        return self._loaded.version
+
+    @staticmethod
+    def artifact_path_for(model_path: str) -> str:
+        # Array-based export written next to the pickle by ml/train_model.py
+        return os.path.splitext(model_path)[0] + ".forest"
 
-    def _load_model(self):
-        if os.path.exists(self.model_path):
+    @property
+    def artifact_path(self) -> str:
+        return self.artifact_path_for(self.model_path)
+
+    def _load(self, model_path: str, version: str = None) -> LoadedModel:
+        loaded = LoadedModel(model_path=model_path, version=version)
+        if self.use_engine:
+            loaded.engine = self._load_artifact(model_path)
+            if loaded.engine is not None:
+                return loaded
+        
+        if os.path.exists(model_path):
             try:
-                self.model = joblib.load(self.model_path)
-                print(f"Model loaded successfully from {self.model_path}")
+                loaded.model = joblib.load(model_path)
+                logger.info("Model loaded successfully from %s", model_path)
             except Exception as e:
-                print(f"Failed to load model: {e}")
+                logger.error("Failed to load model: %s", e)
+                return loaded
+            
+            if self.use_engine and hasattr(loaded.model, "estimators_"):
+                try:
+                    loaded.engine = ForestEngine.from_model(loaded.model)
+                    logger.info("Forest engine built with %d trees", loaded.engine.n_trees)
+                except Exception as e:
+                    logger.warning("Failed to build forest engine, using sklearn predict: %s", e)
         else:
-            print(f"Warning: Model not found at {self.model_path}")
+            logger.warning("Model not found at %s", model_path)
+        return loaded
+
+    def _load_artifact(self, model_path: str):
+        """Memory-map the exported forest arrays; near-instant compared to unpickling"""
+        artifact_path = self.artifact_path_for(model_path)
+        manifest = os.path.join(artifact_path, "manifest.json")
+        if not os.path.exists(manifest):
+            return None
+        # Ignore an export of some other pickle (model retrained without re-exporting). Compared by
+        # content hash, since mtimes don't survive copies, checkouts or coarse filesystem clocks.
+        if os.path.exists(model_path) and not ForestEngine.is_export_of(artifact_path, model_path):
+            logger.info("Forest artifact at %s was not exported from %s, ignoring it", artifact_path, model_path)
+            return None
+        try:
+            engine = ForestEngine.load(artifact_path, mmap=True)
+            logger.info("Forest artifact memory-mapped from %s", artifact_path)
+            return engine
+        except Exception as e:
+            logger.warning("Failed to load forest artifact: %s", e)
+            return None
+
+    def load_version(self, model_path: str, version: str = None) -> LoadedModel:
+        """Load a model version without serving it (e.g. a shadow candidate); ValueError if it can't be loaded"""
+        loaded = self._load(model_path, version)
+        if not loaded.is_ready:
+            raise ValueError(f"Could not load model from {model_path}")
+        return loaded
+
+    def swap_model(self, model_path: str, version: str = None) -> LoadedModel:
+        """
+        Load another model version fully, then swap it in with one reference assignment.
+        Requests already running finish on the model they started with; call from a background thread.
+        """
+        loaded = self.load_version(model_path, version)
+        self._loaded = loaded
+        # Scoring workers hold the old model; retire the pools so the next batch starts fresh workers
+        self._retire_pools()
+        logger.info("Swapped to model version %s from %s", version, model_path)
+        return loaded
+
+    @property
+    def is_ready(self) -> bool:
+        return self._loaded.is_ready
 
+    @metrics.timed("predict", agent="prediction")
     def predict(self, data: pd.DataFrame) -> float:
-        if self.model is None:
-            print("Model is None, returning 0.0")
+        loaded = self._loaded
+        if not loaded.is_ready:
+            logger.warning("Model is None, returning 0.0")
             return 0.0
         
         try:
+            names = loaded.feature_names
+            if self.prediction_cache is not None and len(data) == 1 and names is not None and set(names) <= set(data.columns):
+                return self.prediction_cache.predict_one(loaded, names, data[names].to_numpy(dtype=np.float32)[0], loaded.predict_vector)
+            if loaded.engine is not None and len(data) == 1:
+                # Single rows skip sklearn's per-call validation entirely
+                return loaded.engine.predict_one(loaded.feature_matrix(data)[0])
+            
             # Ensure columns are in the correct order if possible, or just pass data
             # The model expects specific features.
             # Let's try to predict.
-            prediction = self.model.predict(data)
+            prediction = loaded.predict_frame(data)
             return float(prediction[0])
         except Exception as e:
-            print(f"Prediction error: {e}")
+            logger.error("Prediction error: %s", e)
             # Check for feature mismatch
-            if hasattr(self.model, "feature_names_in_"):
-                print(f"Model expects: {self.model.feature_names_in_}")
-                print(f"Data has: {data.columns}")
+            if hasattr(loaded.model, "feature_names_in_"):
+                logger.error("Model expects %s, data has %s", list(loaded.model.feature_names_in_), list(data.columns))
             return 0.0
 
+    def predict_record(self, record: dict) -> float:
+        """Score one feature dict without building a DataFrame when the engine is loaded"""
+        loaded = self._loaded
+        names = loaded.feature_names
+        prediction = None
+        if names is not None and (loaded.engine is not None or self.prediction_cache is not None):
+            try:
+                with metrics.timer("predict", agent="prediction"):
+                    vector = [record[name] for name in names]
+                    if self.prediction_cache is not None:
+                        prediction = self.prediction_cache.predict_one(loaded, names, vector, loaded.predict_vector)
+                    else:
+                        prediction = loaded.engine.predict_one(vector)
+            except Exception as e:
+                logger.warning("Engine prediction error, falling back to DataFrame path: %s", e)
+        if prediction is None:
+            prediction = self.predict(pd.DataFrame([record]))
+        if self.shadow is not None:
+            self.shadow.observe_record(record, prediction)
+        return prediction
+
+    @metrics.timed("predict_batch", agent="prediction")
+    def predict_batch(self, data: pd.DataFrame, chunk_size: int = 50000) -> np.ndarray:
+        """Score every row of a cleaned frame, one model call per chunk to bound memory"""
+        loaded = self._loaded
+        predictions = np.zeros(len(data), dtype=np.float64)
+        if not loaded.is_ready:
+            logger.warning("Model is None, returning zeros")
+            return predictions
+
+        names = loaded.feature_names
+        if self.prediction_cache is not None and names is not None and set(names) <= set(data.columns):
+            # Only the unique feature vectors that miss the cache reach the model
+            predictions = self.prediction_cache.predict(
+                loaded, names, data[names].to_numpy(dtype=np.float32),
+                lambda matrix: self.predict_batch_uncached(pd.DataFrame(matrix, columns=names, copy=False), chunk_size, loaded),
+            )
+        else:
+            predictions = self.predict_batch_uncached(data, chunk_size, loaded)
+        if self.shadow is not None:
+            self.shadow.observe_frame(data, predictions)
+        return predictions
+
+    def predict_batch_uncached(self, data: pd.DataFrame, chunk_size: int = 50000, loaded: LoadedModel = None) -> np.ndarray:
+        """predict_batch without the prediction cache or shadow sampling"""
+        loaded = loaded or self._loaded
+        predictions = np.zeros(len(data), dtype=np.float64)
+        for start in range(0, len(data), chunk_size):
+            chunk = data.iloc[start:start + chunk_size]
+            predictions[start:start + len(chunk)] = loaded.predict_frame(chunk)
+        return predictions
+
+    def _pool_for(self, n_workers: int = None):
+        # Called with the pool lock held
+        from services.scoring_pool import create_scoring_pool
+        if n_workers is None:
+            n_workers = int(os.getenv("SCORING_WORKERS", str(os.cpu_count() or 1)))
+        pool = self._pools.get(n_workers)
+        if pool is None:
+            pool = self._pools[n_workers] = create_scoring_pool(self.model_path, n_workers)
+        return pool
+
+    def scoring_pool(self, n_workers: int = None):
+        """Process pool of scoring workers, each loading this agent's model once"""
+        with self._pool_lock:
+            return self._pool_for(n_workers)
+
+    @contextmanager
+    def leased_pool(self, n_workers: int = None):
+        """Scoring pool that stays usable until the caller is done, even if a model swap retires it"""
+        with self._pool_lock:
+            pool = self._pool_for(n_workers)
+            self._pool_leases[pool] = self._pool_leases.get(pool, 0) + 1
+        try:
+            yield pool
+        finally:
+            with self._pool_lock:
+                self._pool_leases[pool] -= 1
+                if not self._pool_leases[pool]:
+                    del self._pool_leases[pool]
+                    if pool in self._retired_pools:
+                        self._retired_pools.discard(pool)
+                        pool.shutdown(wait=False)
+
+    def _retire_pools(self):
+        with self._pool_lock:
+            pools, self._pools = list(self._pools.values()), {}
+            for pool in pools:
+                if pool in self._pool_leases:
+                    # The last lease shuts it down
+                    self._retired_pools.add(pool)
+                else:
+                    pool.shutdown(wait=False)
+
+    def shutdown_pool(self):
+        with self._pool_lock:
+            pools = list(self._pools.values()) + list(self._retired_pools)
+            self._pools, self._retired_pools = {}, set()
+        for pool in pools:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @metrics.timed("predict_parallel", agent="prediction")
+    def predict_parallel(self, data, n_workers: int = None, chunk_size: int = None) -> np.ndarray:
+        """
+        Split a large batch across the scoring process pool; results come back in input order.
+        The feature matrix goes to workers through shared memory instead of being pickled per chunk.
+        """
+        from multiprocessing import shared_memory
+        
+        if chunk_size is None:
+            chunk_size = int(os.getenv("SCORING_CHUNK_SIZE", "100000"))
+        if isinstance(data, pd.DataFrame):
+            feature_names = list(data.columns)
+            matrix = data.to_numpy(dtype=np.float32)
+        else:
+            loaded = self._loaded
+            feature_names = list(loaded.engine.feature_names if loaded.engine is not None else loaded.model.feature_names_in_)
+            matrix = np.asarray(data, dtype=np.float32)
+        
+        # Not worth the hand-off for a single chunk
+        if len(matrix) <= chunk_size or not self.is_ready:
+            return self.predict_batch(pd.DataFrame(matrix, columns=feature_names))
+        
+        from services.scoring_pool import _score_shared
+        block = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        try:
+            shared = np.ndarray(matrix.shape, dtype=np.float32, buffer=block.buf)
+            shared[:] = matrix
+            starts = list(range(0, len(matrix), chunk_size))
+            with self.leased_pool(n_workers) as pool:
+                results = pool.map(
+                    _score_shared,
+                    [block.name] * len(starts), [matrix.shape] * len(starts),
+                    starts, [start + chunk_size for start in starts], [feature_names] * len(starts),
+                )
+                predictions = np.concatenate(list(results))
+            del shared
+        finally:
+            block.close()
+            block.unlink()
+        if self.shadow is not None:
+            self.shadow.observe_frame(pd.DataFrame(matrix, columns=feature_names, copy=False), predictions)
+        return predictions
+
+    @staticmethod
+    def summarize(predictions: np.ndarray) -> dict:
+        """Aggregate statistics over a batch of per-row predictions"""
+        if len(predictions) == 0:
+            return {"row_count": 0, "total_emission_kg": 0.0, "mean_emission_kg": 0.0,
+                    "min_emission_kg": 0.0, "max_emission_kg": 0.0}
+        return {
+            "row_count": int(len(predictions)),
+            "total_emission_kg": float(predictions.sum()),
+            "mean_emission_kg": float(predictions.mean()),
+            "min_emission_kg": float(predictions.min()),
+            "max_emission_kg": float(predictions.max()),
+        }
+
     def _setup_llm(self):
         api_key = os.getenv("GOOGLE_API_KEY")
         if api_key:
             try:
                 import google.generativeai as genai
                 genai.configure(api_key=api_key)
-                self.llm_model = genai.GenerativeModel('gemini-2.5-flash')
-                print("LLM initialized successfully.")
+                self.llm_model = genai.GenerativeModel(LLM_MODEL_NAME)
+                logger.info("LLM initialized successfully.")
             except Exception as e:
-                print(f"Failed to initialize LLM: {e}")
+                logger.error("Failed to initialize LLM: %s", e)
                 self.llm_model = None
         else:
             self.llm_model = None
-            print("Warning: GOOGLE_API_KEY not found. LLM features will be disabled.")
+            logger.warning("GOOGLE_API_KEY not found. LLM features will be disabled.")
 
-    def explain(self, input_data: dict, prediction: float) -> str:
-        if self.llm_model:
-            try:
-                prompt = f"""
+    @property
+    def polish_model(self):
+        """LLM used to reword explanations, or None to serve the attribution text directly"""
+        return self.llm_model if self.llm_polish else None
+
+    @metrics.timed("attribute", agent="prediction")
+    def attribute(self, data: pd.DataFrame) -> Optional[Attribution]:
+        """Decision-path feature contributions for every row; None when the model is not a forest"""
+        forest = self._loaded.forest
+        if forest is None or forest.feature_names is None:
+            return None
+        try:
+            values = data[forest.feature_names].to_numpy(dtype=np.float64)
+            bias, contributions = forest.contributions(values)
+        except Exception as e:
+            logger.warning("Attribution failed: %s", e)
+            return None
+        return Attribution(forest.feature_names, values, bias, contributions)
+
+    def attribute_record(self, record: dict) -> Optional[Attribution]:
+        """attribute() for one feature dict without building a DataFrame"""
+        forest = self._loaded.forest
+        if forest is None or forest.feature_names is None:
+            return None
+        try:
+            values = np.array([[record[name] for name in forest.feature_names]], dtype=np.float64)
+            bias, contributions = forest.contributions(values)
+        except Exception as e:
+            logger.warning("Attribution failed: %s", e)
+            return None
+        return Attribution(forest.feature_names, values, bias, contributions)
+
+    def _build_prompt(self, input_data: dict, prediction: float, attribution: Attribution = None) -> str:
+        drivers = ""
+        if attribution is not None:
+            drivers = f"""
+                Model attribution (kg CO2e relative to an average facility at {attribution.bias:.2f} kg): {attribution.summary(0)}
+                Base the explanation on these drivers and do not change the numbers.
+                """
+        return f"""
                 Act as a Carbon Emission Expert.
                 Analyze the following operational data and the predicted carbon emission value.
                 
                 Data: {input_data}
                 Predicted Emission: {prediction:.2f} kg CO2e
-                
+                {drivers}
                 Provide a concise, professional explanation (max 2-3 sentences) of the primary factors contributing to this emission level. 
                 Focus on the most significant contributors based on the data provided.
                 """
-                response = self.llm_model.generate_content(prompt)
-                return response.text.strip()
+
+    def _cache_key(self, input_data: dict, prediction: float):
+        if self.cache is None or not self.polish_model:
+            return None
+        # Explanations quote the active model's attributions, so a model swap must not serve old text
+        return self.cache.make_key("explain", input_data, prediction, LLM_MODEL_NAME, self.model_version)
+
+    @metrics.timed("explain", agent="prediction")
+    def explain(self, input_data: dict, prediction: float, attribution: Attribution = None) -> str:
+        if attribution is None:
+            attribution = self.attribute_record(input_data)
+        if self.polish_model:
+            cache_key = self._cache_key(input_data, prediction)
+            if cache_key is not None:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            try:
+                response = self.polish_model.generate_content(self._build_prompt(input_data, prediction, attribution))
+                text = response.text.strip()
+                if cache_key is not None:
+                    self.cache.set(cache_key, text)
+                return text
             except Exception as e:
-                print(f"LLM generation failed: {e}")
-                # Fallback to simulation if LLM fails
+                logger.warning("LLM generation failed: %s", e)
+                # Fallback to the attribution text if LLM fails
+            metrics.inc("fallbacks_total", kind="explain")
         
-        # Simulate LLM explanation (Fallback)
+        return self._heuristic_explanation(input_data, prediction, attribution)
+
+    @metrics.timed("explain", agent="prediction")
+    async def explain_async(self, input_data: dict, prediction: float, attribution: Attribution = None) -> str:
+        """Same as explain() but never blocks the event loop; times out to the attribution text"""
+        if attribution is None:
+            attribution = self.attribute_record(input_data)
+        if not self.polish_model:
+            return self._heuristic_explanation(input_data, prediction, attribution)
+
+        cache_key = self._cache_key(input_data, prediction)
+        if cache_key is not None:
+            cached = await self.cache.get_async(cache_key)
+            if cached is not None:
+                return cached
+        
+        text = await self.gateway.generate(self.polish_model, self._build_prompt(input_data, prediction, attribution))
+        if text:
+            if cache_key is not None:
+                await self.cache.set_async(cache_key, text)
+            return text
+        metrics.inc("fallbacks_total", kind="explain")
+        return self._heuristic_explanation(input_data, prediction, attribution)
+
+    def explain_many(self, records: List[dict], predictions, attribution: Attribution = None) -> List[str]:
+        """Explanations for many rows at once (batch reports); one vectorized attribution, no LLM round trips"""
+        if attribution is None and records:
+            attribution = self.attribute(pd.DataFrame(records))
+        return [
+            self._heuristic_explanation(record, float(prediction), attribution, row)
+            for row, (record, prediction) in enumerate(zip(records, predictions))
+        ]
+
+    BATCH_INSTRUCTIONS = """Act as a Carbon Emission Expert.
+For every row below, explain in 1-2 sentences the primary factors behind its predicted carbon emission (kg CO2e).
+Return strictly a raw JSON array (no markdown) with one object per row: {"row_id": <row_id>, "explanation": "<text>"}."""
+
+    @metrics.timed("explain_batch", agent="prediction")
+    async def explain_batch(self, records: List[dict], predictions, attribution: Attribution = None) -> List[str]:
+        """LLM explanations for many rows in a few packed prompts; rows without an answer get the attribution text"""
+        def parse_item(item, record, prediction):
+            text = item["explanation"]
+            if not isinstance(text, str) or not text.strip():
+                raise ValueError("explanation is not a non-empty string")
+            return text.strip()
+
+        # Free text quotes the row's numbers, so only share it between rows that agree to EXPLAIN_BUCKET_DIGITS
+        results = await self.batcher.run(self.polish_model, "explain", records, predictions,
+                                         self.BATCH_INSTRUCTIONS, parse_item, emission_model=self.model_version,
+                                         bucket_digits=EXPLAIN_BUCKET_DIGITS)
+        if attribution is None and None in results:
+            attribution = self.attribute(pd.DataFrame(records))
+        return [
+            result if result is not None else self._heuristic_explanation(record, float(prediction), attribution, row)
+            for row, (result, record, prediction) in enumerate(zip(results, records, predictions))
+        ]
+
+    def _heuristic_explanation(self, input_data: dict, prediction: float, attribution: Attribution = None,
+                               row: int = 0) -> str:
+        if attribution is not None:
+            return attribution.describe(row, prediction)
+        # Threshold fallback for models without tree paths
         reasons = []
         if input_data.get('energy_usage_kwh', 0) > 1000:
             reasons.append("high energy usage")
@@ -0,0 +1,174 @@
+import itertools
+import json
+import os
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from agents.optimization_rules import _check_fraction, _check_text, _is_number
+from models.schemas import LeverOption, LeverSavings, Scenario, WhatIfResponse
+from services.attribution import FEATURE_LABELS
+
+# Levers the what-if grid varies. Each step cuts `feature` by `reduction` (a fraction) at `cost`
+# (relative cost units, comparable across levers); "no change" is always an implicit option.
+DEFAULT_LEVERS = [
+    {
+        "name": "energy_efficiency", "category": "Energy",
+        "suggestion": "Switch to LED lighting and optimize HVAC schedules.",
+        "feature": "energy_usage_kwh", "steps": [0.1, 0.2, 0.3], "cost": [1.0, 3.0, 6.0],
+    },
+    {
+        "name": "fleet_electrification", "category": "Fuel",
+        "suggestion": "Upgrade fleet to electric vehicles or hybrid models.",
+        "feature": "fuel_consumption_liters", "steps": [0.15, 0.3, 0.5], "cost": [2.0, 5.0, 10.0],
+    },
+    {
+        "name": "route_optimization", "category": "Logistics",
+        "suggestion": "Optimize delivery routes using route planning software.",
+        "feature": "distance_traveled_km", "steps": [0.05, 0.1, 0.2], "cost": [0.5, 1.0, 3.0],
+    },
+    {
+        "name": "waste_reduction", "category": "Waste",
+        "suggestion": "Reduce, sort and recycle operational waste.",
+        "feature": "waste_generated_kg", "steps": [0.1, 0.25, 0.5], "cost": [0.5, 2.0, 4.0],
+    },
+]
+
+def _validate_lever(lever: Dict, name: str, features):
+    """Reject a malformed lever when the table is loaded, like the optimization rules"""
+    for key in ("name", "category", "suggestion", "feature"):
+        _check_text(lever, name, key)
+    if lever["feature"] not in features:
+        raise ValueError(f"{name} varies unknown feature {lever['feature']!r}; expected one of {sorted(features)}")
+    steps, costs = lever.get("steps"), lever.get("cost")
+    if not isinstance(steps, list) or not steps:
+        raise ValueError(f"{name} needs a non-empty list of 'steps'")
+    for step in steps:
+        _check_fraction({"steps": step}, name, "steps")
+    if not isinstance(costs, list) or len(costs) != len(steps):
+        raise ValueError(f"{name} needs one cost per step")
+    if not all(_is_number(cost) and cost >= 0 for cost in costs):
+        raise ValueError(f"{name} needs non-negative numeric costs, got {costs!r}")
+
+class ScenarioEngine:
+    """
+    Model-driven what-if analysis. The full factorial grid of lever settings is built once;
+    per facility it becomes one perturbed feature matrix scored in a single batched call.
+    """
+
+    def __init__(self, levers: Optional[List[Dict]] = None, features=None):
+        self.levers = [dict(lever) for lever in (levers if levers is not None else DEFAULT_LEVERS)]
+        features = set(features if features is not None else FEATURE_LABELS)
+        for k, lever in enumerate(self.levers):
+            _validate_lever(lever, f"Lever {k} ({lever.get('name', '?')})", features)
+        names = [lever["name"] for lever in self.levers]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Lever names must be unique, got {names}")
+
+        # Option 0 of every lever is "no change", so row 0 of the grid is the baseline
+        self.options = [np.array([0.0] + list(lever["steps"])) for lever in self.levers]
+        option_costs = [np.array([0.0] + list(lever["cost"])) for lever in self.levers]
+        self.levels = np.array(list(itertools.product(*[range(len(o)) for o in self.options])), dtype=np.intp)
+        self.reductions = np.column_stack([o[self.levels[:, k]] for k, o in enumerate(self.options)])
+        self.costs = sum(c[self.levels[:, k]] for k, c in enumerate(option_costs))
+        # Grid rows where exactly one lever moves: single[k][s - 1] is lever k at step s
+        moved = self.levels > 0
+        self.single = [
+            [int(np.flatnonzero((moved.sum(axis=1) == 1) & (self.levels[:, k] == s))[0]) for s in range(1, len(o))]
+            for k, o in enumerate(self.options)
+        ]
+
+    @classmethod
+    def from_file(cls, path: str) -> "ScenarioEngine":
+        with open(path) as f:
+            return cls(levers=json.load(f).get("levers"))
+
+    @classmethod
+    def from_env(cls) -> "ScenarioEngine":
+        path = os.getenv("SCENARIO_LEVERS_PATH")
+        return cls.from_file(path) if path else cls()
+
+    def __len__(self):
+        return len(self.levels)
+
+    def build_grid(self, record: Dict[str, float]) -> pd.DataFrame:
+        """One row per scenario: the record with every lever's reduction applied"""
+        columns = list(record)
+        matrix = np.tile(np.array([record[c] for c in columns], dtype=np.float64), (len(self), 1))
+        for k, lever in enumerate(self.levers):
+            if lever["feature"] in record:
+                matrix[:, columns.index(lever["feature"])] *= 1.0 - self.reductions[:, k]
+        return pd.DataFrame(matrix, columns=columns)
+
+    def evaluate(self, record: Dict[str, float], score: Callable[[pd.DataFrame], np.ndarray],
+                 budget: Optional[float] = None, top_k: int = 5) -> WhatIfResponse:
+        """Marginal savings per lever and the best lever combinations costing at most `budget`"""
+        emissions = np.asarray(score(self.build_grid(record)), dtype=np.float64)
+        baseline = float(emissions[0])
+        savings = baseline - emissions
+
+        marginal = np.zeros_like(self.reductions)
+        levers = []
+        for k, lever in enumerate(self.levers):
+            rows = self.single[k]
+            marginal[:, k] = np.concatenate([[0.0], savings[rows]])[self.levels[:, k]]
+            levers.append(LeverSavings(
+                lever=lever["name"], category=lever["category"], suggestion=lever["suggestion"],
+                feature=lever["feature"],
+                options=[
+                    LeverOption(reduction=float(step), cost=float(cost), saving_kg=float(savings[row]))
+                    for step, cost, row in zip(lever["steps"], lever["cost"], rows)
+                ],
+            ))
+
+        feasible = np.flatnonzero((self.costs <= budget) if budget is not None else np.ones(len(self), dtype=bool))
+        # Largest saving first; equal savings (to the gram) go to the cheaper combination
+        ranked = feasible[np.lexsort((self.costs[feasible], -np.round(savings[feasible], 3)))]
+        ranked = ranked[savings[ranked] > 0][:top_k]
+        best = [
+            Scenario(
+                changes={lever["name"]: float(self.reductions[i, k])
+                         for k, lever in enumerate(self.levers) if self.levels[i, k]},
+                cost=float(self.costs[i]),
+                emission_kg=float(emissions[i]),
+                saving_kg=float(savings[i]),
+                # How far the combination departs from the sum of its levers' individual savings
+                interaction_kg=float(savings[i] - marginal[i].sum()),
+            )
+            for i in ranked
+        ]
+        return WhatIfResponse(baseline_emission_kg=baseline, scenario_count=len(self), budget=budget,
+                              levers=levers, best=best)
+
+    def rule_savings(self, data: pd.DataFrame, masks: np.ndarray, rules: List[Dict],
+                     score: Callable[[pd.DataFrame], np.ndarray], savings: np.ndarray) -> np.ndarray:
+        """
+        Replace the fixed-fraction savings of rules that declare a feature `reduction` with the
+        model's predicted saving for that change. Every fired (row, rule) pair and the baselines
+        are scored in one call; other rules keep their fractions.
+        """
+        savings = savings.copy()
+        parts, fired = [], []
+        for j, rule in enumerate(rules):
+            if not rule.get("reduction") or rule.get("feature") not in data:
+                continue
+            rows = np.flatnonzero(masks[:, j])
+            if len(rows):
+                part = data.iloc[rows].copy()
+                part[rule["feature"]] = part[rule["feature"]] * (1.0 - rule["reduction"])
+                parts.append(part)
+                fired.append((j, rows))
+        if not parts:
+            return savings
+
+        base_rows = np.unique(np.concatenate([rows for _, rows in fired]))
+        scored = np.asarray(score(pd.concat([data.iloc[base_rows]] + parts, ignore_index=True)), dtype=np.float64)
+        baseline = np.zeros(len(data))
+        baseline[base_rows] = scored[:len(base_rows)]
+        offset = len(base_rows)
+        for j, rows in fired:
+            # Forest noise can make a small cut look like an increase; report that as no saving
+            savings[rows, j] = np.maximum(baseline[rows] - scored[offset:offset + len(rows)], 0.0)
+            offset += len(rows)
+        return savings
@@ -5,23 +5,35 @@ from dotenv import load_dotenv
 import os
 
 load_dotenv()
-from typing import Optional
-from fastapi import FastAPI, UploadFile, File, HTTPException, Header, BackgroundTasks, Request
+from typing import List, Optional
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header, BackgroundTasks, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import pandas as pd
+import numpy as np
 import io
+import asyncio
+import json
+import shutil
+import tempfile
 
 from agents.data_agent import DataCleaningAgent
 from agents.prediction_agent import EmissionPredictionAgent
 from agents.optimization_agent import OptimizationAgent
 from agents.loop_agent import LoopAgent
-from services.memory_service import InMemorySessionService, MemoryBank
+from services.memory_service import create_session_service, MemoryBank
 from services.report_service import ReportService
-from models.schemas import EmissionOutput, OptimizationResponse, OptimizationSuggestion
+from services.llm_service import LLMGateway
+from services.llm_cache import LLMCache
+from services.job_service import JobManager, JobLimitError
+from services.metrics_service import metrics, start_trace, end_trace, TRACE_ALL_REQUESTS
+from services.logging_service import setup_logging, shutdown_logging, log_payload
+from services.model_registry import ModelRegistry
+from services.shadow_service import ShadowScorer
+from models.schemas import EmissionOutput, BatchEmissionOutput, OptimizationResponse, OptimizationSuggestion, AnalysisResponse, WhatIfResponse
 
-# Setup Logging
-logging.basicConfig(level=logging.INFO)
+# Setup Logging (LOG_LEVEL, LOG_FORMAT=json|text, LOG_PAYLOADS=1 to dump sampled input rows)
+setup_logging()
 logger = logging.getLogger("CarbonAssistant")
 
 app = FastAPI(title="Carbon Emission Intelligence Assistant")
@@ -36,29 +48,118 @@ app.add_middleware(
 )
 
 # Services & Agents
-session_service = InMemorySessionService()
-memory_bank = MemoryBank()
+session_service = create_session_service()
+# Durable emission history; MEMORY_BANK_DB=:memory: keeps it per-process. The default sits next to
+# this file, not in whatever directory the process (or a test importing main) happens to run from.
+memory_bank = MemoryBank(os.getenv("MEMORY_BANK_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory_bank.db")))
 data_agent = DataCleaningAgent()
-prediction_agent = EmissionPredictionAgent()
-optimization_agent = OptimizationAgent()
+# One gateway per worker so the LLM concurrency cap covers both agents
+llm_gateway = LLMGateway()
+# Identical inputs produce identical prompts; LLM_CACHE_DB adds a shared on-disk tier
+llm_cache = LLMCache(db_path=os.getenv("LLM_CACHE_DB"))
+# Versioned models; the ACTIVE pointer picks the serving version (else ml/models/carbon_emission_model.pkl)
+model_registry = ModelRegistry()
+prediction_agent = EmissionPredictionAgent(model_path=model_registry.active_model_path(),
+                                           model_version=model_registry.active_version(),
+                                           gateway=llm_gateway, cache=llm_cache)
+# Every worker polls ACTIVE (MODEL_REGISTRY_POLL_SECONDS, default 5) and follows activations made through any of them
+def follow_active_version(version: str):
+    if version != prediction_agent.model_version:
+        prediction_agent.swap_model(model_registry.model_path(version), version)
+
+model_registry.watch(follow_active_version)
+# Savings and what-if scenarios are scored by the serving model (follows hot swaps). Synthetic rows skip
+# the prediction cache and shadow sampling so they don't skew hit ratios or drift stats.
+optimization_agent = OptimizationAgent(gateway=llm_gateway, cache=llm_cache,
+                                       predictor=prediction_agent.predict_batch_uncached,
+                                       model_ready=lambda: prediction_agent.is_ready)
 loop_agent = LoopAgent()
 report_service = ReportService()
+# Large batch scoring runs as background jobs on a local process pool
+job_manager = JobManager(data_agent, prediction_agent)
+PARALLEL_SCORING_MIN_ROWS = int(os.getenv("PARALLEL_SCORING_MIN_ROWS", "500000"))
 
 # Middleware for Observability
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
-    request_id = str(uuid.uuid4())
-    logger.info(f"Request {request_id} started: {request.method} {request.url}")
-    start_time = time.time()
+    # A W3C traceparent header (or TRACE_REQUESTS=1) turns on per-stage spans for this request
+    traceparent = request.headers.get("traceparent")
+    trace_token = None
+    if traceparent or TRACE_ALL_REQUESTS:
+        trace, trace_token = start_trace(traceparent)
+        request_id = trace.trace_id
+    else:
+        request_id = str(uuid.uuid4())
+    logger.debug("Request %s started: %s %s", request_id, request.method, request.url)
+    start_time = time.perf_counter()
     
-    response = await call_next(request)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        process_time = time.perf_counter() - start_time
+        # Label by route template so path parameters don't create a series per id
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.observe("http_request_duration_seconds", process_time, method=request.method, route=path)
+        metrics.inc("http_requests_total", method=request.method, route=path, status=str(status_code))
+        if status_code >= 500:
+            metrics.inc("errors_total", stage="http", route=path)
+        if trace_token is not None:
+            end_trace(trace_token)
     
-    process_time = time.time() - start_time
     response.headers["X-Process-Time"] = str(process_time)
     response.headers["X-Request-ID"] = request_id
-    logger.info(f"Request {request_id} completed in {process_time:.4f}s")
+    if trace_token is not None:
+        timings = trace.server_timing()
+        response.headers["Server-Timing"] = f"{timings}, total;dur={process_time * 1000:.2f}" if timings else f"total;dur={process_time * 1000:.2f}"
+        response.headers["traceparent"] = f"00-{trace.trace_id}-{uuid.uuid4().hex[:16]}-01"
+    logger.info("Request %s %s %s completed in %.4fs", request_id, request.method, request.url.path, process_time)
     return response
 
+def collect_service_gauges():
+    """Cache, session-store and job gauges read from the services at scrape time"""
+    llm_stats = llm_cache.get_stats()
+    report_stats = report_service.get_stats()
+    report_lookups = report_stats["hits"] + report_stats["misses"]
+    session_stats = session_service.get_stats()
+    hit_ratio = {
+        (("cache", "llm"),): llm_stats["hit_ratio"],
+        (("cache", "report"),): report_stats["hits"] / report_lookups if report_lookups else 0.0,
+    }
+    entries = {
+        (("cache", "llm"),): llm_stats["entries"],
+        (("cache", "report"),): report_stats["entries"],
+    }
+    if prediction_agent.prediction_cache is not None:
+        prediction_stats = prediction_agent.prediction_cache.get_stats()
+        hit_ratio[(("cache", "prediction"),)] = prediction_stats["hit_ratio"]
+        entries[(("cache", "prediction"),)] = prediction_stats["entries"]
+    return {
+        "cache_hit_ratio": hit_ratio,
+        "cache_entries": entries,
+        "session_store_sessions": {(("backend", session_stats["backend"]),): session_stats["sessions"]},
+        "session_store_bytes": {(("backend", session_stats["backend"]),): session_stats["bytes"]},
+        "jobs_active": {(): job_manager.active_jobs()},
+        **shadow_gauges(),
+    }
+
+def shadow_gauges():
+    shadow = prediction_agent.shadow
+    if shadow is None:
+        return {}
+    stats = shadow.get_stats()
+    key = (("candidate", stats["candidate_version"]),)
+    drift = stats["drift"]
+    return {
+        "shadow_rows": {key: drift["rows"]},
+        "shadow_mean_abs_diff_kg": {key: drift["mean_abs_diff_kg"] or 0.0},
+        "shadow_dropped": {key: stats["dropped"]},
+    }
+
+metrics.register_collector(collect_service_gauges)
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...), x_session_id: Optional[str] = Header(None)):
     if not x_session_id:
@@ -70,63 +171,104 @@ async def upload_file(file: UploadFile = File(...), x_session_id: Optional[str]
         session = session_service.get_session(x_session_id)
 
     try:
-        content = await file.read()
-        df = pd.read_csv(io.BytesIO(content))
-        logger.info(f"Uploaded CSV shape: {df.shape}")
-        logger.info(f"Uploaded CSV columns: {df.columns.tolist()}")
-        logger.info(f"First row: {df.iloc[0].to_dict()}")
-        
-        # Agent: Data Cleaning
-        cleaned_df = data_agent.clean(df)
-        logger.info(f"Cleaned data shape: {cleaned_df.shape}")
+        # Agent: Data Cleaning (CSV, Parquet or Arrow IPC; only the mapped columns are parsed)
+        cleaned_df = data_agent.read_upload(file.file, file.filename)
+        logger.info("Cleaned upload: %d rows x %d columns", cleaned_df.shape[0], cleaned_df.shape[1])
         
         # Convert to dict for storage (simplified)
-        data_dict = cleaned_df.iloc[0].to_dict() # Assuming single row for this demo or we process first row
-        logger.info(f"Stored data: {data_dict}")
+        data_dict = data_agent.row_to_dict(cleaned_df, 0) # Assuming single row for this demo or we process first row
+        log_payload(logger, "Stored data", data_dict, session_id=x_session_id)
         
         session_service.update_session(x_session_id, "data", data_dict)
+        # Keep every cleaned row so /predict-batch can score the whole file at once
+        session_service.update_session(x_session_id, "data_frame", cleaned_df)
+        # Scores from an earlier upload describe other rows
+        session_service.update_session(x_session_id, "batch_prediction", None)
         session_service.update_session(x_session_id, "data_uploaded", True)
         
         return {
             "message": "File uploaded and processed successfully", 
             "session_id": x_session_id,
+            "row_count": len(cleaned_df),
+            "preview": data_dict
+        }
+    except Exception as e:
+        logger.error("Upload failed: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/upload-stream")
+async def upload_file_stream(file: UploadFile = File(...), x_session_id: Optional[str] = Header(None), chunk_size: int = 100000):
+    if not x_session_id or not session_service.get_session(x_session_id):
+        x_session_id = session_service.create_session()
+
+    try:
+        # Stream the spooled upload through cleaning and prediction chunk by chunk,
+        # so only one chunk of rows is ever held in memory.
+        def score_stream():
+            data_dict = None
+            emissions = []
+            for cleaned_chunk in data_agent.iter_clean_chunks(file.file, chunk_size=chunk_size):
+                if data_dict is None and len(cleaned_chunk) > 0:
+                    data_dict = data_agent.row_to_dict(cleaned_chunk, 0)
+                emissions.append(prediction_agent.predict_batch(cleaned_chunk))
+            return data_dict, emissions
+
+        # Parsing and scoring are CPU-bound; keep them off the event loop
+        data_dict, emissions = await asyncio.to_thread(score_stream)
+        if data_dict is None:
+            raise ValueError("Uploaded CSV contains no rows")
+
+        emissions = np.concatenate(emissions)
+        output = BatchEmissionOutput(**prediction_agent.summarize(emissions), emissions=emissions.tolist())
+        logger.info("Streamed upload scored %d rows", output.row_count)
+
+        session_service.update_session(x_session_id, "data", data_dict)
+        # The streamed rows replace any earlier upload; drop its frame so batch endpoints don't reuse it
+        session_service.update_session(x_session_id, "data_frame", None)
+        session_service.update_session(x_session_id, "batch_prediction", output)
+        session_service.update_session(x_session_id, "data_uploaded", True)
+
+        return {
+            "message": "File streamed and processed successfully",
+            "session_id": x_session_id,
+            "row_count": output.row_count,
+            "total_emission_kg": output.total_emission_kg,
             "preview": data_dict
         }
     except Exception as e:
-        logger.error(f"Upload failed: {e}")
+        logger.error("Streaming upload failed: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
+def emission_output(emission_value: float, explanation: str, attribution) -> EmissionOutput:
+    if attribution is None:
+        return EmissionOutput(emission_kg=emission_value, explanation=explanation)
+    return EmissionOutput(emission_kg=emission_value, explanation=explanation,
+                          baseline_kg=attribution.bias, drivers=attribution.drivers(0))
+
 @app.post("/predict", response_model=EmissionOutput)
-async def predict(x_session_id: str = Header(...)):
+async def predict(x_session_id: str = Header(...), x_company: Optional[str] = Header(None)):
     session = session_service.get_session(x_session_id)
     if not session or not session.get("data"):
         raise HTTPException(status_code=400, detail="No data found in session")
     
     data = session["data"]
     
-    # Agent: Prediction
-    # We need to convert data dict back to DataFrame for the agent
-    df = pd.DataFrame([data])
-    
     # Ensure columns match what the model expects (basic check)
     # The model was trained on: energy_usage_kwh, fuel_consumption_liters, distance_traveled_km, waste_generated_kg, company_size
     # We assume the CSV has these.
     
     try:
-        logger.info(f"Prediction data from session: {data}")
-        
-        # Agent: Prediction
-        # We need to convert data dict back to DataFrame for the agent
-        df = pd.DataFrame([data])
-        logger.info(f"DataFrame for prediction:\n{df}")
-        logger.info(f"DataFrame dtypes:\n{df.dtypes}")
+        log_payload(logger, "Prediction data from session", data, session_id=x_session_id)
         
-        emission_value = prediction_agent.predict(df)
-        logger.info(f"Predicted emission: {emission_value}")
+        # Agent: Prediction (scores the feature dict directly, no DataFrame)
+        emission_value = prediction_agent.predict_record(data)
+        logger.debug("Predicted emission: %s", emission_value)
         
-        explanation = prediction_agent.explain(data, emission_value)
+        # Tree-path drivers (sub-millisecond); the LLM only rewords them when EXPLAIN_LLM_POLISH=1
+        attribution = prediction_agent.attribute_record(data)
+        explanation = await prediction_agent.explain_async(data, emission_value, attribution)
         
-        output = EmissionOutput(emission_kg=emission_value, explanation=explanation)
+        output = emission_output(emission_value, explanation, attribution)
         
         session_service.update_session(x_session_id, "prediction", output)
         session_service.update_session(x_session_id, "prediction_made", True)
@@ -134,15 +276,69 @@ async def predict(x_session_id: str = Header(...)):
         # Save to long-term memory
         memory_bank.save_emission_record({
             "session_id": x_session_id,
+            "company": x_company,
             "input": data,
             "emission": emission_value
         })
         
         return output
     except Exception as e:
-        logger.error(f"Prediction failed: {e}")
+        logger.error("Prediction failed: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict-batch", response_model=BatchEmissionOutput)
+async def predict_batch(x_session_id: str = Header(...), x_company: Optional[str] = Header(None), format: str = "json"):
+    session = session_service.get_session(x_session_id)
+    if session and session.get("data_frame") is None and session.get("batch_prediction"):
+        # Streamed uploads are scored during ingestion and keep no frame around
+        if format == "parquet":
+            raise HTTPException(status_code=400, detail="Parquet results need the uploaded rows; use /upload")
+        return session["batch_prediction"]
+    if not session or session.get("data_frame") is None:
+        raise HTTPException(status_code=400, detail="No data found in session")
+
+    df = session["data_frame"]
+
+    try:
+        # Agent: Prediction (vectorized over every uploaded row; huge files fan out across cores).
+        # Scoring is CPU-bound, so it runs in a worker thread and the loop keeps serving requests.
+        score = prediction_agent.predict_parallel if len(df) >= PARALLEL_SCORING_MIN_ROWS else prediction_agent.predict_batch
+        emissions = await asyncio.to_thread(score, df)
+        output = BatchEmissionOutput(**prediction_agent.summarize(emissions), emissions=emissions.tolist())
+        logger.info("Batch prediction over %d rows, total %.2f kg", output.row_count, output.total_emission_kg)
+
+        session_service.update_session(x_session_id, "batch_prediction", output)
+
+        # One batched insert for every scored row, serialized and written off the event loop
+        def save_history():
+            inputs = df.to_json(orient="records", lines=True).splitlines()
+            memory_bank.save_emission_batch(inputs, emissions, session_id=x_session_id, company=x_company)
+
+        await asyncio.to_thread(save_history)
+
+        if format == "parquet":
+            return Response(content=await asyncio.to_thread(batch_results_parquet, df, emissions),
+                            media_type="application/vnd.apache.parquet",
+                            headers={"Content-Disposition": "attachment; filename=predictions.parquet"})
+        return output
+    except Exception as e:
+        logger.error("Batch prediction failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def batch_results_parquet(df: pd.DataFrame, emissions: np.ndarray) -> bytes:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Build the table from the feature arrays directly rather than via a pandas copy
+    columns = {}
+    if df.index.name == "facility":
+        columns["facility"] = df.index.to_numpy()
+    columns.update({col: df[col].to_numpy() for col in df.columns})
+    columns["emission_kg"] = emissions
+    buffer = io.BytesIO()
+    pq.write_table(pa.table(columns), buffer)
+    return buffer.getvalue()
+
 @app.post("/optimize", response_model=OptimizationResponse)
 async def optimize(background_tasks: BackgroundTasks, x_session_id: str = Header(...)):
     session = session_service.get_session(x_session_id)
@@ -163,7 +359,7 @@ async def optimize(background_tasks: BackgroundTasks, x_session_id: str = Header
     # OR we just run it here. The user flow usually waits for prediction then asks for optimization.
     # I'll run it here synchronously for the response, but maybe log or do heavy lifting in background if it was complex.
     
-    suggestions = optimization_agent.optimize(data, current_emission)
+    suggestions = await optimization_agent.optimize_async(data, current_emission)
     total_savings = sum(s.potential_saving_kg for s in suggestions)
     
     response = OptimizationResponse(suggestions=suggestions, total_potential_savings=total_savings)
@@ -173,6 +369,94 @@ async def optimize(background_tasks: BackgroundTasks, x_session_id: str = Header
     
     return response
 
+@app.post("/optimize-batch")
+async def optimize_batch(x_session_id: str = Header(...), include_suggestions: bool = False,
+                         offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=10000)):
+    session = session_service.get_session(x_session_id)
+    if not session or session.get("data_frame") is None:
+        raise HTTPException(status_code=400, detail="No uploaded rows in session. Use /upload first.")
+
+    df = session["data_frame"]
+    batch = session.get("batch_prediction")
+
+    def evaluate():
+        if batch is not None and batch.row_count == len(df):
+            emissions = np.asarray(batch.emissions)
+        else:
+            emissions = prediction_agent.predict_batch(df)
+        # Agent: Optimization (rule thresholds evaluated as masks over every row at once)
+        return optimization_agent.evaluate_batch(df, emissions)
+
+    # Scoring and rule masks are CPU-bound; keep them off the event loop
+    evaluation = await asyncio.to_thread(evaluate)
+    savings = evaluation.total_savings
+    # Per-row figures (savings and, optionally, suggestion objects) only for the requested page of rows
+    rows = range(offset, min(offset + limit, len(evaluation)))
+    response = {
+        "row_count": len(evaluation),
+        "total_potential_savings": float(savings.sum()),
+        "rules": evaluation.summary(),
+        "offset": offset,
+        "limit": limit,
+        "row_savings": savings[offset:offset + limit].tolist(),
+    }
+    if include_suggestions:
+        response["suggestions"] = {i: evaluation.suggestions(i) for i in rows}
+    return response
+
+@app.post("/what-if", response_model=WhatIfResponse)
+async def what_if(x_session_id: str = Header(...), budget: Optional[float] = Query(None, ge=0),
+                  top_k: int = Query(5, ge=1, le=100)):
+    session = session_service.get_session(x_session_id)
+    if not session or not session.get("data"):
+        raise HTTPException(status_code=400, detail="No data found in session")
+    if not prediction_agent.is_ready:
+        raise HTTPException(status_code=503, detail="No prediction model loaded")
+
+    # Agent: Optimization (every lever combination scored in one batched model call)
+    return optimization_agent.what_if(session["data"], budget=budget, top_k=top_k)
+
+@app.post("/analyze", response_model=AnalysisResponse)
+async def analyze(x_session_id: str = Header(...), x_company: Optional[str] = Header(None)):
+    session = session_service.get_session(x_session_id)
+    if not session or not session.get("data"):
+        raise HTTPException(status_code=400, detail="No data found in session")
+
+    data = session["data"]
+
+    try:
+        # Agent: Prediction (the model itself is fast; the LLM calls are the slow part)
+        emission_value = prediction_agent.predict_record(data)
+        attribution = prediction_agent.attribute_record(data)
+
+        # Agents: Explanation and Optimization run in parallel off the same prediction,
+        # so latency is the slower of the two LLM calls rather than their sum
+        explanation, suggestions = await asyncio.gather(
+            prediction_agent.explain_async(data, emission_value, attribution),
+            optimization_agent.optimize_async(data, emission_value),
+        )
+
+        prediction = emission_output(emission_value, explanation, attribution)
+        total_savings = sum(s.potential_saving_kg for s in suggestions)
+        optimization = OptimizationResponse(suggestions=suggestions, total_potential_savings=total_savings)
+
+        session_service.update_session(x_session_id, "prediction", prediction)
+        session_service.update_session(x_session_id, "prediction_made", True)
+        session_service.update_session(x_session_id, "optimization", optimization)
+        session_service.update_session(x_session_id, "optimization_done", True)
+
+        memory_bank.save_emission_record({
+            "session_id": x_session_id,
+            "company": x_company,
+            "input": data,
+            "emission": emission_value
+        })
+
+        return AnalysisResponse(prediction=prediction, optimization=optimization)
+    except Exception as e:
+        logger.error("Analysis failed: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/generate-report")
 async def generate_report(x_session_id: str = Header(...)):
     session = session_service.get_session(x_session_id)
@@ -189,9 +473,249 @@ async def generate_report(x_session_id: str = Header(...)):
     prediction = session["prediction"]
     optimization = session["optimization"]
     
-    pdf_bytes = report_service.generate_pdf("My Company", prediction, optimization)
+    # Cached by content hash, so unchanged sessions skip ReportLab entirely
+    pdf_bytes = await asyncio.to_thread(report_service.generate_pdf, "My Company", prediction, optimization)
     
-    return Response(content=pdf_bytes, media_type="application/pdf", headers={"Content-Disposition": "attachment; filename=report.pdf"})
+    headers = {"Content-Disposition": "attachment; filename=report.pdf"}
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
+async def build_facility_reports(df: pd.DataFrame, emissions: np.ndarray) -> List[dict]:
+    """Plain per-facility payloads for batch reports (cheap to pickle to the render pool)"""
+    records = df.to_dict(orient="records")
+    if isinstance(df.index, pd.RangeIndex):
+        names = [f"Facility {i + 1}" for i in range(len(df))]
+    else:
+        names = [str(name) for name in df.index]
+
+    # With an LLM configured, rows are packed into a few batched prompts rather than one call per row
+    # One vectorized attribution pass feeds both the explanation text and the drivers table
+    attribution = await asyncio.to_thread(prediction_agent.attribute, df)
+    if prediction_agent.polish_model:
+        explanations = await prediction_agent.explain_batch(records, emissions, attribution)
+    else:
+        explanations = await asyncio.to_thread(prediction_agent.explain_many, records, emissions, attribution)
+    if optimization_agent.llm_model:
+        suggestion_sets = await optimization_agent.suggest_batch(records, emissions)
+    else:
+        suggestion_sets = await asyncio.to_thread(optimization_agent.suggest_many, df, emissions)
+
+    facilities = []
+    for i, (name, emission, explanation, suggestions) in enumerate(zip(names, emissions, explanations, suggestion_sets)):
+        facilities.append({
+            "name": name,
+            "emission_kg": float(emission),
+            "explanation": explanation,
+            "baseline_kg": attribution.bias if attribution is not None else None,
+            "drivers": [d.model_dump() for d in attribution.drivers(i)] if attribution is not None else [],
+            "suggestions": [s.model_dump() for s in suggestions],
+            "total_potential_savings": float(sum(s.potential_saving_kg for s in suggestions)),
+        })
+    return facilities
+
+@app.post("/generate-report/batch")
+async def generate_batch_report(x_session_id: str = Header(...), mode: str = "zip", company_name: str = "My Company"):
+    session = session_service.get_session(x_session_id)
+    if not session or session.get("data_frame") is None:
+        raise HTTPException(status_code=400, detail="No uploaded rows in session. Use /upload first.")
+    if mode not in ("zip", "consolidated"):
+        raise HTTPException(status_code=400, detail="mode must be 'zip' or 'consolidated'")
+
+    df = session["data_frame"]
+    batch = session.get("batch_prediction")
+    if batch is not None and batch.row_count == len(df):
+        emissions = np.asarray(batch.emissions)
+    else:
+        emissions = await asyncio.to_thread(prediction_agent.predict_batch, df)
+    facilities = await build_facility_reports(df, emissions)
+
+    if mode == "consolidated":
+        pdf_bytes = await asyncio.to_thread(report_service.generate_consolidated_pdf, company_name, facilities)
+        return Response(content=pdf_bytes, media_type="application/pdf",
+                        headers={"Content-Disposition": "attachment; filename=consolidated_report.pdf"})
+
+    # Facility PDFs render across the report process pool and stream out as a ZIP
+    return StreamingResponse(report_service.iter_batch_zip(facilities), media_type="application/zip",
+                             headers={"Content-Disposition": "attachment; filename=facility_reports.zip"})
+
+@app.get("/history/companies")
+def history_companies(limit: int = 100):
+    return memory_bank.company_totals(limit=limit)
+
+@app.get("/history/trend")
+def history_trend(start: Optional[float] = None, end: Optional[float] = None,
+                  bucket_seconds: float = Query(86400, gt=0), company: Optional[str] = None):
+    return memory_bank.emission_trend(start=start, end=end, bucket_seconds=bucket_seconds, company=company)
+
+@app.get("/history/percentiles")
+def history_percentiles(p: List[float] = Query([50, 90, 99]), start: Optional[float] = None,
+                        end: Optional[float] = None, company: Optional[str] = None):
+    return memory_bank.emission_percentiles(percentiles=p, start=start, end=end, company=company)
+
+@app.post("/jobs")
+async def submit_job(file: Optional[UploadFile] = File(None), x_session_id: Optional[str] = Header(None)):
+    try:
+        if file is not None:
+            # The upload is closed when this request ends, so hand the job its own copy on disk;
+            # its extension records the upload's format, which is how the job picks its reader
+            suffix = {"parquet": ".parquet", "arrow": ".arrow"}.get(data_agent.upload_format(file.filename), ".csv")
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+                try:
+                    await asyncio.to_thread(shutil.copyfileobj, file.file, tmp)
+                except BaseException:
+                    tmp.close()
+                    os.remove(tmp.name)
+                    raise
+            # Removes the copy itself if the job is rejected
+            job_id = job_manager.submit_file(tmp.name)
+        else:
+            session = session_service.get_session(x_session_id) if x_session_id else None
+            if not session or session.get("data_frame") is None:
+                raise HTTPException(status_code=400, detail="Upload a file or pass a session with uploaded data")
+            job_id = job_manager.submit_frame(session["data_frame"])
+    except JobLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    return {"job_id": job_id, "status_url": f"/jobs/{job_id}", "results_url": f"/jobs/{job_id}/results"}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/results")
+def job_results(job_id: str, offset: int = 0, limit: Optional[int] = None):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    status = job.to_dict()
+    emissions = job_manager.results(job_id, offset=offset, limit=limit)
+    return {**status, "offset": offset, "emissions": emissions.tolist()}
+
+@app.get("/jobs/{job_id}/stream")
+async def job_stream(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def ndjson():
+        # One line per completed chunk, as soon as it is scored
+        sent_chunks, offset = 0, 0
+        while True:
+            with job.lock:
+                chunks = job.chunks[sent_chunks:]
+            for chunk in chunks:
+                yield json.dumps({"offset": offset, "emissions": chunk.tolist()}) + "\n"
+                offset += len(chunk)
+            sent_chunks += len(chunks)
+            if job.done and sent_chunks == len(job.chunks):
+                yield json.dumps(job.to_dict()) + "\n"
+                return
+            await asyncio.sleep(0.2)
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_manager.get(job_id).to_dict()
+
+@app.on_event("shutdown")
+def flush_memory_bank():
+    memory_bank.close()
+    job_manager.shutdown()
+    model_registry.stop()
+    if prediction_agent.shadow is not None:
+        prediction_agent.shadow.stop()
+    shutdown_logging()
+
+@app.get("/models")
+def list_models():
+    return {
+        "serving": prediction_agent.model_version,
+        "serving_path": prediction_agent.model_path,
+        "active": model_registry.active_version(),
+        "candidate": model_registry.candidate_version(),
+        "versions": model_registry.versions(),
+    }
+
+@app.post("/models")
+async def register_model(version: Optional[str] = None, activate: bool = False):
+    """Register the latest pickle written by ml/train_model.py as a new version"""
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    trained_path = os.path.join(base_dir, "ml", "models", "carbon_emission_model.pkl")
+    try:
+        version = await asyncio.to_thread(model_registry.register, trained_path, version)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="No trained model found. Run ml/train_model.py first.")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if activate:
+        return await activate_model(version)
+    return {"version": version}
+
+@app.post("/models/{version}/activate")
+async def activate_model(version: str):
+    try:
+        if not model_registry.exists(version):
+            raise HTTPException(status_code=404, detail="Model version not found")
+        # Load in the background, then swap the pointer; requests keep using the old model meanwhile
+        await asyncio.to_thread(prediction_agent.swap_model, model_registry.model_path(version), version)
+        model_registry.activate(version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"serving": prediction_agent.model_version}
+
+@app.post("/models/{version}/shadow")
+async def start_shadow(version: str, sample_rate: Optional[float] = None):
+    try:
+        if not model_registry.exists(version):
+            raise HTTPException(status_code=404, detail="Model version not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        candidate = await asyncio.to_thread(prediction_agent.load_version, model_registry.model_path(version), version)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=f"Candidate model failed to load: {e}")
+
+    previous, prediction_agent.shadow = prediction_agent.shadow, ShadowScorer(candidate, sample_rate=sample_rate)
+    if previous is not None:
+        previous.stop()
+    model_registry.set_candidate(version)
+    return prediction_agent.shadow.get_stats()
+
+@app.get("/models/shadow")
+def shadow_stats():
+    if prediction_agent.shadow is None:
+        raise HTTPException(status_code=404, detail="No shadow model running")
+    return prediction_agent.shadow.get_stats()
+
+@app.delete("/models/shadow")
+def stop_shadow():
+    shadow, prediction_agent.shadow = prediction_agent.shadow, None
+    if shadow is None:
+        raise HTTPException(status_code=404, detail="No shadow model running")
+    shadow.stop()
+    model_registry.set_candidate(None)
+    return shadow.get_stats()
+
+@app.get("/sessions/stats")
+def session_stats():
+    return session_service.get_stats()
+
+@app.get("/cache/stats")
+def cache_stats():
+    stats = {"llm": llm_cache.get_stats(), "report": report_service.get_stats()}
+    if prediction_agent.prediction_cache is not None:
+        stats["prediction"] = prediction_agent.prediction_cache.get_stats()
+    return stats
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of stage latencies, LLM outcomes, fallbacks and service gauges"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 def health():
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class EmissionInput(BaseModel):
     energy_usage_kwh: float
@@ -8,10 +8,25 @@ class EmissionInput(BaseModel):
     waste_generated_kg: float
     company_size: int = 10
 
+class FeatureContribution(BaseModel):
+    feature: str
+    value: float
+    contribution_kg: float
+
 class EmissionOutput(BaseModel):
     emission_kg: float
     explanation: str
+    baseline_kg: Optional[float] = None
+    drivers: List[FeatureContribution] = []
     
+class BatchEmissionOutput(BaseModel):
+    row_count: int
+    total_emission_kg: float
+    mean_emission_kg: float
+    min_emission_kg: float
+    max_emission_kg: float
+    emissions: List[float]
+
 class OptimizationSuggestion(BaseModel):
     category: str
     suggestion: str
@@ -21,6 +36,36 @@ class OptimizationResponse(BaseModel):
     suggestions: List[OptimizationSuggestion]
     total_potential_savings: float
 
+class LeverOption(BaseModel):
+    reduction: float
+    cost: float
+    saving_kg: float
+
+class LeverSavings(BaseModel):
+    lever: str
+    category: str
+    suggestion: str
+    feature: str
+    options: List[LeverOption]
+
+class Scenario(BaseModel):
+    changes: Dict[str, float]
+    cost: float
+    emission_kg: float
+    saving_kg: float
+    interaction_kg: float
+
+class WhatIfResponse(BaseModel):
+    baseline_emission_kg: float
+    scenario_count: int
+    budget: Optional[float] = None
+    levers: List[LeverSavings]
+    best: List[Scenario]
+
+class AnalysisResponse(BaseModel):
+    prediction: EmissionOutput
+    optimization: OptimizationResponse
+
 class ReportRequest(BaseModel):
     prediction: EmissionOutput
     optimization: OptimizationResponse
@@ -0,0 +1,59 @@
+from typing import List
+
+import numpy as np
+
+from models.schemas import FeatureContribution
+
+FEATURE_LABELS = {
+    "energy_usage_kwh": "energy usage",
+    "fuel_consumption_liters": "fuel consumption",
+    "distance_traveled_km": "distance traveled",
+    "waste_generated_kg": "waste generated",
+    "company_size": "company size",
+}
+
+class Attribution:
+    """
+    Per-row feature contributions (kg CO2e) from the forest's decision paths.
+    For every row, bias + contributions.sum() is the model's prediction; bias is the
+    emission of an average training facility.
+    """
+
+    def __init__(self, feature_names: List[str], values: np.ndarray, bias: float, contributions: np.ndarray):
+        self.feature_names = list(feature_names)
+        self.values = values                # (n_rows, n_features) model inputs
+        self.bias = bias
+        self.contributions = contributions  # (n_rows, n_features)
+
+    def __len__(self):
+        return len(self.contributions)
+
+    def drivers(self, row: int, top_k: int = None) -> List[FeatureContribution]:
+        """Features ordered by the size of their effect, largest first"""
+        order = np.argsort(-np.abs(self.contributions[row]), kind="stable")[:top_k]
+        return [
+            FeatureContribution(feature=self.feature_names[j], value=float(self.values[row, j]),
+                                contribution_kg=float(self.contributions[row, j]))
+            for j in order
+        ]
+
+    def describe(self, row: int, prediction: float) -> str:
+        contributions = self.contributions[row]
+        order = np.argsort(-np.abs(contributions), kind="stable")
+        raising = [j for j in order if contributions[j] > 0][:2]
+        lowering = [j for j in order if contributions[j] < 0][:1]
+
+        def label(j):
+            return f"{FEATURE_LABELS.get(self.feature_names[j], self.feature_names[j])} ({contributions[j]:+.2f} kg)"
+
+        text = f"The predicted carbon emission is {prediction:.2f} kg CO2e against an average facility at {self.bias:.2f} kg."
+        if raising:
+            text += f" This is primarily driven by {' and '.join(label(j) for j in raising)}"
+            text += f", partly offset by {label(lowering[0])}." if lowering else "."
+        elif lowering:
+            text += f" It is lower mainly because of {label(lowering[0])}."
+        return text
+
+    def summary(self, row: int) -> str:
+        """Compact driver list for LLM prompts"""
+        return ", ".join(f"{d.feature}: {d.contribution_kg:+.2f} kg" for d in self.drivers(row))
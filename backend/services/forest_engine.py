@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+from typing import List, Optional
+
+# Bump when the on-disk layout of a saved ForestEngine changes
+ARTIFACT_FORMAT_VERSION = 1
+ARRAY_NAMES = ("feature", "threshold", "children", "value", "roots")
+# predict() walks all trees at once while rows x trees stays under this many nodes
+ALL_TREES_MAX_NODES = 1 << 18
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents, read in 1 MiB blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ForestEngine:
+    """
+    Array-based evaluator for a fitted RandomForestRegressor.
+    Every tree is flattened into shared contiguous node arrays so single rows and
+    batches are scored with a handful of NumPy gathers per tree level instead of
+    going through sklearn's per-call validation and joblib dispatch.
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, children: np.ndarray,
+                 value: np.ndarray, roots: np.ndarray, max_depth: int,
+                 feature_names: Optional[List[str]] = None):
+        self.feature = feature            # int32, split feature per node (0 for leaves)
+        self.threshold = threshold        # float64, split threshold per node (+inf for leaves)
+        self.children = children          # int32, flattened [left, right] pairs; leaves point to themselves
+        self.value = value                # float64, mean target per node
+        self.roots = roots                # int32, root node index of each tree
+        self.max_depth = int(max_depth)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.n_features = int(feature.max()) + 1 if feature_names is None else len(self.feature_names)
+        self._edge_delta = None           # built on first contributions() call
+
+    @classmethod
+    def from_model(cls, model) -> "ForestEngine":
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            node_ids = np.arange(n)
+
+            left = np.where(is_leaf, node_ids, tree.children_left) + offset
+            right = np.where(is_leaf, node_ids, tree.children_right) + offset
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            children.append(np.column_stack([left, right]).ravel())
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset)
+
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.int32),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            children=np.ascontiguousarray(np.concatenate(children), dtype=np.int32),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            feature_names=getattr(model, "feature_names_in_", None),
+        )
+
+    def save(self, directory: str, source_digest: Optional[str] = None):
+        """
+        Write the node arrays as uncompressed .npy files plus a manifest.
+        Uncompressed arrays can be memory-mapped, so every worker on a host shares the same pages.
+        The export is written to a sibling directory and renamed into place, so files that running
+        workers have mapped are unlinked rather than overwritten.
+        source_digest is the file_digest of the pickle this export came from; loaders compare it
+        against the pickle next to them to tell whether the export is current.
+        """
+        directory = os.path.abspath(directory)
+        staging = f"{directory}.tmp-{uuid.uuid4().hex[:8]}"
+        os.makedirs(staging)
+        try:
+            for name in ARRAY_NAMES:
+                np.save(os.path.join(staging, f"{name}.npy"), getattr(self, name))
+            manifest = {
+                "format_version": ARTIFACT_FORMAT_VERSION,
+                "n_trees": self.n_trees,
+                "n_nodes": int(len(self.feature)),
+                "max_depth": self.max_depth,
+                "feature_names": self.feature_names,
+                "source_sha256": source_digest,
+            }
+            with open(os.path.join(staging, "manifest.json"), "w") as f:
+                json.dump(manifest, f, indent=2)
+
+            # Directories can't be replaced atomically while non-empty: move the old export aside first.
+            # Loaders that hit the gap find no manifest and fall back to the pickle.
+            retired = None
+            if os.path.exists(directory):
+                retired = f"{directory}.old-{uuid.uuid4().hex[:8]}"
+                os.rename(directory, retired)
+            os.rename(staging, directory)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if retired is not None:
+            shutil.rmtree(retired, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "ForestEngine":
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != ARTIFACT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported forest artifact version {manifest.get('format_version')}, "
+                             f"expected {ARTIFACT_FORMAT_VERSION}")
+
+        mmap_mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAY_NAMES}
+        return cls(max_depth=manifest["max_depth"], feature_names=manifest["feature_names"], **arrays)
+
+    @staticmethod
+    def is_export_of(directory: str, model_path: str) -> bool:
+        """True if the export in directory was saved from exactly the pickle at model_path"""
+        try:
+            with open(os.path.join(directory, "manifest.json")) as f:
+                recorded = json.load(f).get("source_sha256")
+        except (OSError, ValueError):
+            return False
+        return recorded is not None and recorded == file_digest(model_path)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def predict_one(self, x) -> float:
+        """Score a single feature vector, all trees advanced one level at a time"""
+        # sklearn evaluates splits on float32 inputs; match it for exact parity.
+        # Inputs are expected to be imputed already (DataCleaningAgent fills NaNs).
+        x = np.asarray(x, dtype=np.float32)
+        nodes = self.roots
+        for _ in range(self.max_depth):
+            go_right = x.take(self.feature.take(nodes)) > self.threshold.take(nodes)
+            nodes = self.children.take(2 * nodes + go_right)
+        return float(self.value.take(nodes).mean())
+
+    def predict(self, X) -> np.ndarray:
+        """Score a 2-D feature matrix one tree at a time over column-major inputs"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n_rows = X.shape[0]
+        if n_rows == 0:
+            return np.zeros(0, dtype=np.float64)
+
+        # Column-major copy so each split gathers from one contiguous feature column
+        columns = np.ascontiguousarray(X.T).ravel()
+        row_ids = np.arange(n_rows, dtype=np.int64)
+        if n_rows * self.n_trees <= ALL_TREES_MAX_NODES:
+            # Small batches (what-if grids, pages of rows): advance every tree together,
+            # one gather per level instead of one per tree and level
+            nodes = np.repeat(self.roots.astype(np.int64), n_rows)
+            row_ids = np.tile(row_ids, self.n_trees)
+            for _ in range(self.max_depth):
+                go_right = columns.take(self.feature.take(nodes) * n_rows + row_ids) > self.threshold.take(nodes)
+                nodes = self.children.take(2 * nodes + go_right)
+            return self.value.take(nodes).reshape(self.n_trees, n_rows).mean(axis=0)
+
+        total = np.zeros(n_rows, dtype=np.float64)
+        for root in self.roots:
+            nodes = np.full(n_rows, root, dtype=np.int64)
+            for _ in range(self.max_depth):
+                go_right = columns.take(self.feature.take(nodes) * n_rows + row_ids) > self.threshold.take(nodes)
+                nodes = self.children.take(2 * nodes + go_right)
+            total += self.value.take(nodes)
+        return total / self.n_trees
+
+    def contributions(self, X):
+        """
+        Decision-path (Saabas) attribution: every split a row passes credits its feature with the
+        change in node mean, so bias + contributions.sum(axis=1) equals predict(X).
+        Returns (bias, contributions of shape (n_rows, n_features)).
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n_rows, n_features = X.shape
+        contributions = np.zeros((n_rows, n_features), dtype=np.float64)
+        bias = float(self.value.take(self.roots).mean())
+
+        # Change in node mean along each [left, right] edge; leaves point to themselves, so theirs is zero
+        if self._edge_delta is None:
+            self._edge_delta = self.value.take(self.children) - np.repeat(self.value, 2)
+
+        # Same all-trees-at-once walk as predict(), in row blocks to bound the node arrays
+        block = max(1, ALL_TREES_MAX_NODES // self.n_trees)
+        for start in range(0, n_rows, block):
+            columns = np.ascontiguousarray(X[start:start + block].T).ravel()
+            m = len(columns) // n_features
+            row_ids = np.tile(np.arange(m, dtype=np.int64), self.n_trees)
+            nodes = np.repeat(self.roots.astype(np.int64), m)
+            keys, deltas = [], []
+            for _ in range(self.max_depth):
+                feature = self.feature.take(nodes)
+                edges = 2 * nodes + (columns.take(feature * m + row_ids) > self.threshold.take(nodes))
+                keys.append(row_ids * n_features + feature)
+                deltas.append(self._edge_delta.take(edges))
+                nodes = self.children.take(edges)
+            total = np.bincount(np.concatenate(keys), weights=np.concatenate(deltas), minlength=m * n_features)
+            contributions[start:start + m] = total.reshape(m, n_features) / self.n_trees
+        return bias, contributions
@@ -0,0 +1,215 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from services.scoring_pool import _score_chunk
+
+logger = logging.getLogger(__name__)
+
+class JobLimitError(Exception):
+    pass
+
+class ScoringJob:
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.status = "queued"
+        self.total_rows: Optional[int] = None
+        self.processed_rows = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        # Completed chunk results in input order; only the ordered prefix is ever appended
+        self.chunks: List[np.ndarray] = []
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "total_rows": self.total_rows,
+                "processed_rows": self.processed_rows,
+                "progress": (self.processed_rows / self.total_rows) if self.total_rows else (1.0 if self.status == "completed" else 0.0),
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+class JobManager:
+    """
+    Local batch-scoring job queue: no external broker.
+    Each job runs a driver thread that feeds cleaned chunks to a shared process pool,
+    keeping a bounded number of chunks in flight and collecting results in order.
+    """
+
+    def __init__(self, data_agent, prediction_agent, max_workers: int = None,
+                 max_concurrent_jobs: int = None, chunk_size: int = None,
+                 max_retained_jobs: int = None, retention_seconds: float = None):
+        self.data_agent = data_agent
+        self.prediction_agent = prediction_agent
+        self.max_workers = max_workers if max_workers is not None else int(os.getenv("SCORING_WORKERS", str(os.cpu_count() or 1)))
+        self.max_concurrent_jobs = max_concurrent_jobs if max_concurrent_jobs is not None else int(os.getenv("JOBS_MAX_CONCURRENT", "2"))
+        self.chunk_size = chunk_size if chunk_size is not None else int(os.getenv("JOBS_CHUNK_SIZE", "100000"))
+        # Finished jobs (and their results) stay queryable for a while, then are dropped
+        self.max_retained_jobs = max_retained_jobs if max_retained_jobs is not None else int(os.getenv("JOBS_MAX_RETAINED", "100"))
+        self.retention_seconds = retention_seconds if retention_seconds is not None else float(os.getenv("JOBS_RETENTION_SECONDS", "3600"))
+        self._jobs: Dict[str, ScoringJob] = {}
+        self._lock = threading.Lock()
+
+    def active_jobs(self) -> int:
+        return sum(1 for job in list(self._jobs.values()) if not job.done)
+
+    def _prune(self):
+        """Drop finished jobs past the retention window, then the oldest beyond the count limit"""
+        cutoff = time.time() - self.retention_seconds
+        finished = sorted((job for job in self._jobs.values() if job.done and job.finished_at is not None),
+                          key=lambda job: job.finished_at)
+        excess = len(finished) - self.max_retained_jobs
+        for i, job in enumerate(finished):
+            if i < excess or job.finished_at < cutoff:
+                del self._jobs[job.job_id]
+
+    def _reserve(self) -> ScoringJob:
+        with self._lock:
+            self._prune()
+            active = self.active_jobs()
+            if active >= self.max_concurrent_jobs:
+                raise JobLimitError(f"{active} jobs already running (limit {self.max_concurrent_jobs})")
+            job = ScoringJob(str(uuid.uuid4()))
+            self._jobs[job.job_id] = job
+            return job
+
+    def submit_frame(self, df: pd.DataFrame) -> str:
+        """Score an already-cleaned frame (e.g. the session's upload)"""
+        job = self._reserve()
+        job.total_rows = len(df)
+        threading.Thread(target=self._run, args=(job, self._frame_chunks(df)), daemon=True).start()
+        return job.job_id
+
+    def _frame_chunks(self, df: pd.DataFrame) -> Iterator[pd.DataFrame]:
+        return (df.iloc[start:start + self.chunk_size] for start in range(0, len(df), self.chunk_size))
+
+    def submit_file(self, path: str) -> str:
+        """
+        Score an upload on disk; the file is removed afterwards. CSVs go through the two-pass
+        streaming cleaner; Parquet and Arrow (by extension, as for /upload) are read column-wise
+        in one go, which only materializes the mapped float32 features, then chunked.
+        """
+        try:
+            job = self._reserve()
+        except JobLimitError:
+            os.remove(path)
+            raise
+
+        def chunks():
+            with open(path, "rb") as f:
+                if self.data_agent.upload_format(path) != "csv":
+                    df = self.data_agent.read_upload(f, path)
+                    with job.lock:
+                        job.total_rows = len(df)
+                    yield from self._frame_chunks(df)
+                    return
+
+                def on_stats(stats):
+                    with job.lock:
+                        job.total_rows = stats["rows"]
+                yield from self.data_agent.iter_clean_chunks(f, chunk_size=self.chunk_size, on_stats=on_stats)
+
+        def run():
+            try:
+                self._run(job, chunks())
+            finally:
+                os.remove(path)
+
+        threading.Thread(target=run, daemon=True).start()
+        return job.job_id
+
+    def _run(self, job: ScoringJob, chunks: Iterator[pd.DataFrame]):
+        try:
+            # Shared with EmissionPredictionAgent.predict_parallel; the lease keeps a job on one model across swaps
+            with self.prediction_agent.leased_pool(self.max_workers) as pool:
+                self._score(job, chunks, pool)
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            logger.error("Scoring job %s failed: %s", job.job_id, e)
+        finally:
+            job.finished_at = time.time()
+
+    def _score(self, job: ScoringJob, chunks: Iterator[pd.DataFrame], pool):
+        in_flight = deque()
+        max_in_flight = self.max_workers * 2
+        job.status = "running"
+        for chunk in chunks:
+            if job.cancel_event.is_set():
+                break
+            matrix = chunk.to_numpy(dtype=np.float32)
+            in_flight.append((len(chunk), pool.submit(_score_chunk, matrix, list(chunk.columns))))
+            while len(in_flight) >= max_in_flight and not job.cancel_event.is_set():
+                self._collect(job, in_flight.popleft())
+        while in_flight and not job.cancel_event.is_set():
+            self._collect(job, in_flight.popleft())
+
+        if job.cancel_event.is_set():
+            for _, future in in_flight:
+                future.cancel()
+            job.status = "cancelled"
+        else:
+            job.status = "completed"
+
+    def _collect(self, job: ScoringJob, entry):
+        n_rows, future = entry
+        result = future.result()
+        with job.lock:
+            job.chunks.append(result)
+            job.processed_rows += n_rows
+
+    def get(self, job_id: str) -> Optional[ScoringJob]:
+        return self._jobs.get(job_id)
+
+    def results(self, job_id: str, offset: int = 0, limit: Optional[int] = None) -> Optional[np.ndarray]:
+        """Scored rows available so far, starting at offset"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with job.lock:
+            chunks = list(job.chunks)
+
+        # Walk the ordered chunks instead of concatenating everything on every poll
+        pieces, position, taken = [], 0, 0
+        for chunk in chunks:
+            end = position + len(chunk)
+            if end > offset:
+                piece = chunk[max(0, offset - position):]
+                if limit is not None:
+                    piece = piece[:limit - taken]
+                pieces.append(piece)
+                taken += len(piece)
+                if limit is not None and taken >= limit:
+                    break
+            position = end
+        return np.concatenate(pieces) if pieces else np.zeros(0)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def shutdown(self):
+        for job in self._jobs.values():
+            job.cancel_event.set()
+        self.prediction_agent.shutdown_pool()
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import math
+import os
+from typing import Callable, Dict, List, Optional
+
+from services.llm_cache import LLMCache
+from services.llm_service import LLMGateway, LLM_MODEL_NAME
+from services.metrics_service import metrics
+
+def strip_code_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+def estimate_tokens(text: str) -> int:
+    # Rough budget check (~4 characters per token); no tokenizer dependency
+    return len(text) // 4 + 1
+
+class LLMBatcher:
+    """
+    Packs many rows into a few structured prompts instead of one LLM call per row.
+    Near-identical rows are bucketed and sent once; the model answers with a JSON array
+    keyed by row_id and rows it misses (or that fail to parse) come back as None.
+    Only answers that parse are cached, so a malformed one is asked for again next time.
+    """
+
+    def __init__(self, gateway: LLMGateway, cache: LLMCache = None, max_rows: int = None,
+                 max_prompt_tokens: int = None, bucket_digits: int = None):
+        if max_rows is None:
+            max_rows = int(os.getenv("LLM_BATCH_MAX_ROWS", "25"))
+        if max_prompt_tokens is None:
+            max_prompt_tokens = int(os.getenv("LLM_BATCH_MAX_TOKENS", "6000"))
+        if bucket_digits is None:
+            bucket_digits = int(os.getenv("LLM_BATCH_BUCKET_DIGITS", "2"))
+        self.gateway = gateway
+        self.cache = cache
+        self.max_rows = max_rows
+        self.max_prompt_tokens = max_prompt_tokens
+        self.bucket_digits = bucket_digits
+        self.stats = {"prompts": 0, "rows": 0, "unique_rows": 0, "cached_rows": 0, "answered_rows": 0, "fallback_rows": 0}
+
+    @staticmethod
+    def _round(value, digits: int) -> float:
+        """Round to digits significant figures"""
+        value = float(value)
+        if value == 0 or not math.isfinite(value):
+            return value
+        return round(value, digits - 1 - int(math.floor(math.log10(abs(value)))))
+
+    def bucket_key(self, record: Dict, prediction: float, digits: int = None) -> tuple:
+        digits = self.bucket_digits if digits is None else digits
+        return (tuple(sorted((k, self._round(v, digits)) for k, v in record.items())), self._round(prediction, digits))
+
+    def dedupe(self, records: List[Dict], predictions, digits: int = None) -> tuple:
+        """Returns (indices of one representative row per bucket, bucket number for every row)"""
+        buckets: Dict[tuple, int] = {}
+        representatives, inverse = [], []
+        for i, (record, prediction) in enumerate(zip(records, predictions)):
+            key = self.bucket_key(record, prediction, digits)
+            if key not in buckets:
+                buckets[key] = len(representatives)
+                representatives.append(i)
+            inverse.append(buckets[key])
+        return representatives, inverse
+
+    def pack(self, rows: List[Dict], header: str) -> List[List[Dict]]:
+        """Greedy packing under the row and token budgets; an oversized row still gets its own prompt"""
+        budget = self.max_prompt_tokens - estimate_tokens(header)
+        batches, current, used = [], [], 0
+        for row in rows:
+            cost = estimate_tokens(json.dumps(row, default=float))
+            if current and (len(current) >= self.max_rows or used + cost > budget):
+                batches.append(current)
+                current, used = [], 0
+            current.append(row)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def parse(text: Optional[str], row_ids: List[int]) -> Dict[int, Dict]:
+        """Items of the JSON array keyed by row_id; anything malformed is dropped"""
+        if not text:
+            return {}
+        try:
+            items = json.loads(strip_code_fence(text))
+        except ValueError:
+            return {}
+        if not isinstance(items, list):
+            return {}
+        expected = set(row_ids)
+        parsed = {}
+        for item in items:
+            if isinstance(item, dict) and item.get("row_id") in expected:
+                parsed[item["row_id"]] = item
+        return parsed
+
+    @staticmethod
+    def build_prompt(instructions: str, rows: List[Dict]) -> str:
+        return f"{instructions}\nRows (JSON):\n{json.dumps(rows, default=float)}\n"
+
+    async def run(self, llm_model, kind: str, records: List[Dict], predictions, instructions: str,
+                  parse_item: Callable[[Dict, Dict, float], object],
+                  emission_model: Optional[str] = None, bucket_digits: int = None) -> List[Optional[object]]:
+        """
+        One result per input row, or None where the caller should use its heuristic.
+        The prompt is the instructions followed by [{"row_id", "data", "predicted_emission_kg"}, ...];
+        parse_item(item, record, prediction) turns a response item into the row's result.
+        emission_model is part of the cache key, for answers that depend on the scoring model.
+        bucket_digits overrides the dedup precision for kinds whose answers quote the row's numbers.
+        """
+        predictions = [float(p) for p in predictions]
+        self.stats["rows"] += len(records)
+        if llm_model is None or not records:
+            self.stats["fallback_rows"] += len(records)
+            metrics.inc("fallbacks_total", len(records), kind=f"{kind}_batch")
+            return [None] * len(records)
+
+        representatives, inverse = self.dedupe(records, predictions, bucket_digits)
+        self.stats["unique_rows"] += len(representatives)
+
+        # Answers per bucket, from the cache first (one lookup for every bucket)
+        answers: Dict[int, Dict] = {}
+        cache_keys = {}
+        cached = {}
+        if self.cache is not None:
+            cache_keys = {bucket: self.cache.make_key(f"{kind}-batch", records[i], predictions[i], LLM_MODEL_NAME,
+                                                         emission_model)
+                          for bucket, i in enumerate(representatives)}
+            cached = await self.cache.get_many_async(cache_keys.values())
+        pending = []
+        for bucket, i in enumerate(representatives):
+            if bucket in cache_keys and cache_keys[bucket] in cached:
+                answers[bucket] = json.loads(cached[cache_keys[bucket]])
+                self.stats["cached_rows"] += 1
+                continue
+            pending.append({"row_id": bucket, "data": records[i], "predicted_emission_kg": round(predictions[i], 2)})
+
+        batches = self.pack(pending, instructions)
+        self.stats["prompts"] += len(batches)
+        texts = await asyncio.gather(*[self.gateway.generate(llm_model, self.build_prompt(instructions, batch)) for batch in batches])
+        fresh = []
+        for batch, text in zip(batches, texts):
+            for bucket, item in self.parse(text, [row["row_id"] for row in batch]).items():
+                i = representatives[bucket]
+                # Keep (and cache) an answer only if it parses for the row it was asked about
+                if self._parse_item(parse_item, item, records[i], predictions[i]) is None:
+                    continue
+                answers[bucket] = item
+                if bucket in cache_keys:
+                    fresh.append((cache_keys[bucket], json.dumps(item)))
+        if fresh:
+            await self.cache.set_many_async(fresh)
+
+        results = []
+        for i, bucket in enumerate(inverse):
+            item = answers.get(bucket)
+            results.append(None if item is None else self._parse_item(parse_item, item, records[i], predictions[i]))
+        answered = sum(r is not None for r in results)
+        self.stats["answered_rows"] += answered
+        self.stats["fallback_rows"] += len(results) - answered
+        metrics.inc("fallbacks_total", len(results) - answered, kind=f"{kind}_batch")
+        return results
+
+    @staticmethod
+    def _parse_item(parse_item: Callable, item: Dict, record: Dict, prediction: float):
+        # Model output is untrusted: any failure (wrong types, missing keys) means "use the heuristic"
+        try:
+            return parse_item(item, record, prediction)
+        except Exception:
+            return None
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
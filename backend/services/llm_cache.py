@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Bump whenever a prompt template changes so stale answers are not served
+PROMPT_VERSION = "2"
+
+class LLMCache:
+    """
+    Content-addressed cache for LLM explanations and suggestions.
+    An in-memory LRU+TTL tier sits in front of an optional SQLite tier that
+    survives restarts and can be shared by the workers on one host.
+    Expired SQLite rows are purged on write at most every purge_seconds; async callers
+    use the *_async methods so SQLite I/O happens in a worker thread, not on the event loop.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None, db_path: Optional[str] = None,
+                 purge_seconds: float = None):
+        if max_entries is None:
+            max_entries = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+        if purge_seconds is None:
+            purge_seconds = float(os.getenv("LLM_CACHE_PURGE_SECONDS", "3600"))
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.purge_seconds = purge_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "purged": 0}
+
+        self._db = None
+        # SQLite has its own lock so memory hits never wait behind disk I/O
+        self._db_lock = threading.Lock()
+        self._last_purge = 0.0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache (expires_at)")
+            with self._db_lock:
+                self._purge_locked(time.time())
+            self._db.commit()
+
+    @staticmethod
+    def make_key(kind: str, features: Dict, prediction: float, model_name: str,
+                 emission_model: Optional[str] = None) -> str:
+        """Hash of the normalized feature dict, rounded prediction, LLM/prompt version and emission model version"""
+        normalized = {str(k): round(float(v), 4) if isinstance(v, (int, float)) else str(v)
+                      for k, v in features.items()}
+        payload = json.dumps({
+            "kind": kind,
+            "features": normalized,
+            "prediction": round(float(prediction), 2),
+            "model": model_name,
+            "emission_model": emission_model,
+            "prompt_version": PROMPT_VERSION,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key]).get(key)
+
+    def set(self, key: str, value: str):
+        self.set_many([(key, value)])
+
+    async def get_async(self, key: str) -> Optional[str]:
+        return (await self.get_many_async([key])).get(key)
+
+    async def set_async(self, key: str, value: str):
+        await self.set_many_async([(key, value)])
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Cached values for whichever keys have one; SQLite is consulted once for all memory misses"""
+        now = time.time()
+        found, missing = self._memory_get(keys, now)
+        if missing and self._db is not None:
+            self._disk_get(missing, now, found)
+        else:
+            self._count_misses(len(missing))
+        return found
+
+    async def get_many_async(self, keys: Iterable[str]) -> Dict[str, str]:
+        now = time.time()
+        found, missing = self._memory_get(keys, now)
+        if missing and self._db is not None:
+            await asyncio.to_thread(self._disk_get, missing, now, found)
+        else:
+            self._count_misses(len(missing))
+        return found
+
+    def set_many(self, items: List[Tuple[str, str]]):
+        expires_at = self._memory_set(items)
+        if self._db is not None and items:
+            self._disk_set(items, expires_at)
+
+    async def set_many_async(self, items: List[Tuple[str, str]]):
+        expires_at = self._memory_set(items)
+        if self._db is not None and items:
+            await asyncio.to_thread(self._disk_set, items, expires_at)
+
+    def _memory_get(self, keys: Iterable[str], now: float):
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    expires_at, value = entry
+                    if expires_at > now:
+                        self._entries.move_to_end(key)
+                        self.stats["hits"] += 1
+                        self.stats["memory_hits"] += 1
+                        found[key] = value
+                        continue
+                    del self._entries[key]
+                missing.append(key)
+        return found, missing
+
+    def _count_misses(self, n: int):
+        if n:
+            with self._lock:
+                self.stats["misses"] += n
+
+    def _disk_get(self, keys: List[str], now: float, found: Dict[str, str]):
+        rows = []
+        with self._db_lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows += self._db.execute(
+                    f"SELECT key, value, expires_at FROM llm_cache WHERE expires_at > ? AND key IN ({','.join('?' * len(part))})",
+                    (now, *part),
+                ).fetchall()
+        with self._lock:
+            for key, value, expires_at in rows:
+                self._remember(key, value, expires_at)
+                found[key] = value
+            self.stats["hits"] += len(rows)
+            self.stats["disk_hits"] += len(rows)
+            self.stats["misses"] += len(keys) - len(rows)
+
+    def _memory_set(self, items: List[Tuple[str, str]]) -> float:
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            for key, value in items:
+                self._remember(key, value, expires_at)
+        return expires_at
+
+    def _disk_set(self, items: List[Tuple[str, str]], expires_at: float):
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, value, expires_at) for key, value in items],
+            )
+            now = time.time()
+            if now - self._last_purge >= self.purge_seconds:
+                self._purge_locked(now)
+            self._db.commit()
+
+    def _purge_locked(self, now: float):
+        deleted = self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+        self._last_purge = now
+        with self._lock:
+            self.stats["purged"] += max(deleted, 0)
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+            }
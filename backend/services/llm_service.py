@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+LLM_MODEL_NAME = 'gemini-2.5-flash'
+
+def _release_from_thread(loop: asyncio.AbstractEventLoop, semaphore: asyncio.Semaphore):
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:
+        # The loop is gone, and its semaphore with it
+        pass
+
+class LLMGateway:
+    """
+    Runs LLM calls without blocking the event loop.
+    A semaphore caps in-flight requests per worker and every call gets a deadline;
+    on timeout or error the caller receives None and falls back to its heuristic.
+    A slot stays taken until the underlying call really finishes, so threads stuck in a
+    sync client can never outnumber the executor's workers.
+    """
+
+    def __init__(self, max_concurrency: int = None, timeout_seconds: float = None):
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+        if timeout_seconds is None:
+            timeout_seconds = float(os.getenv("LLM_TIMEOUT_SECONDS", "15"))
+        self.max_concurrency = max_concurrency
+        self.timeout_seconds = timeout_seconds
+        # asyncio primitives bind to one loop; keep a semaphore per loop that uses the gateway
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self.stats = {"calls": 0, "timeouts": 0, "failures": 0, "saturated": 0}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def generate(self, llm_model, prompt: str) -> Optional[str]:
+        if llm_model is None:
+            return None
+
+        semaphore = self._semaphore()
+        try:
+            # Waiting for a slot counts against the same deadline as the call
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            self.stats["saturated"] += 1
+            metrics.inc("llm_calls_total", outcome="saturated")
+            logger.warning("No LLM slot free within %ss", self.timeout_seconds)
+            return None
+
+        self.stats["calls"] += 1
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        native = hasattr(llm_model, "generate_content_async")
+        try:
+            if native:
+                # Native async client (google.generativeai provides one)
+                call = asyncio.ensure_future(llm_model.generate_content_async(prompt))
+                call.add_done_callback(lambda _: semaphore.release())
+            else:
+                future = self._executor.submit(llm_model.generate_content, prompt)
+                future.add_done_callback(lambda _: _release_from_thread(loop, semaphore))
+                call = asyncio.wrap_future(future)
+        except Exception as e:
+            semaphore.release()
+            self.stats["failures"] += 1
+            metrics.inc("llm_calls_total", outcome="error")
+            logger.warning("LLM call failed: %s", e)
+            return None
+
+        try:
+            response = await asyncio.wait_for(asyncio.shield(call), timeout=self.timeout_seconds)
+            text = response.text.strip()
+            metrics.inc("llm_calls_total", outcome="ok")
+            return text
+        except asyncio.TimeoutError:
+            # Coroutines stop here; an executor thread can't be interrupted and keeps its slot until it returns
+            if native:
+                call.cancel()
+            self.stats["timeouts"] += 1
+            metrics.inc("llm_calls_total", outcome="timeout")
+            logger.warning("LLM call timed out after %ss", self.timeout_seconds)
+        except Exception as e:
+            self.stats["failures"] += 1
+            metrics.inc("llm_calls_total", outcome="error")
+            logger.warning("LLM call failed: %s", e)
+        finally:
+            # Time waiting on the model only, not on the concurrency semaphore
+            metrics.observe("stage_duration_seconds", time.perf_counter() - start, stage="llm", agent="gateway")
+        return None
@@ -0,0 +1,113 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, Optional, Union
+
+# Standard LogRecord attributes; anything else on a record came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any `extra=` fields merged in"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Enqueues the record untouched: message formatting, payload rendering and stream I/O
+    all happen on the listener thread instead of the request thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+class LoggingConfig:
+    def __init__(self):
+        self.level = os.getenv("LOG_LEVEL", "INFO").upper()
+        self.format = os.getenv("LOG_FORMAT", "text").lower()
+        # Payload dumps (uploaded rows, features) are off unless LOG_PAYLOADS=1
+        self.payloads = os.getenv("LOG_PAYLOADS", "0") == "1"
+        # Level payload dumps are logged at; INFO so they show up under the default LOG_LEVEL
+        self.payload_level = logging.getLevelName(os.getenv("LOG_PAYLOAD_LEVEL", "INFO").upper())
+        # e.g. "DEBUG=1,INFO=0.01": share of payload dumps kept per level; a bare number applies to all levels
+        self.sample_rates = self._parse_rates(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "DEBUG=1,INFO=0.01"))
+
+    @staticmethod
+    def _parse_rates(spec: str) -> Dict[int, float]:
+        rates = {}
+        for part in spec.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if "=" in part:
+                level, rate = part.split("=", 1)
+                rates[logging.getLevelName(level.strip().upper())] = float(rate)
+            else:
+                rates = {level: float(part) for level in (logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR)}
+        return rates
+
+config = LoggingConfig()
+_listener: Optional[QueueListener] = None
+
+def setup_logging(stream=None) -> QueueListener:
+    """Routes every logger through one queue; a background listener formats and writes. Idempotent."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if config.format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(config.level)
+    root.handlers = [DeferredQueueHandler(log_queue)]
+
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+def shutdown_logging():
+    """Drains the queue; call on shutdown so the last records are written"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def log_payload(logger: logging.Logger, message: str, payload: Union[Any, Callable[[], Any]],
+                level: int = None, **fields):
+    """
+    Logs a data payload (at LOG_PAYLOAD_LEVEL unless `level` is given) only when payload logging
+    is on, the level is enabled and the record survives sampling. Pass a callable to defer
+    building expensive payloads.
+    """
+    if level is None:
+        level = config.payload_level
+    if not config.payloads or not logger.isEnabledFor(level):
+        return
+    rate = config.sample_rates.get(level, 0.0)
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return
+    if callable(payload):
+        payload = payload()
+    logger.log(level, "%s: %s", message, payload, extra={"payload": True, **fields})
@@ -1,42 +1,515 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+import itertools
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
 import uuid
 
-class InMemorySessionService:
-    def __init__(self):
-        self._sessions: Dict[str, Dict[str, Any]] = {}
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+def _new_session_state() -> Dict[str, Any]:
+    return {
+        "history": [],
+        "data": None,
+        "data_frame": None,
+        "prediction": None,
+        "batch_prediction": None,
+        "optimization": None
+    }
+
+def _estimate_size(value: Any) -> int:
+    """Cheap approximate footprint in bytes of a session value"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, BaseModel):
+        return _estimate_size(value.__dict__)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return sys.getsizeof(value)
+        # Extrapolate from a sample so large per-row lists stay O(1) to measure
+        sample = value[:16]
+        per_item = sum(_estimate_size(v) for v in sample) / len(sample)
+        return sys.getsizeof(value) + int(per_item * len(value))
+    return sys.getsizeof(value)
+
+class SessionStore:
+    """Interface every session backend implements"""
+
+    def create_session(self) -> str:
+        raise NotImplementedError
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update_session(self, session_id: str, key: str, value: Any):
+        raise NotImplementedError
+
+    def delete_session(self, session_id: str):
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+class InMemorySessionService(SessionStore):
+    """
+    Per-process session store with LRU ordering, idle TTL and a byte budget.
+    Sizes are tracked per key as values are written, so accounting stays cheap.
+    """
+
+    def __init__(self, max_sessions: int = None, ttl_seconds: float = None, max_bytes: int = None):
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("SESSION_MAX_COUNT", "1000"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("SESSION_MAX_BYTES", str(512 * 1024 * 1024)))
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._sizes: Dict[str, Dict[str, int]] = {}
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        self.evictions = {"expired": 0, "lru": 0, "size": 0}
 
     def create_session(self) -> str:
         session_id = str(uuid.uuid4())
-        self._sessions[session_id] = {
-            "history": [],
-            "data": None,
-            "prediction": None,
-            "optimization": None
-        }
+        with self._lock:
+            self._expire_idle()
+            state = _new_session_state()
+            self._sessions[session_id] = state
+            self._last_access[session_id] = time.time()
+            self._sizes[session_id] = {key: _estimate_size(value) for key, value in state.items()}
+            self._total_bytes += sum(self._sizes[session_id].values())
+            while len(self._sessions) > self.max_sessions:
+                self._evict_oldest("lru")
         return session_id
 
     def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        return self._sessions.get(session_id)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - self._last_access[session_id] > self.ttl_seconds:
+                self._remove(session_id)
+                self.evictions["expired"] += 1
+                return None
+            self._touch(session_id)
+            return session
 
     def update_session(self, session_id: str, key: str, value: Any):
-        if session_id in self._sessions:
+        with self._lock:
+            if session_id not in self._sessions:
+                return
             self._sessions[session_id][key] = value
+            size = _estimate_size(value)
+            self._total_bytes += size - self._sizes[session_id].get(key, 0)
+            self._sizes[session_id][key] = size
+            self._touch(session_id)
+            # Over budget: drop least recently used sessions, never the one being written
+            while self._total_bytes > self.max_bytes and len(self._sessions) > 1:
+                self._evict_oldest("size")
 
-class MemoryBank:
-    def __init__(self):
-        self._store: Dict[str, Any] = {
-            "company_profiles": {},
-            "past_emissions": []
+    def delete_session(self, session_id: str):
+        with self._lock:
+            if session_id in self._sessions:
+                self._remove(session_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "bytes": self._total_bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "evictions": dict(self.evictions),
+            }
+
+    def _touch(self, session_id: str):
+        self._last_access[session_id] = time.time()
+        self._sessions.move_to_end(session_id)
+
+    def _expire_idle(self):
+        # Sessions are kept in access order, so expired ones are all at the front
+        cutoff = time.time() - self.ttl_seconds
+        while self._sessions:
+            oldest = next(iter(self._sessions))
+            if self._last_access[oldest] > cutoff:
+                break
+            self._remove(oldest)
+            self.evictions["expired"] += 1
+
+    def _evict_oldest(self, reason: str):
+        self._remove(next(iter(self._sessions)))
+        self.evictions[reason] += 1
+
+    def _remove(self, session_id: str):
+        del self._sessions[session_id]
+        del self._last_access[session_id]
+        self._total_bytes -= sum(self._sizes.pop(session_id).values())
+
+# Values that can be the size of an upload: stored in their own rows and unpickled only when read
+LAZY_SESSION_KEYS = ("data_frame", "batch_prediction")
+_UNLOADED = object()
+
+class _SessionView(dict):
+    """Session state whose large values are fetched from the store on first access"""
+
+    def __init__(self, state: Dict[str, Any], loader):
+        super().__init__(state)
+        self._loader = loader
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if value is _UNLOADED:
+            value = self._loader(key)
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error, so workers don't interleave writes"""
+
+    def __init__(self, db: sqlite3.Connection):
+        self._db = db
+
+    def __enter__(self):
+        self._db.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        self._db.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+        return False
+
+class SQLiteSessionService(SessionStore):
+    """
+    Session store in a SQLite WAL file, shared by every uvicorn worker on the host.
+    Each session value is pickled into its own row, so an update writes only that key and a
+    read skips the large values (LAZY_SESSION_KEYS) until they are used.
+    TTL, count and byte limits are enforced on write.
+    """
+
+    def __init__(self, db_path: str, max_sessions: int = None, ttl_seconds: float = None, max_bytes: int = None):
+        self.db_path = db_path
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("SESSION_MAX_COUNT", "1000"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("SESSION_MAX_BYTES", str(512 * 1024 * 1024)))
+        self._lock = threading.Lock()
+        self.evictions = {"expired": 0, "lru": 0, "size": 0}
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        if db_path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS session_index (
+                session_id TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_session_index_last_access ON session_index (last_access);
+            CREATE TABLE IF NOT EXISTS session_values (
+                session_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (session_id, key)
+            );
+        """)
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._db)
+
+    def _delete_where(self, condition: str, params=()) -> int:
+        """Delete the sessions selected by a condition on session_index; returns how many"""
+        ids = [row[0] for row in self._db.execute(f"SELECT session_id FROM session_index WHERE {condition}", params)]
+        if ids:
+            self._db.executemany("DELETE FROM session_values WHERE session_id = ?", [(i,) for i in ids])
+            self._db.executemany("DELETE FROM session_index WHERE session_id = ?", [(i,) for i in ids])
+        return len(ids)
+
+    def create_session(self) -> str:
+        session_id = str(uuid.uuid4())
+        values = [(session_id, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+                  for key, value in _new_session_state().items()]
+        size = sum(len(blob) for _, _, blob in values)
+        now = time.time()
+        with self._lock, self._transaction():
+            self.evictions["expired"] += self._delete_where("last_access < ?", (now - self.ttl_seconds,))
+            self._db.execute("INSERT INTO session_index VALUES (?, ?, ?)", (session_id, size, now))
+            self._db.executemany("INSERT INTO session_values VALUES (?, ?, ?, ?)",
+                                 [(sid, key, blob, len(blob)) for sid, key, blob in values])
+            self.evictions["lru"] += self._delete_where(
+                "session_id IN (SELECT session_id FROM session_index ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            )
+        return session_id
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        placeholders = ", ".join("?" for _ in LAZY_SESSION_KEYS)
+        with self._lock:
+            row = self._db.execute("SELECT last_access FROM session_index WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > self.ttl_seconds:
+                with self._transaction():
+                    self._delete_where("session_id = ?", (session_id,))
+                self.evictions["expired"] += 1
+                return None
+            self._db.execute("UPDATE session_index SET last_access = ? WHERE session_id = ?", (now, session_id))
+            rows = self._db.execute(
+                f"SELECT key, CASE WHEN key IN ({placeholders}) THEN NULL ELSE value END "
+                f"FROM session_values WHERE session_id = ?", (*LAZY_SESSION_KEYS, session_id)
+            ).fetchall()
+        state = {key: _UNLOADED if blob is None else pickle.loads(blob) for key, blob in rows}
+        return _SessionView(state, lambda key: self._load_value(session_id, key))
+
+    def _load_value(self, session_id: str, key: str) -> Any:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM session_values WHERE session_id = ? AND key = ?", (session_id, key)
+            ).fetchone()
+        # Evicted between the read and this access
+        return pickle.loads(row[0]) if row is not None else None
+
+    def update_session(self, session_id: str, key: str, value: Any):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._transaction():
+            if self._db.execute("SELECT 1 FROM session_index WHERE session_id = ?", (session_id,)).fetchone() is None:
+                return
+            self._db.execute("INSERT OR REPLACE INTO session_values VALUES (?, ?, ?, ?)", (session_id, key, blob, len(blob)))
+            self._db.execute(
+                "UPDATE session_index SET last_access = ?, "
+                "size = (SELECT SUM(size) FROM session_values WHERE session_id = ?) WHERE session_id = ?",
+                (time.time(), session_id, session_id)
+            )
+            self._enforce_byte_budget(session_id)
+
+    def delete_session(self, session_id: str):
+        with self._lock, self._transaction():
+            self._delete_where("session_id = ?", (session_id,))
+
+    def _enforce_byte_budget(self, keep_session_id: str):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM session_index").fetchone()[0]
+        while total > self.max_bytes:
+            oldest = self._db.execute(
+                "SELECT session_id, size FROM session_index WHERE session_id != ? ORDER BY last_access LIMIT 1",
+                (keep_session_id,)
+            ).fetchone()
+            if oldest is None:
+                break
+            self._delete_where("session_id = ?", (oldest[0],))
+            self.evictions["size"] += 1
+            total -= oldest[1]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM session_index").fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": count,
+            "bytes": total,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "evictions": dict(self.evictions),
         }
 
+def create_session_service() -> SessionStore:
+    """Pick the session backend from SESSION_BACKEND (memory | sqlite)"""
+    backend = os.getenv("SESSION_BACKEND", "memory")
+    if backend == "sqlite":
+        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return SQLiteSessionService(os.getenv("SESSION_DB_PATH", os.path.join(backend_dir, "sessions.db")))
+    return InMemorySessionService()
+
+class MemoryBank:
+    """
+    Long-term memory backed by SQLite. Emission records are buffered and written in
+    batches, and every aggregate runs as an indexed SQL query rather than a Python scan.
+    A background thread does the inserts: it is woken when a batch fills and flushes a buffer
+    that stays idle for flush_interval seconds, so request threads only append to the buffer.
+    """
+
+    def __init__(self, db_path: str = ":memory:", batch_size: int = 1000, flush_interval: float = 1.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.time()
+        # _lock guards the buffer only; _db_lock serializes use of the connection
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        if db_path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS emissions (
+                id INTEGER PRIMARY KEY,
+                session_id TEXT,
+                company TEXT,
+                ts REAL NOT NULL,
+                emission REAL NOT NULL,
+                input TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_emissions_session_ts ON emissions (session_id, ts);
+            CREATE INDEX IF NOT EXISTS idx_emissions_company_ts ON emissions (company, ts);
+            CREATE INDEX IF NOT EXISTS idx_emissions_ts ON emissions (ts);
+            CREATE INDEX IF NOT EXISTS idx_emissions_emission ON emissions (emission);
+            CREATE INDEX IF NOT EXISTS idx_emissions_company_emission ON emissions (company, emission);
+            CREATE TABLE IF NOT EXISTS company_profiles (name TEXT PRIMARY KEY, profile TEXT NOT NULL);
+        """)
+
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_periodically, name="memory-bank-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while not self._stop.is_set():
+            # Woken early when a writer fills a batch; otherwise flushes a buffer that went idle
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Memory bank flush failed: %s", e)
+
+    def close(self):
+        """Stop the background flusher and write out whatever is still buffered"""
+        self._stop.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
     def save_profile(self, company_name: str, profile: Dict):
-        self._store["company_profiles"][company_name] = profile
+        with self._db_lock:
+            self._db.execute("INSERT OR REPLACE INTO company_profiles VALUES (?, ?)", (company_name, json.dumps(profile)))
 
     def save_emission_record(self, record: Dict):
-        self._store["past_emissions"].append(record)
-        
+        self.save_emission_records([record])
+
+    def save_emission_records(self, records):
+        """Buffer records; they reach disk in one transaction per batch"""
+        now = time.time()
+        self._buffer_rows([(
+            r.get("session_id"),
+            r.get("company"),
+            r.get("timestamp", now),
+            float(r["emission"]),
+            r["input"] if isinstance(r.get("input"), str) else json.dumps(r.get("input"), default=float),
+        ) for r in records], now)
+
+    def save_emission_batch(self, inputs: List[str], emissions, session_id: str = None, company: str = None):
+        """Rows of one scored batch (inputs already JSON) without building a dict per row"""
+        now = time.time()
+        n = len(inputs)
+        self._buffer_rows(list(zip(itertools.repeat(session_id, n), itertools.repeat(company, n), itertools.repeat(now, n),
+                                   np.asarray(emissions, dtype=np.float64).tolist(), inputs)), now)
+
+    def _buffer_rows(self, rows: List[tuple], now: float):
+        # Writers only touch the buffer; the insert itself runs on the flusher thread when there is one
+        with self._lock:
+            self._buffer.extend(rows)
+            due = len(self._buffer) >= self.batch_size or now - self._last_flush >= self.flush_interval
+        if due:
+            if self._flusher is not None:
+                self._wake.set()
+            else:
+                self.flush()
+
+    def flush(self):
+        with self._db_lock:
+            self._flush_db_locked()
+
+    def _flush_db_locked(self):
+        # Swap the buffer out under the short lock so writers never wait on SQLite
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.time()
+        if rows:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO emissions (session_id, company, ts, emission, input) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._db.execute("COMMIT")
+
+    def _query(self, sql: str, params=()):
+        # Reads see everything written so far, including the unflushed buffer
+        with self._db_lock:
+            self._flush_db_locked()
+            return self._db.execute(sql, params).fetchall()
+
     def get_stats(self):
+        total = self._query("SELECT COUNT(*) FROM emissions")[0][0]
+        companies = [row[0] for row in self._query("SELECT name FROM company_profiles ORDER BY name")]
         return {
-            "total_records": len(self._store["past_emissions"]),
-            "companies": list(self._store["company_profiles"].keys())
+            "total_records": total,
+            "companies": companies
         }
+
+    def company_totals(self, limit: int = 100) -> List[Dict]:
+        rows = self._query(
+            "SELECT company, COUNT(*), SUM(emission), AVG(emission) FROM emissions "
+            "GROUP BY company ORDER BY SUM(emission) DESC LIMIT ?", (limit,)
+        )
+        return [{"company": r[0], "records": r[1], "total_emission_kg": r[2], "mean_emission_kg": r[3]} for r in rows]
+
+    def emission_trend(self, start: float = None, end: float = None, bucket_seconds: float = 86400,
+                       company: str = None) -> List[Dict]:
+        if not bucket_seconds > 0:
+            raise ValueError("bucket_seconds must be positive")
+        where, params = self._filters(start, end, company)
+        rows = self._query(
+            f"SELECT CAST(ts / ? AS INTEGER) AS bucket, COUNT(*), SUM(emission), AVG(emission) FROM emissions "
+            f"{where} GROUP BY bucket ORDER BY bucket", (bucket_seconds, *params)
+        )
+        return [{"bucket_start": r[0] * bucket_seconds, "records": r[1], "total_emission_kg": r[2],
+                 "mean_emission_kg": r[3]} for r in rows]
+
+    def emission_percentiles(self, percentiles=(50, 90, 99), start: float = None, end: float = None,
+                             company: str = None) -> Dict[str, Optional[float]]:
+        """Nearest-rank percentiles, each one an indexed ORDER BY ... OFFSET lookup"""
+        where, params = self._filters(start, end, company)
+        count = self._query(f"SELECT COUNT(*) FROM emissions {where}", params)[0][0]
+        result = {}
+        for p in percentiles:
+            if count == 0:
+                result[f"p{p:g}"] = None
+                continue
+            rank = min(count - 1, max(0, int(np.ceil(p / 100 * count)) - 1))
+            row = self._query(f"SELECT emission FROM emissions {where} ORDER BY emission LIMIT 1 OFFSET ?", (*params, rank))
+            result[f"p{p:g}"] = row[0][0]
+        return result
+
+    @staticmethod
+    def _filters(start: float = None, end: float = None, company: str = None):
+        clauses, params = [], []
+        if company is not None:
+            clauses.append("company = ?")
+            params.append(company)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", tuple(params)
@@ -0,0 +1,197 @@
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; covers sub-millisecond model calls up to slow LLM/report work
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _label_key(labels: Dict[str, str]) -> Tuple:
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key: Tuple, extra: Tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and a few additions (the registry holds the lock)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Trace:
+    """Spans recorded for one request while tracing is on; rendered as a Server-Timing header"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List[Tuple[str, float]] = []
+
+    def server_timing(self) -> str:
+        totals: Dict[str, float] = {}
+        for name, seconds in self.spans:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return ", ".join(f"{name.replace(' ', '_')};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
+
+# Set by the HTTP middleware; copied into asyncio.to_thread workers along with the rest of the context
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+class MetricsRegistry:
+    """
+    In-process counters and latency histograms exposed in the Prometheus text format.
+    Gauges that mirror other services' stats are read from collectors at scrape time.
+    """
+
+    def __init__(self, namespace: str = "carbon"):
+        self.namespace = namespace
+        self._histograms: Dict[str, Dict[Tuple, Histogram]] = {}
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Dict[str, Dict[Tuple, float]]]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, stage: str, agent: str = "pipeline"):
+        """Times a pipeline stage into stage_duration_seconds and the current trace, if any"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe("stage_duration_seconds", elapsed, stage=stage, agent=agent)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.spans.append((stage, elapsed))
+
+    def timed(self, stage: str, agent: str = "pipeline"):
+        """Decorator form of timer() for plain and async functions"""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(stage, agent):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage, agent):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def register_collector(self, collector: Callable[[], Dict[str, Dict[Tuple, float]]]):
+        """collector() returns {gauge_name: {label_key: value}}; called on every scrape"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: (list(h.buckets), list(h.counts), h.sum, h.count) for key, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+
+        for name, series in sorted(counters.items()):
+            full_name = f"{self.namespace}_{name}"
+            self._header(lines, name, full_name, "counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{full_name}{_format_labels(key)} {value}")
+
+        for name, series in sorted(histograms.items()):
+            full_name = f"{self.namespace}_{name}"
+            self._header(lines, name, full_name, "histogram")
+            for key, (buckets, counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{full_name}_bucket{_format_labels(key, (('le', bound),))} {cumulative}")
+                lines.append(f"{full_name}_bucket{_format_labels(key, (('le', '+Inf'),))} {count}")
+                lines.append(f"{full_name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{full_name}_count{_format_labels(key)} {count}")
+
+        for collector in self._collectors:
+            try:
+                gauges = collector()
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+                continue
+            for name, series in gauges.items():
+                full_name = f"{self.namespace}_{name}"
+                self._header(lines, name, full_name, "gauge")
+                for key, value in series.items():
+                    lines.append(f"{full_name}{_format_labels(key)} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: List[str], name: str, full_name: str, kind: str):
+        if name in self._help:
+            lines.append(f"# HELP {full_name} {self._help[name]}")
+        lines.append(f"# TYPE {full_name} {kind}")
+
+def start_trace(traceparent: Optional[str] = None) -> Tuple[Trace, contextvars.Token]:
+    """Starts a request trace, continuing the trace id of a W3C traceparent header when given"""
+    trace_id = uuid.uuid4().hex
+    if traceparent:
+        parts = traceparent.split("-")
+        if len(parts) == 4 and len(parts[1]) == 32:
+            trace_id = parts[1]
+    trace = Trace(trace_id)
+    return trace, _current_trace.set(trace)
+
+def end_trace(token: contextvars.Token):
+    _current_trace.reset(token)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+# TRACE_REQUESTS=1 traces every request; otherwise only requests sending a traceparent header
+TRACE_ALL_REQUESTS = os.getenv("TRACE_REQUESTS", "0") == "1"
+
+# Process-wide registry shared by the agents and services
+metrics = MetricsRegistry()
+metrics.describe("stage_duration_seconds", "Time spent per pipeline stage and agent")
+metrics.describe("http_request_duration_seconds", "End-to-end HTTP request latency by route")
+metrics.describe("http_requests_total", "HTTP requests by route and status code")
+metrics.describe("llm_calls_total", "LLM calls by outcome")
+metrics.describe("fallbacks_total", "Heuristic fallbacks used instead of an LLM answer, by kind")
+metrics.describe("errors_total", "Errors by stage")
+metrics.describe("cache_hit_ratio", "Hit ratio per cache since startup")
+metrics.describe("session_store_bytes", "Estimated bytes held by the session store")
@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILENAME = "model.pkl"
+FOREST_DIRNAME = "model.forest"
+VERSION_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+class ModelRegistry:
+    """
+    Local, directory-based model registry:
+
+        <root>/<version>/model.pkl       pickled estimator
+        <root>/<version>/model.forest/   mmap-able ForestEngine export
+        <root>/<version>/metadata.json
+        <root>/ACTIVE, <root>/CANDIDATE  pointer files naming a version
+
+    Versions are published with a directory rename and pointers are replaced with
+    os.replace, so readers never see a half-written version or pointer.
+    """
+
+    def __init__(self, root: str = None):
+        if root is None:
+            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            root = os.getenv("MODEL_REGISTRY_DIR", os.path.join(base_dir, "ml", "models", "registry"))
+        self.root = root
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _version_dir(self, version: str) -> str:
+        if not VERSION_PATTERN.match(version or ""):
+            raise ValueError(f"Invalid model version {version!r}")
+        return os.path.join(self.root, version)
+
+    def model_path(self, version: str) -> str:
+        return os.path.join(self._version_dir(version), MODEL_FILENAME)
+
+    def exists(self, version: str) -> bool:
+        return os.path.exists(os.path.join(self._version_dir(version), "metadata.json"))
+
+    def versions(self) -> List[Dict]:
+        if not os.path.isdir(self.root):
+            return []
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name, "metadata.json")
+            if not name.startswith(".") and os.path.exists(path):
+                with open(path) as f:
+                    found.append(json.load(f))
+        return sorted(found, key=lambda m: m.get("created_at", 0))
+
+    def register(self, model_path: str, version: str = None, metadata: Dict = None) -> str:
+        """Copy a trained pickle (and its .forest export, building one if missing) in as a new version"""
+        from services.forest_engine import ForestEngine, file_digest
+
+        version = version or time.strftime("%Y%m%d-%H%M%S")
+        target = self._version_dir(version)
+        if os.path.exists(target):
+            raise ValueError(f"Model version {version} already exists")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(model_path)
+
+        os.makedirs(self.root, exist_ok=True)
+        staging = os.path.join(self.root, f".staging-{version}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(staging)
+        try:
+            shutil.copy2(model_path, os.path.join(staging, MODEL_FILENAME))
+            forest = os.path.splitext(model_path)[0] + ".forest"
+            if ForestEngine.is_export_of(forest, model_path):
+                shutil.copytree(forest, os.path.join(staging, FOREST_DIRNAME))
+            else:
+                import joblib
+                model = joblib.load(model_path)
+                if hasattr(model, "estimators_"):
+                    ForestEngine.from_model(model).save(os.path.join(staging, FOREST_DIRNAME),
+                                                        source_digest=file_digest(model_path))
+
+            with open(os.path.join(staging, "metadata.json"), "w") as f:
+                json.dump({**(metadata or {}), "version": version, "created_at": time.time(),
+                           "source": os.path.abspath(model_path)}, f, indent=2)
+            # Publish: the version appears complete or not at all
+            os.rename(staging, target)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        logger.info("Registered model version %s", version)
+        return version
+
+    def _read_pointer(self, name: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, name)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _write_pointer(self, name: str, version: Optional[str]):
+        path = os.path.join(self.root, name)
+        if version is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        if not self.exists(version):
+            raise ValueError(f"Unknown model version {version}")
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "w") as f:
+            f.write(version)
+        os.replace(tmp, path)
+
+    def active_version(self) -> Optional[str]:
+        return self._read_pointer("ACTIVE")
+
+    def candidate_version(self) -> Optional[str]:
+        return self._read_pointer("CANDIDATE")
+
+    def activate(self, version: str):
+        self._write_pointer("ACTIVE", version)
+
+    def set_candidate(self, version: Optional[str]):
+        self._write_pointer("CANDIDATE", version)
+
+    def active_model_path(self) -> Optional[str]:
+        version = self.active_version()
+        return self.model_path(version) if version else None
+
+    def watch(self, on_change: Callable[[str], None], interval: float = None):
+        """
+        Poll the ACTIVE pointer from a background thread and call on_change(version) when it moves,
+        so every worker process follows an activation made through any one of them (within one
+        interval). MODEL_REGISTRY_POLL_SECONDS=0 turns polling off: activations then only reach
+        the worker that served them, which is fine for a single-worker deployment.
+        """
+        if interval is None:
+            interval = float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "5"))
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        # Read before the thread starts so an activation right after watch() is not missed
+        current = self.active_version()
+
+        def run():
+            nonlocal current
+            while not self._stop.wait(interval):
+                version = self.active_version()
+                if version and version != current:
+                    try:
+                        on_change(version)
+                        current = version
+                    except Exception as e:
+                        logger.error("Failed to switch to model version %s: %s", version, e)
+
+        self._watcher = threading.Thread(target=run, name="model-registry-watch", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
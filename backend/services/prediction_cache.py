@@ -0,0 +1,156 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+def parse_quantum(spec: str, feature_names: List[str]) -> np.ndarray:
+    """'5' applies one step to every feature; 'energy_usage_kwh=10,company_size=1' sets steps per feature (0 = exact)"""
+    steps = np.zeros(len(feature_names), dtype=np.float64)
+    spec = (spec or "").strip()
+    if not spec:
+        return steps
+    if "=" not in spec:
+        steps[:] = float(spec)
+        return steps
+    for part in spec.split(","):
+        name, value = part.split("=", 1)
+        steps[feature_names.index(name.strip())] = float(value)
+    return steps
+
+class PredictionCache:
+    """
+    Bounded LRU of predictions keyed by the (optionally quantized) float32 feature vector.
+    Batches are deduplicated with np.unique so only unique rows that miss get scored.
+    Entries belong to one loaded model; binding a different model clears them.
+    Large batches of mostly unique, unseen rows skip the LRU (they would only evict the working set).
+    """
+
+    # Unique keys probed before deciding whether a mostly-unique batch is worth caching
+    PROBE_KEYS = 256
+
+    def __init__(self, max_entries: int = None, quantum: str = None, bypass_unique_fraction: float = None,
+                 bypass_min_rows: int = None):
+        if max_entries is None:
+            max_entries = int(os.getenv("PREDICTION_CACHE_SIZE", "100000"))
+        if quantum is None:
+            quantum = os.getenv("PREDICTION_CACHE_QUANTUM", "")
+        if bypass_unique_fraction is None:
+            bypass_unique_fraction = float(os.getenv("PREDICTION_CACHE_BYPASS_UNIQUE", "0.5"))
+        if bypass_min_rows is None:
+            bypass_min_rows = int(os.getenv("PREDICTION_CACHE_BYPASS_MIN_ROWS", "1000"))
+        self.max_entries = max_entries
+        self.bypass_unique_fraction = bypass_unique_fraction
+        self.bypass_min_rows = bypass_min_rows
+        self.quantum_spec = quantum
+        self._steps: Optional[np.ndarray] = None
+        self._entries: "OrderedDict[bytes, float]" = OrderedDict()
+        self._owner = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "bypassed_rows": 0}
+
+    def _bind(self, owner, feature_names: List[str]):
+        # Called with the lock held; a new model object means new predictions
+        if owner is not self._owner:
+            if self._owner is not None:
+                self.stats["invalidations"] += 1
+            self._entries.clear()
+            self._owner = owner
+            self._steps = parse_quantum(self.quantum_spec, feature_names)
+
+    def quantize(self, matrix: np.ndarray) -> np.ndarray:
+        matrix = np.asarray(matrix, dtype=np.float32)
+        steps = self._steps
+        if steps is None or not steps.any():
+            return np.ascontiguousarray(matrix)
+        safe = np.where(steps > 0, steps, 1.0)
+        snapped = np.where(steps > 0, np.round(matrix / safe) * safe, matrix)
+        return np.ascontiguousarray(snapped, dtype=np.float32)
+
+    def predict(self, owner, feature_names: List[str], matrix: np.ndarray,
+                score: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+        """Predictions for every row of matrix; score() only sees the unique quantized rows that missed"""
+        n_rows = len(matrix)
+        if n_rows == 0:
+            return np.zeros(0, dtype=np.float64)
+        with self._lock:
+            self._bind(owner, feature_names)
+        quantized = self.quantize(matrix)
+        row_keys = quantized.view(np.dtype((np.void, quantized.dtype.itemsize * quantized.shape[1]))).ravel()
+        unique_keys, first_index, inverse = np.unique(row_keys, return_index=True, return_inverse=True)
+
+        if n_rows >= self.bypass_min_rows and len(unique_keys) > self.bypass_unique_fraction * n_rows \
+                and not self._probe_hits(unique_keys):
+            # Still deduplicated, but no per-row lookups or inserts
+            with self._lock:
+                self.stats["bypassed_rows"] += n_rows
+            return np.asarray(score(quantized[first_index]), dtype=np.float64)[inverse]
+
+        values = np.empty(len(unique_keys), dtype=np.float64)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(unique_keys):
+                cached = self._entries.get(key.tobytes())
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._entries.move_to_end(key.tobytes())
+                    values[i] = cached
+        missing = np.asarray(missing, dtype=np.intp)
+
+        if len(missing):
+            # Score the quantized vectors so a bucket's value doesn't depend on which row arrived first
+            scored = np.asarray(score(quantized[first_index[missing]]), dtype=np.float64)
+            values[missing] = scored
+            with self._lock:
+                if owner is self._owner:
+                    for i, value in zip(missing, scored):
+                        self._entries[unique_keys[i].tobytes()] = float(value)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+
+        # A row is a hit unless it caused a model call; in-batch duplicates of a miss count as hits
+        with self._lock:
+            self.stats["misses"] += len(missing)
+            self.stats["hits"] += n_rows - len(missing)
+        return values[inverse]
+
+    def _probe_hits(self, unique_keys: np.ndarray) -> bool:
+        """Whether an evenly spaced sample of the batch's keys finds anything cached (e.g. a re-upload)"""
+        sample = unique_keys[np.linspace(0, len(unique_keys) - 1, min(self.PROBE_KEYS, len(unique_keys))).astype(np.intp)]
+        with self._lock:
+            return any(key.tobytes() in self._entries for key in sample)
+
+    def predict_one(self, owner, feature_names: List[str], vector, score: Callable[[np.ndarray], float]) -> float:
+        """Single-row path without np.unique"""
+        with self._lock:
+            self._bind(owner, feature_names)
+        quantized = self.quantize(np.asarray([vector], dtype=np.float32))
+        key = quantized.tobytes()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return cached
+        value = float(score(quantized[0]))
+        with self._lock:
+            self.stats["misses"] += 1
+            if owner is self._owner:
+                self._entries[key] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "quantum": self.quantum_spec or None,
+                "model_version": getattr(self._owner, "version", None),
+                "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+            }
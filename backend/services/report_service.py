@@ -2,19 +2,250 @@ from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
+from reportlab.graphics.shapes import Drawing
+from reportlab.graphics.charts.barcharts import VerticalBarChart
 from models.schemas import EmissionOutput, OptimizationResponse
+from services.metrics_service import metrics
+from services.attribution import FEATURE_LABELS
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+import hashlib
 import io
+import multiprocessing
+import os
+import re
+import threading
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+# Per-process service used by the batch rendering pool
+_worker_service = None
+
+def _render_facility(facility: Dict) -> Tuple[bytes, float]:
+    """PDF bytes and render seconds; a worker's own metrics never reach /metrics, so the parent records them"""
+    global _worker_service
+    if _worker_service is None:
+        _worker_service = ReportService(cache_size=0)
+    prediction, optimization = facility_models(facility)
+    start = time.perf_counter()
+    pdf_bytes = _worker_service._render(str(facility["name"]), prediction, optimization)
+    return pdf_bytes, time.perf_counter() - start
+
+def _render_consolidated(company_name: str, facilities: List[Dict]) -> Tuple[bytes, float]:
+    """Consolidated PDF bytes and render seconds, built in a pool worker"""
+    global _worker_service
+    if _worker_service is None:
+        _worker_service = ReportService(cache_size=0)
+    start = time.perf_counter()
+    pdf_bytes = _worker_service._render_consolidated(company_name, facilities)
+    return pdf_bytes, time.perf_counter() - start
+
+def facility_models(facility: Dict):
+    """Rebuild the schema objects from a plain (picklable, cheap) facility payload"""
+    prediction = EmissionOutput(emission_kg=facility["emission_kg"], explanation=facility["explanation"],
+                                baseline_kg=facility.get("baseline_kg"), drivers=facility.get("drivers", []))
+    optimization = OptimizationResponse(suggestions=facility["suggestions"], total_potential_savings=facility["total_potential_savings"])
+    return prediction, optimization
+
+class _ZipStream(io.RawIOBase):
+    """Write-only sink for ZipFile that hands back whatever has been written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
 
 class ReportService:
+    def __init__(self, cache_size: int = None):
+        # Style objects are immutable once built, so one set serves every render
+        self.styles = getSampleStyleSheet()
+        self.table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ])
+        
+        # Rendered PDFs keyed by a hash of their inputs; dashboards re-download unchanged reports
+        self.cache_size = cache_size if cache_size is not None else int(os.getenv("REPORT_CACHE_SIZE", "128"))
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+        self._pool = None
+
+    @staticmethod
+    def content_key(company_name: str, prediction: EmissionOutput, optimization: OptimizationResponse) -> str:
+        digest = hashlib.sha256()
+        for part in (company_name, prediction.model_dump_json(), optimization.model_dump_json()):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
     def generate_pdf(self, company_name: str, prediction: EmissionOutput, optimization: OptimizationResponse) -> bytes:
+        key = self.content_key(company_name, prediction, optimization)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return cached
+            self.stats["misses"] += 1
+        
+        pdf_bytes = self._render(company_name, prediction, optimization)
+        with self._lock:
+            self._cache[key] = pdf_bytes
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return pdf_bytes
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                workers = int(os.getenv("REPORT_WORKERS", str(os.cpu_count() or 1)))
+                context = multiprocessing.get_context(os.getenv("REPORT_START_METHOD", "spawn"))
+                self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            return self._pool
+
+    def iter_batch_zip(self, facilities: List[Dict], chunksize: int = 8) -> Iterator[bytes]:
+        """
+        One PDF per facility, rendered across a process pool and streamed as a ZIP:
+        each archive member is sent as soon as it (and everything before it) is rendered.
+        """
+        sink = _ZipStream()
+        used_names = set()
+        with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+            pdfs = self._get_pool().map(_render_facility, facilities, chunksize=chunksize)
+            for facility, (pdf_bytes, seconds) in zip(facilities, pdfs):
+                metrics.observe("stage_duration_seconds", seconds, stage="report_render", agent="report")
+                archive.writestr(self._archive_name(facility["name"], used_names), pdf_bytes)
+                data = sink.drain()
+                if data:
+                    yield data
+        yield sink.drain()
+
+    @staticmethod
+    def _archive_name(name: str, used_names: set) -> str:
+        base = re.sub(r"[^A-Za-z0-9._-]+", "_", str(name)).strip("_") or "facility"
+        candidate, n = f"{base}.pdf", 1
+        while candidate in used_names:
+            n += 1
+            candidate = f"{base}_{n}.pdf"
+        used_names.add(candidate)
+        return candidate
+
+    def generate_consolidated_pdf(self, company_name: str, facilities: List[Dict]) -> bytes:
+        """One PDF for every facility, rendered in the report process pool so it never holds this process's GIL"""
+        pdf_bytes, seconds = self._get_pool().submit(_render_consolidated, company_name, facilities).result()
+        metrics.observe("stage_duration_seconds", seconds, stage="report_consolidated", agent="report")
+        return pdf_bytes
+
+    def _render_consolidated(self, company_name: str, facilities: List[Dict], chart_limit: int = 20) -> bytes:
+        """One PDF: portfolio summary table and chart, then a section per facility"""
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=letter)
-        styles = getSampleStyleSheet()
+        styles = self.styles
+        story = []
+
+        total = sum(f["emission_kg"] for f in facilities)
+        total_savings = sum(f["total_potential_savings"] for f in facilities)
+        story.append(Paragraph(f"Sustainability Report for {escape(company_name)}", styles['Title']))
+        story.append(Spacer(1, 12))
+        story.append(Paragraph("Portfolio Summary", styles['Heading2']))
+        story.append(Paragraph(
+            f"{len(facilities)} facilities with a total estimated emission of <b>{total:.2f} kg CO2e</b> "
+            f"and <b>{total_savings:.2f} kg</b> of identified savings.", styles['Normal']))
+        story.append(Spacer(1, 12))
+
+        top = sorted(facilities, key=lambda f: f["emission_kg"], reverse=True)[:chart_limit]
+        if top:
+            story.append(self._emission_chart(top))
+            story.append(Spacer(1, 12))
+
+        summary = [["Facility", "Emission (kg)", "Potential Savings (kg)"]]
+        for f in facilities:
+            summary.append([str(f["name"]), f"{f['emission_kg']:.2f}", f"{f['total_potential_savings']:.2f}"])
+        summary.append(["TOTAL", f"{total:.2f}", f"{total_savings:.2f}"])
+        t = Table(summary, repeatRows=1)
+        t.setStyle(self.table_style)
+        story.append(t)
+
+        for f in facilities:
+            story.append(Spacer(1, 18))
+            story.append(Paragraph(escape(str(f["name"])), styles['Heading2']))
+            # Explanations and suggestions may be LLM text: escape them so they can't inject ReportLab markup
+            story.append(Paragraph(escape(f["explanation"]), styles['Normal']))
+            story.append(Spacer(1, 6))
+            if f.get("drivers"):
+                story.append(self._drivers_table(f["drivers"], f.get("baseline_kg")))
+                story.append(Spacer(1, 6))
+            rows = [["Category", "Suggestion", "Potential Savings (kg)"]]
+            for opt in f["suggestions"]:
+                rows.append([opt["category"], Paragraph(escape(opt["suggestion"]), styles['Normal']), f"{opt['potential_saving_kg']:.2f}"])
+            rows.append(["TOTAL", "", f"{f['total_potential_savings']:.2f}"])
+            t = Table(rows, colWidths=[80, 280, 120])
+            t.setStyle(self.table_style)
+            story.append(t)
+
+        story.append(Spacer(1, 12))
+        story.append(Paragraph("Generated by Carbon Emission Intelligence Assistant", styles['Italic']))
+        doc.build(story)
+        return buffer.getvalue()
+
+    def _drivers_table(self, drivers: List[Dict], baseline_kg: float = None) -> Table:
+        """Model attribution per feature; the contributions and the baseline add up to the prediction"""
+        rows = [["Driver", "Value", "Contribution (kg)"]]
+        for d in drivers:
+            rows.append([FEATURE_LABELS.get(d["feature"], d["feature"]).capitalize(), f"{d['value']:.2f}",
+                         f"{d['contribution_kg']:+.2f}"])
+        rows.append(["AVERAGE FACILITY", "", f"{baseline_kg:.2f}" if baseline_kg is not None else ""])
+        t = Table(rows, colWidths=[160, 120, 120])
+        t.setStyle(self.table_style)
+        return t
+
+    @staticmethod
+    def _emission_chart(facilities: List[Dict]) -> Drawing:
+        drawing = Drawing(460, 200)
+        chart = VerticalBarChart()
+        chart.x, chart.y, chart.width, chart.height = 40, 40, 400, 140
+        chart.data = [[f["emission_kg"] for f in facilities]]
+        chart.categoryAxis.categoryNames = [str(f["name"])[:12] for f in facilities]
+        chart.categoryAxis.labels.angle = 30
+        chart.categoryAxis.labels.boxAnchor = 'ne'
+        chart.categoryAxis.labels.fontSize = 6
+        chart.valueAxis.valueMin = 0
+        chart.bars[0].fillColor = colors.darkgreen
+        drawing.add(chart)
+        return drawing
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "entries": len(self._cache)}
+
+    @metrics.timed("report_render", agent="report")
+    def _render(self, company_name: str, prediction: EmissionOutput, optimization: OptimizationResponse) -> bytes:
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter)
+        styles = self.styles
         story = []
 
         # Title
         title_style = styles['Title']
-        story.append(Paragraph(f"Sustainability Report for {company_name}", title_style))
+        story.append(Paragraph(f"Sustainability Report for {escape(company_name)}", title_style))
         story.append(Spacer(1, 12))
 
         # Executive Summary
@@ -25,8 +256,12 @@ class ReportService:
 
         # Prediction Details
         story.append(Paragraph("Emission Analysis", styles['Heading2']))
-        story.append(Paragraph(prediction.explanation, styles['Normal']))
+        # The explanation may be LLM text; escape it so stray <, > or & can't break (or restyle) the PDF
+        story.append(Paragraph(escape(prediction.explanation), styles['Normal']))
         story.append(Spacer(1, 12))
+        if prediction.drivers:
+            story.append(self._drivers_table([d.model_dump() for d in prediction.drivers], prediction.baseline_kg))
+            story.append(Spacer(1, 12))
 
         # Optimization Suggestions
         story.append(Paragraph("Optimization Recommendations", styles['Heading2']))
@@ -39,15 +274,7 @@ class ReportService:
         data.append(["TOTAL", "", f"{optimization.total_potential_savings:.2f}"])
 
         t = Table(data)
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        t.setStyle(self.table_style)
         story.append(t)
         story.append(Spacer(1, 12))
 
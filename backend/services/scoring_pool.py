@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Tuple
+
+import numpy as np
+
+# Per-process forest, loaded once by the pool initializer
+_worker_engine = None
+# Shared input blocks this worker has attached to, by name
+_attached = {}
+
+def _init_worker(model_path: str):
+    """Load just the flattened forest (and its feature order); workers never build an agent or LLM client"""
+    global _worker_engine
+    from services.forest_engine import ForestEngine
+    artifact_path = os.path.splitext(model_path)[0] + ".forest"
+    if not os.path.exists(model_path):
+        # Leave the pool usable; scoring reports the missing model per call
+        return
+    if ForestEngine.is_export_of(artifact_path, model_path):
+        _worker_engine = ForestEngine.load(artifact_path, mmap=True)
+    else:
+        # No current export: flatten the pickle once; the estimator itself is not kept
+        import joblib
+        _worker_engine = ForestEngine.from_model(joblib.load(model_path))
+
+def _score_chunk(matrix: np.ndarray, feature_names: List[str]) -> np.ndarray:
+    if _worker_engine is None:
+        raise RuntimeError("Scoring worker has no model loaded")
+    order = _worker_engine.feature_names
+    if order is not None and list(order) != list(feature_names):
+        matrix = matrix[:, [list(feature_names).index(name) for name in order]]
+    return _worker_engine.predict(matrix)
+
+def _score_shared(block_name: str, shape: Tuple[int, int], start: int, stop: int, feature_names: List[str]) -> np.ndarray:
+    """Score rows [start, stop) of a matrix the parent placed in shared memory; no input is pickled"""
+    block = _attached.get(block_name)
+    if block is None:
+        # Attached once per job per worker; the parent owns and unlinks the block
+        block = shared_memory.SharedMemory(name=block_name)
+        for previous in _attached.values():
+            previous.close()
+        _attached.clear()
+        _attached[block_name] = block
+    matrix = np.ndarray(shape, dtype=np.float32, buffer=block.buf)
+    return _score_chunk(matrix[start:stop], feature_names)
+
+def create_scoring_pool(model_path: str, max_workers: int = None) -> ProcessPoolExecutor:
+    """
+    Process pool whose workers each hold the model's ForestEngine.
+    Workers memory-map the exported forest artifact when it is current, so they share its pages.
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv("SCORING_WORKERS", str(os.cpu_count() or 1)))
+    # spawn avoids forking a server process that already runs threads
+    context = multiprocessing.get_context(os.getenv("SCORING_START_METHOD", "spawn"))
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                               initializer=_init_worker, initargs=(model_path,))
@@ -0,0 +1,134 @@
+import logging
+import math
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+class DriftStats:
+    """Running comparison of candidate vs primary predictions (sums only, no per-row history)"""
+
+    def __init__(self):
+        self.count = 0
+        self.sum_primary = 0.0
+        self.sum_candidate = 0.0
+        self.sum_diff = 0.0
+        self.sum_abs_diff = 0.0
+        self.sum_sq_diff = 0.0
+        self.sum_rel_abs_diff = 0.0
+        self.max_abs_diff = 0.0
+
+    def update(self, primary: np.ndarray, candidate: np.ndarray):
+        diff = candidate - primary
+        abs_diff = np.abs(diff)
+        self.count += len(diff)
+        self.sum_primary += float(primary.sum())
+        self.sum_candidate += float(candidate.sum())
+        self.sum_diff += float(diff.sum())
+        self.sum_abs_diff += float(abs_diff.sum())
+        self.sum_sq_diff += float((diff * diff).sum())
+        self.sum_rel_abs_diff += float((abs_diff / np.maximum(np.abs(primary), 1e-9)).sum())
+        if len(diff):
+            self.max_abs_diff = max(self.max_abs_diff, float(abs_diff.max()))
+
+    def to_dict(self) -> Dict:
+        n = self.count
+        return {
+            "rows": n,
+            "mean_primary_kg": self.sum_primary / n if n else None,
+            "mean_candidate_kg": self.sum_candidate / n if n else None,
+            "mean_diff_kg": self.sum_diff / n if n else None,
+            "mean_abs_diff_kg": self.sum_abs_diff / n if n else None,
+            "rmse_kg": math.sqrt(self.sum_sq_diff / n) if n else None,
+            "mean_rel_abs_diff": self.sum_rel_abs_diff / n if n else None,
+            "max_abs_diff_kg": self.max_abs_diff,
+        }
+
+class ShadowScorer:
+    """
+    Scores a sampled fraction of live traffic with a candidate model on a background thread
+    and accumulates drift against the serving model. Requests never wait on it; when the
+    backlog is full, or the scorer has been stopped, new samples are dropped.
+    """
+
+    def __init__(self, candidate, sample_rate: float = None, max_pending: int = None):
+        if sample_rate is None:
+            sample_rate = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))
+        if max_pending is None:
+            max_pending = int(os.getenv("SHADOW_MAX_PENDING", "32"))
+        self.candidate = candidate      # LoadedModel of the candidate version
+        self.sample_rate = sample_rate
+        self.max_pending = max_pending
+        self.drift = DriftStats()
+        self.stats = {"submitted": 0, "dropped": 0, "errors": 0}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+
+    def _reserve(self) -> bool:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.stats["dropped"] += 1
+                return False
+            self._pending += 1
+            self.stats["submitted"] += 1
+            return True
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, data: pd.DataFrame, primary: np.ndarray):
+        # Called on the request path: never let the shadow raise into it
+        try:
+            future = self._executor.submit(self._score, data, primary)
+        except RuntimeError:
+            # Executor already shut down by stop()
+            with self._lock:
+                self.stats["submitted"] -= 1
+                self.stats["dropped"] += 1
+            self._release()
+            return
+        # Runs for cancelled samples too, so pending always returns to zero
+        future.add_done_callback(self._release)
+
+    def observe_record(self, record: Dict, prediction: float):
+        if random.random() >= self.sample_rate or not self._reserve():
+            return
+        self._submit(pd.DataFrame([record]), np.array([prediction], dtype=np.float64))
+
+    def observe_frame(self, data: pd.DataFrame, predictions: np.ndarray):
+        """Samples rows of a batch; the sampled rows are copied so the caller may reuse its buffers"""
+        mask = np.random.random(len(data)) < self.sample_rate
+        if not mask.any() or not self._reserve():
+            return
+        self._submit(data[mask].copy(), np.asarray(predictions, dtype=np.float64)[mask])
+
+    def _score(self, data: pd.DataFrame, primary: np.ndarray):
+        try:
+            candidate = np.asarray(self.candidate.predict_frame(data), dtype=np.float64)
+            with self._lock:
+                self.drift.update(primary, candidate)
+        except Exception as e:
+            with self._lock:
+                self.stats["errors"] += 1
+            logger.warning("Shadow scoring failed: %s", e)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "candidate_version": self.candidate.version,
+                "sample_rate": self.sample_rate,
+                "pending": self._pending,
+                **self.stats,
+                "drift": self.drift.to_dict(),
+            }
+
+    def stop(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,184 @@
+"""
+End-to-end API benchmark: /upload -> /predict -> /optimize -> /generate-report per session,
+driven through an in-process ASGI client with a stubbed LLM, at several concurrency levels
+and upload sizes. Reports p50/p99 latency and throughput per endpoint.
+
+Usage:
+  python benchmarks/bench_api.py [--rows 100 10000] [--concurrency 1 8 32] [--sessions 32]
+                                 [--save-baseline benchmarks/baseline.json]
+                                 [--compare benchmarks/baseline.json --tolerance 0.25]
+
+With --compare the exit status is 1 when any endpoint's p50/p99 grew, or its throughput
+dropped, by more than the tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'backend'))
+sys.path.append(os.path.join(ROOT, 'ml'))
+
+# Keep the app hermetic: no history file, no real LLM, quiet logs
+os.environ.setdefault("MEMORY_BANK_DB", ":memory:")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.pop("GOOGLE_API_KEY", None)
+
+import httpx
+
+import main as api
+from train_model import generate_data
+
+ENDPOINTS = ("/upload", "/predict", "/optimize", "/generate-report")
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+class StubLLM:
+    """Async stand-in for the Gemini client with a fixed latency"""
+
+    def __init__(self, latency: float, text: str):
+        self.latency = latency
+        self.text = text
+
+    async def generate_content_async(self, prompt):
+        await asyncio.sleep(self.latency)
+        return StubResponse(self.text)
+
+def install_stub_llm(latency: float):
+    api.prediction_agent.llm_model = StubLLM(latency, "Emissions are driven mainly by fuel consumption and energy use.")
+    api.optimization_agent.llm_model = StubLLM(latency, json.dumps([
+        {"category": "Fuel", "suggestion": "Move the fleet to electric vehicles.", "potential_saving_kg": 150.0},
+        {"category": "Energy", "suggestion": "Schedule HVAC by occupancy.", "potential_saving_kg": 80.0},
+    ]))
+
+def make_uploads(rows: int, count: int):
+    """Distinct CSV bodies (sliding windows) so the LLM and report caches never hide the work"""
+    df = generate_data(rows + count).drop(columns=["carbon_emission_kg"])
+    return [df.iloc[i:i + rows].to_csv(index=False).encode() for i in range(count)]
+
+async def run_session(client: httpx.AsyncClient, body: bytes, latencies: dict):
+    async def timed(endpoint, **kwargs):
+        start = time.perf_counter()
+        response = await client.post(endpoint, **kwargs)
+        latencies[endpoint].append(time.perf_counter() - start)
+        response.raise_for_status()
+        return response
+
+    upload = await timed("/upload", files={"file": ("bench.csv", body, "text/csv")})
+    headers = {"x-session-id": upload.json()["session_id"]}
+    await timed("/predict", headers=headers)
+    await timed("/optimize", headers=headers)
+    await timed("/generate-report", headers=headers)
+
+async def run_level(uploads, concurrency: int) -> dict:
+    latencies = {endpoint: [] for endpoint in ENDPOINTS}
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        queue = asyncio.Queue()
+        for body in uploads:
+            queue.put_nowait(body)
+
+        async def worker():
+            while not queue.empty():
+                await run_session(client, queue.get_nowait(), latencies)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        wall = time.perf_counter() - start
+
+    result = {"sessions_per_s": len(uploads) / wall, "endpoints": {}}
+    for endpoint, samples in latencies.items():
+        samples = np.asarray(samples)
+        result["endpoints"][endpoint] = {
+            "p50_ms": float(np.percentile(samples, 50) * 1000),
+            "p99_ms": float(np.percentile(samples, 99) * 1000),
+            "requests_per_s": len(samples) / wall,
+        }
+    return result
+
+async def run_all(row_counts, concurrency_levels, sessions: int) -> dict:
+    results = {}
+    for rows in row_counts:
+        # One warm-up session, then a fresh set of uploads for every concurrency level
+        uploads = make_uploads(rows, 1 + sessions * len(concurrency_levels))
+        await run_level(uploads[:1], 1)
+        for i, concurrency in enumerate(concurrency_levels):
+            level = f"rows={rows},c={concurrency}"
+            level_uploads = uploads[1 + i * sessions:1 + (i + 1) * sessions]
+            results[level] = await run_level(level_uploads, concurrency)
+            for endpoint, stats in results[level]["endpoints"].items():
+                print(f"{level:<18}{endpoint:<18}{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['requests_per_s']:>10.1f}")
+            print(f"{level:<18}{'(sessions/s)':<18}{'':>20}{results[level]['sessions_per_s']:>10.1f}")
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for level, current in results.items():
+        previous = baseline.get("results", {}).get(level)
+        if previous is None:
+            continue
+        for endpoint, stats in current["endpoints"].items():
+            before = previous["endpoints"].get(endpoint)
+            if before is None:
+                continue
+            for key in ("p50_ms", "p99_ms"):
+                if stats[key] > before[key] * (1 + tolerance):
+                    regressions.append(f"{level} {endpoint} {key}: {before[key]:.2f} -> {stats[key]:.2f}")
+            if stats["requests_per_s"] < before["requests_per_s"] * (1 - tolerance):
+                regressions.append(f"{level} {endpoint} requests_per_s: {before['requests_per_s']:.1f} -> {stats['requests_per_s']:.1f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 10_000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--sessions", type=int, default=32, help="sessions per (rows, concurrency) level")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per stubbed LLM call")
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--compare")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    install_stub_llm(args.llm_latency)
+
+    print(f"{'level':<18}{'endpoint':<18}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    # Every level runs in one event loop, as the app would in a single uvicorn worker
+    results = asyncio.run(run_all(args.rows, args.concurrency, args.sessions))
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "sessions": args.sessions,
+            "llm_latency_s": args.llm_latency,
+        },
+        "results": results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+if __name__ == "__main__":
+    main()
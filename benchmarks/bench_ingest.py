@@ -0,0 +1,54 @@
+"""
+Ingest throughput benchmark: CSV vs Parquet vs Arrow IPC uploads through
+DataCleaningAgent.read_upload, from file bytes to the cleaned feature matrix.
+
+Usage: python benchmarks/bench_ingest.py [--rows 1000000]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'backend'))
+sys.path.append(os.path.join(ROOT, 'ml'))
+
+from agents.data_agent import DataCleaningAgent
+from train_model import generate_data
+
+def encode(df, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "csv":
+        df.to_csv(buffer, index=False)
+    elif fmt == "parquet":
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), buffer)
+    else:
+        feather.write_feather(df, buffer, compression="uncompressed")
+    return buffer.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    df = generate_data(args.rows)
+    agent = DataCleaningAgent()
+
+    print(f"{'format':<10}{'MB':>8}{'seconds':>10}{'rows/s':>14}")
+    for fmt, filename in (("csv", "upload.csv"), ("parquet", "upload.parquet"), ("arrow", "upload.arrow")):
+        content = encode(df, fmt)
+        best = float("inf")
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            agent.read_upload(io.BytesIO(content), filename)
+            best = min(best, time.perf_counter() - start)
+        print(f"{fmt:<10}{len(content) / 1e6:>8.1f}{best:>10.3f}{args.rows / best:>14,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Scaling benchmark for EmissionPredictionAgent.predict_parallel.
+
+Scores synthetic batches with 1/2/4/8/N worker processes and several chunk sizes,
+against the single-process predict_batch baseline, to pick SCORING_WORKERS and
+SCORING_CHUNK_SIZE for a host.
+Usage: python benchmarks/bench_parallel.py [--rows 10000 100000 1000000] [--chunk-sizes 50000 200000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'backend'))
+sys.path.append(os.path.join(ROOT, 'ml'))
+
+from agents.prediction_agent import EmissionPredictionAgent
+from train_model import generate_data
+
+def worker_counts():
+    n = os.cpu_count() or 1
+    return sorted({w for w in (1, 2, 4, 8, n) if w <= n})
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[50_000, 200_000])
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    args = parser.parse_args()
+
+    agent = EmissionPredictionAgent()
+    if not agent.is_ready:
+        print("Train the model first: cd ml && python train_model.py")
+        return
+
+    workers = args.workers or worker_counts()
+    print(f"{'rows':>10}{'workers':>9}{'chunk':>9}{'seconds':>10}{'rows/s':>14}{'speedup':>9}")
+    for rows in args.rows:
+        X = generate_data(rows).drop('carbon_emission_kg', axis=1)
+
+        start = time.perf_counter()
+        expected = agent.predict_batch(X)
+        baseline = time.perf_counter() - start
+        print(f"{rows:>10,}{'-':>9}{'-':>9}{baseline:>10.2f}{rows / baseline:>14,.0f}{1.0:>9.2f}")
+
+        for n_workers in workers:
+            agent.scoring_pool(n_workers)
+            # Warm the pool so worker start-up and model load are not timed
+            agent.predict_parallel(X.iloc[:2], n_workers=n_workers, chunk_size=1)
+            for chunk_size in args.chunk_sizes:
+                start = time.perf_counter()
+                result = agent.predict_parallel(X, n_workers=n_workers, chunk_size=chunk_size)
+                seconds = time.perf_counter() - start
+                assert np.allclose(result, expected)
+                print(f"{rows:>10,}{n_workers:>9}{chunk_size:>9,}{seconds:>10.2f}{rows / seconds:>14,.0f}{baseline / seconds:>9.2f}")
+    agent.shutdown_pool()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Cold-start benchmark: unpickling the forest with joblib vs memory-mapping the
+array-based artifact exported by ml/train_model.py.
+
+Each measurement runs in a fresh interpreter so imports and page faults are counted.
+Usage: python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATH = os.path.join(ROOT, "ml", "models", "carbon_emission_model.pkl")
+ARTIFACT_PATH = os.path.join(ROOT, "ml", "models", "carbon_emission_model.forest")
+
+ROW = "[1200, 600, 800, 50, 50]"
+
+PICKLE_SNIPPET = f"""
+import time
+start = time.perf_counter()
+import joblib, pandas as pd
+model = joblib.load({MODEL_PATH!r})
+loaded = time.perf_counter()
+model.predict(pd.DataFrame([{ROW}], columns=model.feature_names_in_))
+print(loaded - start, time.perf_counter() - loaded)
+"""
+
+ARTIFACT_SNIPPET = f"""
+import sys, time
+start = time.perf_counter()
+sys.path.append({os.path.join(ROOT, 'backend')!r})
+from services.forest_engine import ForestEngine
+engine = ForestEngine.load({ARTIFACT_PATH!r}, mmap=True)
+loaded = time.perf_counter()
+engine.predict_one({ROW})
+print(loaded - start, time.perf_counter() - loaded)
+"""
+
+def measure(snippet: str, runs: int):
+    load_times, first_predict_times = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True, check=True)
+        load, first = map(float, out.stdout.split())
+        load_times.append(load)
+        first_predict_times.append(first)
+    return statistics.median(load_times), statistics.median(first_predict_times)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if not os.path.exists(MODEL_PATH) or not os.path.exists(ARTIFACT_PATH):
+        print("Train the model first: cd ml && python train_model.py")
+        return
+
+    print(f"{'format':<12}{'load (ms)':>12}{'first predict (ms)':>22}")
+    for name, snippet in (("pickle", PICKLE_SNIPPET), ("mmap arrays", ARTIFACT_SNIPPET)):
+        load, first = measure(snippet, args.runs)
+        print(f"{name:<12}{load * 1000:>12.1f}{first * 1000:>22.2f}")
+
+if __name__ == "__main__":
+    main()
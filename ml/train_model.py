@@ -1,10 +1,5 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_squared_error, r2_score
-import joblib
-import os
 
 # 1. Generate Synthetic Data
 def generate_data(n_samples=1000):
@@ -29,32 +24,11 @@ def generate_data(n_samples=1000):
     )
     return df
 
-def train_model():
-    print("Generating synthetic data...")
-    df = generate_data()
-    
-    X = df.drop('carbon_emission_kg', axis=1)
-    y = df['carbon_emission_kg']
-    
-    print("Splitting data...")
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    print("Training Random Forest Regressor...")
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
-    model.fit(X_train, y_train)
-    
-    print("Evaluating model...")
-    y_pred = model.predict(X_test)
-    mse = mean_squared_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
-    
-    print(f"Mean Squared Error: {mse:.2f}")
-    print(f"R2 Score: {r2:.2f}")
-    
-    # Save model
-    os.makedirs('models', exist_ok=True)
-    joblib.dump(model, 'models/carbon_emission_model.pkl')
-    print("Model saved to models/carbon_emission_model.pkl")
+def train_model(**kwargs):
+    """Streaming, all-cores pipeline; see training_pipeline.py for options (defaults: 1,000 synthetic rows)"""
+    from training_pipeline import train
+    return train(**kwargs)
 
 if __name__ == "__main__":
-    train_model()
+    from training_pipeline import main
+    main()
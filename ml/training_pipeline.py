@@ -0,0 +1,319 @@
+"""
+Out-of-core training pipeline for the emission model.
+
+Input (CSV or Parquet, any size) is streamed in chunks into float32 memory-mapped
+train/test matrices on disk, so only one chunk is ever parsed in RAM. An optional
+cross-validated hyperparameter search runs candidate/fold fits in parallel on a
+bounded sample, growing each forest with warm_start and stopping once extra trees
+stop improving validation error. The final forest trains on all rows across all cores.
+Training time and peak memory are written next to the exported artifacts.
+
+Usage:
+  python ml/training_pipeline.py --data facilities.parquet [--search] [--register v3]
+  python ml/training_pipeline.py --synthetic-rows 1000000 --search
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.model_selection import KFold
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ML_DIR, '..', 'backend'))
+from agents.data_agent import DataCleaningAgent
+from services.forest_engine import ForestEngine, file_digest
+
+FEATURES = DataCleaningAgent().expected_features
+TARGET = 'carbon_emission_kg'
+DEFAULT_GRID = {
+    'max_depth': [12, 18, None],
+    'min_samples_leaf': [1, 5],
+    'max_features': [1.0, 0.6],
+}
+# Forest sizes tried in order during early stopping
+TREE_STEPS = [25, 50, 100, 200, 400]
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def peak_memory_mb() -> Optional[Dict[str, float]]:
+    """Peak RSS of this process and of finished child processes (Linux reports KiB)"""
+    if resource is None:
+        return None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+def iter_file_chunks(path: str, chunk_size: int, target: str = TARGET) -> Iterator[pd.DataFrame]:
+    """Feature columns (mapped like uploads) plus the target, as float32, one chunk at a time"""
+    agent = DataCleaningAgent()
+    if os.path.splitext(path)[1].lower() in agent.parquet_extensions:
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        plan = agent.resolve_schema(parquet.schema_arrow.names)
+        columns = sorted({source for source in plan.values() if source is not None} | {target})
+        batches = (batch.to_pandas() for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns))
+    else:
+        header = pd.read_csv(path, nrows=0).columns
+        plan = agent.resolve_schema(header)
+        columns = sorted({source for source in plan.values() if source is not None} | {target})
+        batches = pd.read_csv(path, usecols=columns, dtype={c: np.float32 for c in columns}, chunksize=chunk_size)
+
+    for batch in batches:
+        chunk = pd.DataFrame({
+            feature: batch[source].to_numpy(dtype=np.float32) if source is not None
+            else np.full(len(batch), agent.feature_defaults[feature], dtype=np.float32)
+            for feature, source in plan.items()
+        })
+        chunk[TARGET] = batch[target].to_numpy(dtype=np.float32)
+        yield chunk
+
+def iter_synthetic_chunks(n_rows: int, chunk_size: int) -> Iterator[pd.DataFrame]:
+    from train_model import generate_data
+    df = generate_data(n_rows)
+    for start in range(0, n_rows, chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+class SpilledDataset:
+    """
+    Streams chunks into on-disk float32 train/test matrices (rows split at random as they arrive).
+    NaN features are imputed afterwards in place with training-row means, so nothing about the
+    test rows leaks into training; rows without a target are dropped.
+    """
+
+    def __init__(self, work_dir: str):
+        self.work_dir = work_dir
+        self.n_train = 0
+        self.n_test = 0
+
+    def build(self, chunks: Iterator[pd.DataFrame], test_fraction: float = 0.2, seed: int = 42):
+        rng = np.random.default_rng(seed)
+        sums = np.zeros(len(FEATURES))
+        counts = np.zeros(len(FEATURES))
+        files = {name: open(os.path.join(self.work_dir, f"{name}.bin"), "wb") for name in ("X_train", "y_train", "X_test", "y_test")}
+        try:
+            for chunk in chunks:
+                X = chunk[FEATURES].to_numpy(dtype=np.float32)
+                y = chunk[TARGET].to_numpy(dtype=np.float32)
+                keep = ~np.isnan(y)
+                X, y = X[keep], y[keep]
+
+                test = rng.random(len(y)) < test_fraction
+                sums += np.nansum(X[~test], axis=0)
+                counts += (~np.isnan(X[~test])).sum(axis=0)
+                files["X_train"].write(np.ascontiguousarray(X[~test]).tobytes())
+                files["y_train"].write(y[~test].tobytes())
+                files["X_test"].write(np.ascontiguousarray(X[test]).tobytes())
+                files["y_test"].write(y[test].tobytes())
+                self.n_train += int((~test).sum())
+                self.n_test += int(test.sum())
+        finally:
+            for f in files.values():
+                f.close()
+
+        self.means = np.where(counts > 0, sums / np.maximum(counts, 1), 0.0).astype(np.float32)
+        for name in ("X_train", "X_test"):
+            X = self._open(name, "r+")
+            if X is not None:
+                for start in range(0, len(X), 1_000_000):
+                    block = X[start:start + 1_000_000]
+                    rows, cols = np.where(np.isnan(block))
+                    block[rows, cols] = self.means[cols]
+                X.flush()
+        return self
+
+    def _open(self, name: str, mode: str = "r"):
+        n = self.n_train if name.endswith("train") else self.n_test
+        if n == 0:
+            return None
+        shape = (n, len(FEATURES)) if name.startswith("X") else (n,)
+        return np.memmap(os.path.join(self.work_dir, f"{name}.bin"), dtype=np.float32, mode=mode, shape=shape)
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """Named-column view over the memmap (no copy) so the model keeps its feature names"""
+        return pd.DataFrame(self._open(name), columns=FEATURES, copy=False)
+
+    def target(self, name: str) -> np.ndarray:
+        return self._open(name)
+
+    def sample(self, n_rows: int, seed: int = 42):
+        """In-memory random sample of the training rows for the hyperparameter search"""
+        X, y = self._open("X_train"), self._open("y_train")
+        if n_rows >= len(y):
+            return pd.DataFrame(np.asarray(X), columns=FEATURES), np.asarray(y)
+        idx = np.sort(np.random.default_rng(seed).choice(len(y), n_rows, replace=False))
+        return pd.DataFrame(X[idx], columns=FEATURES), y[idx]
+
+def fit_early_stopped(params: Dict, X_train, y_train, X_val, y_val, tol: float, max_trees: int, seed: int,
+                      stop_fraction: float = 0.2) -> Dict:
+    """
+    Grow one forest with warm_start on part of the training fold; stop when the relative MSE gain on
+    the rest of the fold drops below tol. The validation fold only scores the chosen forest, so the
+    reported MSE is not biased by the choice of n_estimators.
+    """
+    stop = np.random.default_rng(seed).random(len(y_train)) < stop_fraction
+    X_fit, y_fit = X_train[~stop], y_train[~stop]
+    X_stop, y_stop = X_train[stop], y_train[stop]
+
+    model = RandomForestRegressor(warm_start=True, n_jobs=1, random_state=seed, **params)
+    best_mse, best_trees, history = np.inf, 0, []
+    for n_trees in [n for n in TREE_STEPS if n <= max_trees]:
+        model.set_params(n_estimators=n_trees)
+        model.fit(X_fit, y_fit)
+        mse = mean_squared_error(y_stop, model.predict(X_stop))
+        history.append((n_trees, mse))
+        improved = (best_mse - mse) / best_mse if np.isfinite(best_mse) else 1.0
+        if mse < best_mse:
+            best_mse, best_trees = mse, n_trees
+        if improved < tol:
+            break
+
+    # warm_start only appends trees, so the first best_trees are exactly a best_trees-tree forest
+    model.estimators_ = model.estimators_[:best_trees]
+    model.set_params(n_estimators=best_trees)
+    return {"mse": float(mean_squared_error(y_val, model.predict(X_val))), "stop_mse": best_mse,
+            "n_estimators": best_trees, "history": history}
+
+def cross_validated_search(X: pd.DataFrame, y: np.ndarray, grid: Dict[str, List], folds: int = 3,
+                           n_jobs: int = -1, tol: float = 0.005, max_trees: int = 400, seed: int = 42) -> Dict:
+    """Every (candidate, fold) fit runs as its own job across all cores"""
+    candidates = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=seed).split(X))
+    jobs = [(ci, fi) for ci in range(len(candidates)) for fi in range(len(splits))]
+    fold_results = Parallel(n_jobs=n_jobs)(
+        delayed(fit_early_stopped)(
+            candidates[ci], X.iloc[splits[fi][0]], y[splits[fi][0]], X.iloc[splits[fi][1]], y[splits[fi][1]],
+            tol, max_trees, seed,
+        )
+        for ci, fi in jobs
+    )
+
+    results = []
+    for ci, params in enumerate(candidates):
+        runs = [r for (c, _), r in zip(jobs, fold_results) if c == ci]
+        results.append({
+            "params": params,
+            "cv_mse": float(np.mean([r["mse"] for r in runs])),
+            "n_estimators": int(np.median([r["n_estimators"] for r in runs])),
+        })
+    results.sort(key=lambda r: r["cv_mse"])
+    return {"best": results[0], "candidates": results}
+
+def train(data_path: str = None, synthetic_rows: int = 1000, output_dir: str = None, chunk_size: int = 100_000,
+          test_fraction: float = 0.2, search: bool = False, search_rows: int = 50_000, folds: int = 3,
+          n_jobs: int = -1, register_version: str = None) -> Dict:
+    output_dir = output_dir or os.path.join(ML_DIR, "models")
+    os.makedirs(output_dir, exist_ok=True)
+    timings = {}
+    started = time.perf_counter()
+
+    work_dir = tempfile.mkdtemp(prefix="train-", dir=output_dir)
+    try:
+        print("Streaming training data to disk...")
+        phase = time.perf_counter()
+        chunks = iter_file_chunks(data_path, chunk_size) if data_path else iter_synthetic_chunks(synthetic_rows, chunk_size)
+        dataset = SpilledDataset(work_dir).build(chunks, test_fraction=test_fraction)
+        timings["ingest_s"] = time.perf_counter() - phase
+        print(f"{dataset.n_train} training rows, {dataset.n_test} test rows")
+
+        params = {"n_estimators": 100}
+        search_report = None
+        if search:
+            print("Running cross-validated hyperparameter search...")
+            phase = time.perf_counter()
+            X_sample, y_sample = dataset.sample(search_rows)
+            search_report = cross_validated_search(X_sample, y_sample, DEFAULT_GRID, folds=folds, n_jobs=n_jobs)
+            params = {**search_report["best"]["params"], "n_estimators": search_report["best"]["n_estimators"]}
+            timings["search_s"] = time.perf_counter() - phase
+            print(f"Best parameters: {params} (CV MSE {search_report['best']['cv_mse']:.2f})")
+
+        print("Training Random Forest Regressor on all cores...")
+        phase = time.perf_counter()
+        model = RandomForestRegressor(random_state=42, n_jobs=n_jobs, **params)
+        model.fit(dataset.frame("X_train"), dataset.target("y_train"))
+        timings["fit_s"] = time.perf_counter() - phase
+
+        metrics = {}
+        if dataset.n_test:
+            print("Evaluating model...")
+            y_pred = np.concatenate([
+                model.predict(dataset.frame("X_test").iloc[start:start + chunk_size])
+                for start in range(0, dataset.n_test, chunk_size)
+            ])
+            y_test = dataset.target("y_test")
+            metrics = {"mse": float(mean_squared_error(y_test, y_pred)), "r2": float(r2_score(y_test, y_pred))}
+            print(f"Mean Squared Error: {metrics['mse']:.2f}")
+            print(f"R2 Score: {metrics['r2']:.2f}")
+        # Predictions run in-process from here on; don't ship a pickle that spins up every core
+        model.set_params(n_jobs=None)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    phase = time.perf_counter()
+    model_path = os.path.join(output_dir, "carbon_emission_model.pkl")
+    joblib.dump(model, model_path)
+    print(f"Model saved to {model_path}")
+    # Export the fast-start artifact: uncompressed node arrays workers can memory-map
+    ForestEngine.from_model(model).save(os.path.join(output_dir, "carbon_emission_model.forest"),
+                                        source_digest=file_digest(model_path))
+    timings["export_s"] = time.perf_counter() - phase
+    timings["total_s"] = time.perf_counter() - started
+
+    report = {
+        "source": os.path.abspath(data_path) if data_path else f"synthetic:{synthetic_rows}",
+        "rows_train": dataset.n_train,
+        "rows_test": dataset.n_test,
+        "features": FEATURES,
+        "params": params,
+        "metrics": metrics,
+        "timings": timings,
+        "peak_memory_mb": peak_memory_mb(),
+        "n_jobs": n_jobs,
+        "cpus": os.cpu_count(),
+        "search": search_report,
+    }
+    with open(os.path.join(output_dir, "carbon_emission_model.training.json"), "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Training report written ({timings['total_s']:.1f}s, peak RSS {report['peak_memory_mb']})")
+
+    if register_version:
+        from services.model_registry import ModelRegistry
+        version = ModelRegistry().register(model_path, register_version, metadata={"training": report})
+        print(f"Registered as model version {version}")
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", help="CSV or Parquet file with the feature columns and the target")
+    parser.add_argument("--synthetic-rows", type=int, default=1000, help="rows of generated data when --data is not given")
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--search", action="store_true", help="cross-validated hyperparameter search")
+    parser.add_argument("--search-rows", type=int, default=50_000)
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--register", metavar="VERSION", help="also publish the model to the registry")
+    args = parser.parse_args(argv)
+    train(data_path=args.data, synthetic_rows=args.synthetic_rows, output_dir=args.output_dir,
+          chunk_size=args.chunk_size, test_fraction=args.test_fraction, search=args.search,
+          search_rows=args.search_rows, folds=args.folds, n_jobs=args.n_jobs, register_version=args.register)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import io
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+sys.path.append(os.path.join(ROOT, 'ml'))
+os.environ.setdefault("MEMORY_BANK_DB", ":memory:")
+os.environ.setdefault("MODEL_REGISTRY_POLL_SECONDS", "0")
+
+from fastapi.testclient import TestClient
+from train_model import generate_data
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    """The app with a small forest trained here swapped in, so nothing depends on the shipped pickle"""
+    import joblib
+    import main
+    from sklearn.ensemble import RandomForestRegressor
+
+    data = generate_data(1000)
+    model = RandomForestRegressor(n_estimators=10, random_state=0).fit(data.drop('carbon_emission_kg', axis=1),
+                                                                       data['carbon_emission_kg'])
+    model_path = str(tmp_path_factory.mktemp("model") / "model.pkl")
+    joblib.dump(model, model_path)
+    main.prediction_agent.swap_model(model_path, "test")
+    return TestClient(main.app)
+
+def csv_upload(n_rows: int, name: str = "facilities.csv"):
+    frame = generate_data(n_rows).drop('carbon_emission_kg', axis=1)
+    return {"file": (name, frame.to_csv(index=False).encode(), "text/csv")}
+
+def test_stream_upload_replaces_an_earlier_upload(client):
+    session_id = client.post("/upload", files=csv_upload(3000)).json()["session_id"]
+    headers = {"x-session-id": session_id}
+    assert client.post("/predict-batch", headers=headers).json()["row_count"] == 3000
+
+    streamed = client.post("/upload-stream", headers=headers, files=csv_upload(10))
+    assert streamed.status_code == 200 and streamed.json()["row_count"] == 10
+
+    # Batch endpoints see the streamed rows, not the 3000-row frame from before
+    batch = client.post("/predict-batch", headers=headers).json()
+    assert batch["row_count"] == 10 and len(batch["emissions"]) == 10
+    assert client.post("/optimize-batch", headers=headers).status_code == 400
+
+def test_upload_drops_scores_from_an_earlier_upload(client):
+    session_id = client.post("/upload-stream", files=csv_upload(10)).json()["session_id"]
+    headers = {"x-session-id": session_id}
+    client.post("/upload", headers=headers, files=csv_upload(25))
+    assert client.post("/predict-batch", headers=headers).json()["row_count"] == 25
+
+def test_optimize_batch_pages_row_savings(client):
+    session_id = client.post("/upload", files=csv_upload(250)).json()["session_id"]
+    headers = {"x-session-id": session_id}
+    full = client.post("/optimize-batch", headers=headers, params={"limit": 250}).json()
+    page = client.post("/optimize-batch", headers=headers,
+                       params={"offset": 200, "limit": 100, "include_suggestions": True}).json()
+
+    assert page["row_count"] == 250 and page["total_potential_savings"] == full["total_potential_savings"]
+    assert page["row_savings"] == full["row_savings"][200:]
+    assert sorted(map(int, page["suggestions"])) == list(range(200, 250))
+    assert client.post("/optimize-batch", headers=headers, params={"offset": -1}).status_code == 422
+
+def test_repeat_report_for_an_unchanged_session_skips_rendering(client):
+    import main
+    session_id = client.post("/upload", files=csv_upload(1)).json()["session_id"]
+    headers = {"x-session-id": session_id}
+    assert client.post("/analyze", headers=headers).status_code == 200
+
+    before = main.report_service.get_stats()
+    first = client.post("/generate-report", headers=headers)
+    second = client.post("/generate-report", headers=headers)
+    after = main.report_service.get_stats()
+
+    assert first.status_code == second.status_code == 200
+    assert first.content[:4] == b"%PDF" and second.content == first.content
+    assert after["misses"] - before["misses"] == 1 and after["hits"] - before["hits"] == 1
+
+def test_what_if_rejects_bad_parameters(client):
+    headers = {"x-session-id": client.post("/upload", files=csv_upload(1)).json()["session_id"]}
+    ok = client.post("/what-if", headers=headers, params={"budget": 5, "top_k": 3})
+    assert ok.status_code == 200 and len(ok.json()["best"]) <= 3
+    for params in ({"budget": -1}, {"budget": "nan"}, {"top_k": 0}, {"top_k": 1000}):
+        assert client.post("/what-if", headers=headers, params=params).status_code == 422, params
+
+def test_analyze_runs_both_agents_once_and_concurrently(client, monkeypatch):
+    import asyncio
+    import main
+    from models.schemas import OptimizationSuggestion
+
+    calls = {"explain": 0, "optimize": 0}
+
+    async def explain_async(data, emission, attribution=None):
+        calls["explain"] += 1
+        # Only finishes once optimization has started: a serial pipeline would time out here
+        await asyncio.wait_for(optimize_started.wait(), timeout=5)
+        return "Fuel dominates."
+
+    async def optimize_async(data, emission):
+        calls["optimize"] += 1
+        optimize_started.set()
+        return [OptimizationSuggestion(category="Fuel", suggestion="Switch to EVs.", potential_saving_kg=0.25 * emission)]
+
+    monkeypatch.setattr(main.prediction_agent, "explain_async", explain_async)
+    monkeypatch.setattr(main.optimization_agent, "optimize_async", optimize_async)
+
+    session_id = client.post("/upload", files=csv_upload(1)).json()["session_id"]
+    headers = {"x-session-id": session_id}
+    optimize_started = asyncio.Event()
+    response = client.post("/analyze", headers=headers)
+    assert response.status_code == 200, response.text
+
+    result = response.json()
+    emission = result["prediction"]["emission_kg"]
+    data = main.session_service.get_session(session_id)["data"]
+    assert emission == pytest.approx(main.prediction_agent.predict_record(data))
+    assert result["prediction"]["explanation"] == "Fuel dominates." and result["prediction"]["drivers"]
+    assert result["optimization"]["total_potential_savings"] == pytest.approx(0.25 * emission)
+
+    # The session now holds both results: a report needs no further agent calls
+    assert client.post("/generate-report", headers=headers).status_code == 200
+    assert calls == {"explain": 1, "optimize": 1}
+
+def facility_frame(n_rows: int) -> pd.DataFrame:
+    return generate_data(n_rows).drop('carbon_emission_kg', axis=1)
+
+def file_upload(frame: pd.DataFrame, fmt: str):
+    buffer = io.BytesIO()
+    if fmt == "csv":
+        buffer.write(frame.to_csv(index=False).encode())
+    elif fmt == "parquet":
+        frame.to_parquet(buffer, index=False)
+    else:
+        frame.reset_index(drop=True).to_feather(buffer)
+    return {"file": (f"facilities.{fmt}", buffer.getvalue(), "application/octet-stream")}
+
+def named_facilities(n_rows: int) -> pd.DataFrame:
+    """Facility names, an aliased column and a few gaps, as real uploads have"""
+    frame = facility_frame(n_rows).rename(columns={'fuel_consumption_liters': 'fuel_used_liters'})
+    frame.insert(0, 'facility_name', [f"Plant {i}" for i in range(n_rows)])
+    frame.loc[frame.index[::7], 'energy_usage_kwh'] = np.nan
+    return frame
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_columnar_uploads_match_csv(client, fmt):
+    frame = named_facilities(120)
+    scored = {}
+    for upload_fmt in ("csv", fmt):
+        uploaded = client.post("/upload", files=file_upload(frame, upload_fmt))
+        assert uploaded.status_code == 200, uploaded.text
+        assert uploaded.json()["row_count"] == 120
+        headers = {"x-session-id": uploaded.json()["session_id"]}
+        scored[upload_fmt] = (uploaded.json()["preview"], client.post("/predict-batch", headers=headers).json())
+
+    (csv_preview, csv_batch), (preview, batch) = scored["csv"], scored[fmt]
+    assert preview == pytest.approx(csv_preview)
+    np.testing.assert_allclose(batch["emissions"], csv_batch["emissions"], rtol=1e-6)
+
+def test_parquet_results_round_trip(client):
+    frame = named_facilities(60)
+    headers = {"x-session-id": client.post("/upload", files=file_upload(frame, "parquet")).json()["session_id"]}
+    emissions = client.post("/predict-batch", headers=headers).json()["emissions"]
+
+    response = client.post("/predict-batch", headers=headers, params={"format": "parquet"})
+    assert response.status_code == 200 and response.headers["content-type"] == "application/vnd.apache.parquet"
+    results = pd.read_parquet(io.BytesIO(response.content))
+    assert list(results.columns) == ["facility", "energy_usage_kwh", "fuel_consumption_liters",
+                                     "distance_traveled_km", "waste_generated_kg", "company_size", "emission_kg"]
+    assert results["facility"].tolist() == frame["facility_name"].tolist()
+    np.testing.assert_allclose(results["fuel_consumption_liters"], frame["fuel_used_liters"], rtol=1e-6)
+    np.testing.assert_allclose(results["emission_kg"], emissions)
+
+def wait_for_job(client, job_id: str, timeout: float = 60.0) -> dict:
+    deadline = time.time() + timeout
+    while True:
+        status = client.get(f"/jobs/{job_id}").json()
+        if status["status"] in ("completed", "failed", "cancelled") or time.time() > deadline:
+            return status
+        time.sleep(0.05)
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "arrow"])
+def test_file_jobs_score_every_row_in_order(client, monkeypatch, fmt):
+    import main
+    monkeypatch.setattr(main.job_manager, "chunk_size", 100)
+    frame = facility_frame(450)
+    expected = main.prediction_agent.predict_batch(main.data_agent.clean(frame))
+
+    submitted = client.post("/jobs", files=file_upload(frame, fmt)).json()
+    status = wait_for_job(client, submitted["job_id"])
+    assert status["status"] == "completed", status
+    assert status["total_rows"] == status["processed_rows"] == 450 and status["progress"] == 1.0
+
+    emissions = client.get(submitted["results_url"]).json()["emissions"]
+    np.testing.assert_allclose(emissions, expected, rtol=1e-5)
+    page = client.get(submitted["results_url"], params={"offset": 180, "limit": 50}).json()
+    assert page["offset"] == 180 and page["emissions"] == emissions[180:230]
+
+class GatedDataAgent:
+    """Cleans like the real agent but holds chunk number hold_at back until released"""
+
+    def __init__(self, agent, hold_at: int):
+        self.agent = agent
+        self.hold_at = hold_at
+        self.release = threading.Event()
+
+    def __getattr__(self, name):
+        return getattr(self.agent, name)
+
+    def iter_clean_chunks(self, *args, **kwargs):
+        for i, chunk in enumerate(self.agent.iter_clean_chunks(*args, **kwargs)):
+            if i == self.hold_at:
+                self.release.wait(30)
+            yield chunk
+
+def test_cancelled_job_keeps_the_rows_scored_before_it(client, monkeypatch):
+    import main
+    # One worker keeps two chunks in flight, so the first is collected when the third is requested
+    gated = GatedDataAgent(main.job_manager.data_agent, hold_at=2)
+    monkeypatch.setattr(main.job_manager, "data_agent", gated)
+    monkeypatch.setattr(main.job_manager, "chunk_size", 100)
+    monkeypatch.setattr(main.job_manager, "max_workers", 1)
+
+    job_id = client.post("/jobs", files=file_upload(facility_frame(450), "csv")).json()["job_id"]
+    deadline = time.time() + 60
+    while client.get(f"/jobs/{job_id}").json()["processed_rows"] < 100 and time.time() < deadline:
+        time.sleep(0.05)
+    partial = client.get(f"/jobs/{job_id}").json()
+    assert partial["status"] == "running" and partial["total_rows"] == 450 and partial["progress"] < 1.0
+
+    assert client.delete(f"/jobs/{job_id}").status_code == 200
+    gated.release.set()
+    status = wait_for_job(client, job_id)
+    assert status["status"] == "cancelled" and status["processed_rows"] == 100
+    assert len(client.get(f"/jobs/{job_id}/results").json()["emissions"]) == 100
+    assert client.delete("/jobs/does-not-exist").status_code == 404
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
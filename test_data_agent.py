@@ -0,0 +1,43 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+
+from agents.data_agent import DataCleaningAgent
+
+HEADER = "facility_id,energy_consumption_kwh,fuel_consumption_liters,distance_traveled_km,waste_generated_kg,company_size\n"
+
+def assert_chunked_matches_whole(csv: str, chunk_size: int):
+    agent = DataCleaningAgent()
+    whole = agent.clean(pd.read_csv(io.BytesIO(csv.encode())))
+    chunked = pd.concat(list(agent.iter_clean_chunks(io.BytesIO(csv.encode()), chunk_size=chunk_size)))
+    assert list(chunked.index) == list(whole.index)
+    for col in whole.columns:
+        if pd.api.types.is_numeric_dtype(whole[col]):
+            np.testing.assert_allclose(chunked[col].to_numpy(dtype=np.float64), whole[col].to_numpy(dtype=np.float64), rtol=1e-6)
+        else:
+            assert chunked[col].tolist() == whole[col].tolist(), col
+
+def test_numeric_chunks_match_whole_frame_clean():
+    rng = np.random.default_rng(0)
+    lines = []
+    for i in range(50):
+        values = [f"{v:.2f}" if rng.random() > 0.2 else "" for v in rng.uniform(1, 1000, 4)]
+        lines.append(",".join([f"F{i}"] + values + [str(i % 7 + 1)]))
+    assert_chunked_matches_whole(HEADER + "\n".join(lines) + "\n", chunk_size=7)
+
+def test_column_numeric_in_one_chunk_and_text_in_another():
+    # waste_generated_kg parses as numbers in the first chunk only
+    rows = ["A,100,50,10,5,3", "B,200,,20,,3", "C,300,70,30,5,4",
+            "D,400,80,,unknown,4", "E,500,90,50,,5", "F,600,,60,9,5"]
+    assert_chunked_matches_whole(HEADER + "\n".join(rows) + "\n", chunk_size=3)
+
+if __name__ == "__main__":
+    test_numeric_chunks_match_whole_frame_clean()
+    test_column_numeric_in_one_chunk_and_text_in_another()
+    print("Chunked cleaning matches whole-frame cleaning")
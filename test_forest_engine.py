@@ -0,0 +1,85 @@
+import os
+import sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+sys.path.append(os.path.join(ROOT, 'ml'))
+
+from services.forest_engine import ForestEngine
+from train_model import generate_data
+
+def small_forest(n_rows: int = 1000, **params):
+    """Trained here so the tests never depend on (or silently skip without) the shipped pickle"""
+    from sklearn.ensemble import RandomForestRegressor
+    data = generate_data(n_rows)
+    X, y = data.drop('carbon_emission_kg', axis=1), data['carbon_emission_kg']
+    return RandomForestRegressor(**{"n_estimators": 20, "random_state": 0, **params}).fit(X, y)
+
+def test_forest_engine_parity():
+    model = small_forest()
+    engine = ForestEngine.from_model(model)
+
+    X = generate_data(2000).drop('carbon_emission_kg', axis=1)
+    expected = model.predict(X)
+
+    # Batch path
+    np.testing.assert_allclose(engine.predict(X.to_numpy()), expected, rtol=1e-9)
+
+    # Single-row path
+    for i in range(25):
+        assert np.isclose(engine.predict_one(X.iloc[i].to_numpy()), expected[i], rtol=1e-9)
+
+    print(f"Forest engine matches model.predict on {len(X)} rows")
+
+def test_forest_engine_contributions_sum_to_prediction():
+    model = small_forest()
+    engine = ForestEngine.from_model(model)
+
+    X = generate_data(500).drop('carbon_emission_kg', axis=1)
+    bias, contributions = engine.contributions(X.to_numpy())
+    assert contributions.shape == X.shape
+    np.testing.assert_allclose(bias + contributions.sum(axis=1), model.predict(X), rtol=1e-9)
+
+def test_forest_engine_reexport_keeps_mapped_arrays_valid(tmp_path):
+    from sklearn.ensemble import RandomForestRegressor
+
+    data = generate_data(300)
+    X, y = data.drop('carbon_emission_kg', axis=1), data['carbon_emission_kg']
+    first = RandomForestRegressor(n_estimators=5, max_depth=6, random_state=0).fit(X, y)
+    second = RandomForestRegressor(n_estimators=7, max_depth=4, random_state=1).fit(X, y)
+
+    directory = str(tmp_path / "model.forest")
+    ForestEngine.from_model(first).save(directory)
+    mapped = ForestEngine.load(directory, mmap=True)
+    ForestEngine.from_model(second).save(directory)
+
+    # The running engine still reads the old pages; a fresh load sees the new export
+    np.testing.assert_allclose(mapped.predict(X.to_numpy()), first.predict(X), rtol=1e-9)
+    np.testing.assert_allclose(ForestEngine.load(directory).predict(X.to_numpy()), second.predict(X), rtol=1e-9)
+    assert sorted(os.listdir(tmp_path)) == ["model.forest"]
+
+def test_agent_loads_only_an_export_of_its_pickle(tmp_path):
+    import joblib
+    from agents.prediction_agent import EmissionPredictionAgent
+    from services.forest_engine import file_digest
+
+    model_path = str(tmp_path / "model.pkl")
+    joblib.dump(small_forest(300, n_estimators=5), model_path)
+    forest = EmissionPredictionAgent.artifact_path_for(model_path)
+    agent = EmissionPredictionAgent(model_path=model_path, use_engine=True)
+
+    # An export of another model is ignored however recent it is; so is one with no recorded source
+    ForestEngine.from_model(small_forest(300, n_estimators=7)).save(forest, source_digest="0" * 64)
+    assert agent._load_artifact(model_path) is None
+    ForestEngine.from_model(small_forest(300, n_estimators=5)).save(forest)
+    assert agent._load_artifact(model_path) is None
+
+    # A matching export loads even after the pickle is rewritten with a newer mtime
+    ForestEngine.from_model(small_forest(300, n_estimators=5)).save(forest, source_digest=file_digest(model_path))
+    os.utime(model_path, (os.path.getmtime(forest) + 60,) * 2)
+    assert agent._load_artifact(model_path).n_trees == 5
+
+if __name__ == "__main__":
+    test_forest_engine_parity()
+    test_forest_engine_contributions_sum_to_prediction()
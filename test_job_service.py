@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+
+from services.job_service import JobManager, JobLimitError
+
+def finish(job, age: float = 0.0):
+    job.status = "completed"
+    job.finished_at = time.time() - age
+
+def test_finished_jobs_are_pruned_by_count_and_age():
+    manager = JobManager(None, None, max_workers=1, max_concurrent_jobs=2,
+                         max_retained_jobs=2, retention_seconds=60)
+    old = manager._reserve()
+    finish(old, age=120)
+    running = manager._reserve()
+    finish(manager._reserve(), age=10)
+
+    # Pruning runs on submit: the expired job is gone, the running one is kept
+    assert manager.get(old.job_id) is None
+    assert manager.get(running.job_id) is running
+
+    for _ in range(3):
+        finish(manager._reserve())
+    manager._reserve()
+    assert sum(job.done for job in manager._jobs.values()) == 2
+    assert manager.get(running.job_id) is running
+
+def test_leased_pool_survives_resize_and_retire():
+    from agents.prediction_agent import EmissionPredictionAgent
+    agent = EmissionPredictionAgent(model_path=os.path.join(ROOT, 'missing-model.pkl'))
+    try:
+        with agent.leased_pool(1) as pool:
+            # Another size gets its own pool, and a swap only retires the leased one
+            assert agent.scoring_pool(2) is not pool
+            agent._retire_pools()
+            assert pool.submit(abs, -3).result(timeout=60) == 3
+        with pytest.raises(RuntimeError):
+            pool.submit(abs, -3)
+    finally:
+        agent.shutdown_pool()
+
+def test_predict_parallel_matches_sklearn_in_input_order(tmp_path):
+    import joblib
+    from sklearn.ensemble import RandomForestRegressor
+    from agents.prediction_agent import EmissionPredictionAgent
+    from services.forest_engine import ForestEngine, file_digest
+    sys.path.append(os.path.join(ROOT, 'ml'))
+    from train_model import generate_data
+
+    data = generate_data(1200)
+    X, y = data.drop('carbon_emission_kg', axis=1), data['carbon_emission_kg']
+    model = RandomForestRegressor(n_estimators=8, random_state=0).fit(X, y)
+    model_path = str(tmp_path / "model.pkl")
+    joblib.dump(model, model_path)
+    expected = model.predict(X)
+    # Columns out of model order, and chunks that don't divide the rows evenly
+    shuffled = X[list(reversed(X.columns))]
+
+    # Without an export workers flatten the pickle; with a current one they memory-map it
+    for export in (False, True):
+        if export:
+            ForestEngine.from_model(model).save(str(tmp_path / "model.forest"), source_digest=file_digest(model_path))
+        agent = EmissionPredictionAgent(model_path=model_path, use_engine=True)
+        try:
+            predictions = agent.predict_parallel(shuffled, n_workers=2, chunk_size=97)
+        finally:
+            agent.shutdown_pool()
+        np.testing.assert_allclose(predictions, expected, rtol=1e-6)
+
+def test_rejected_file_job_removes_its_copy(tmp_path):
+    manager = JobManager(None, None, max_workers=1, max_concurrent_jobs=1)
+    manager._reserve()
+    path = tmp_path / "upload.csv"
+    path.write_text("energy_usage_kwh\n1\n")
+    with pytest.raises(JobLimitError):
+        manager.submit_file(str(path))
+    assert not path.exists()
+
+if __name__ == "__main__":
+    test_finished_jobs_are_pruned_by_count_and_age()
+    print("Finished jobs are pruned")
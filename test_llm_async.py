@@ -0,0 +1,234 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+
+from services.llm_service import LLMGateway
+from services.llm_batcher import strip_code_fence
+from agents.prediction_agent import EmissionPredictionAgent
+from agents.optimization_agent import OptimizationAgent
+
+DATA = {
+    'energy_usage_kwh': 1200,
+    'fuel_consumption_liters': 600,
+    'distance_traveled_km': 800,
+    'waste_generated_kg': 50,
+    'company_size': 50
+}
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeLLM:
+    """Local stand-in for the Gemini client: sync generate_content with injected delay"""
+
+    def __init__(self, delay: float, text: str = "Emissions are driven by fuel use."):
+        self.delay = delay
+        self.text = text
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        return FakeResponse(self.text)
+
+class FakeBatchLLM:
+    """Answers packed prompts: echoes every row id except those in skip_ids"""
+
+    def __init__(self, skip_ids=()):
+        self.skip_ids = set(skip_ids)
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        rows = json.loads(prompt.split("Rows (JSON):\n", 1)[1])
+        items = []
+        for row in rows:
+            if row["row_id"] in self.skip_ids:
+                continue
+            items.append({
+                "row_id": row["row_id"],
+                "explanation": f"LLM explanation for row {row['row_id']}.",
+                "suggestions": [{"category": "Fuel", "suggestion": "Switch to EVs.", "potential_saving_fraction": 0.2}],
+            })
+        return FakeResponse("```json\n" + json.dumps(items) + "\n```")
+
+def make_agents(llm, gateway):
+    prediction_agent = EmissionPredictionAgent(gateway=gateway)
+    prediction_agent.llm_model = llm
+    # Explanations only go to the LLM as optional polish of the attribution text
+    prediction_agent.llm_polish = True
+    optimization_agent = OptimizationAgent(gateway=gateway)
+    optimization_agent.llm_model = llm
+    return prediction_agent, optimization_agent
+
+def test_slow_llm_falls_back_without_blocking_loop():
+    async def scenario():
+        gateway = LLMGateway(max_concurrency=2, timeout_seconds=0.1)
+        prediction_agent, optimization_agent = make_agents(FakeLLM(delay=1.0), gateway)
+
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        tick_task = asyncio.create_task(ticker())
+        explanation = await prediction_agent.explain_async(DATA, 2084.15)
+        suggestions = await optimization_agent.optimize_async(DATA, 2084.15)
+        tick_task.cancel()
+
+        assert explanation == prediction_agent._heuristic_explanation(DATA, 2084.15, prediction_agent.attribute_record(DATA))
+        assert [s.category for s in suggestions] == ["Energy", "Fuel", "Logistics"]
+        assert gateway.stats["timeouts"] == 2
+        # The loop kept running while both calls were waiting on the slow LLM
+        assert ticks >= 10
+
+    asyncio.run(scenario())
+
+def test_concurrency_cap_and_llm_text():
+    async def scenario():
+        llm = FakeLLM(delay=0.05, text=json.dumps([
+            {"category": "Fuel", "suggestion": "Switch to EVs.", "potential_saving_kg": 120.0}
+        ]))
+        gateway = LLMGateway(max_concurrency=3, timeout_seconds=5)
+        _, optimization_agent = make_agents(llm, gateway)
+
+        results = await asyncio.gather(*[optimization_agent.optimize_async(DATA, 2084.15) for _ in range(12)])
+
+        assert all(r[0].suggestion == "Switch to EVs." for r in results)
+        assert llm.max_in_flight <= 3
+        assert gateway.stats["calls"] == 12
+
+    asyncio.run(scenario())
+
+def test_timed_out_threads_keep_their_slot():
+    gateway = LLMGateway(max_concurrency=1, timeout_seconds=0.1)
+    slow = FakeLLM(delay=0.4)
+
+    async def burst(llm):
+        return await asyncio.gather(gateway.generate(llm, "a"), gateway.generate(llm, "b"))
+
+    # The second call can't get the slot while the first one's thread is still running
+    assert asyncio.run(burst(slow)) == [None, None]
+    assert gateway.stats["timeouts"] == 1 and gateway.stats["saturated"] == 1
+    assert slow.max_in_flight == 1
+
+    # A contended gateway keeps working from a new event loop once the stuck thread returns
+    time.sleep(0.4)
+    assert asyncio.run(burst(FakeLLM(delay=0.01, text="ok"))) == ["ok", "ok"]
+
+def test_batched_prompts_dedupe_and_fallback():
+    async def scenario():
+        llm = FakeBatchLLM(skip_ids={1})
+        gateway = LLMGateway(max_concurrency=2, timeout_seconds=5)
+        prediction_agent, optimization_agent = make_agents(llm, gateway)
+        for agent in (prediction_agent, optimization_agent):
+            agent.batcher.max_rows = 4
+
+        # 10 distinct rows, each repeated with a tiny jitter that lands in the same bucket
+        records, emissions = [], []
+        for i in range(10):
+            for jitter in (0.0, 0.001):
+                records.append({**DATA, 'energy_usage_kwh': 1000 * (i + 1) + jitter})
+                emissions.append(1500.0 + 100 * i)
+
+        explanations = await prediction_agent.explain_batch(records, emissions)
+        suggestions = await optimization_agent.suggest_batch(records, emissions)
+
+        # 10 unique rows in prompts of at most 4 rows, for each agent
+        assert len(llm.prompts) == 6
+        assert prediction_agent.batcher.stats["unique_rows"] == 10
+        assert explanations[0] == explanations[1] == "LLM explanation for row 0."
+        # Row 1 was left out of the response, so both of its copies use the heuristic
+        assert explanations[2] == prediction_agent._heuristic_explanation(records[2], emissions[2],
+                                                                          prediction_agent.attribute_record(records[2]))
+        assert suggestions[0][0].suggestion == "Switch to EVs."
+        assert abs(suggestions[0][0].potential_saving_kg - 0.2 * emissions[0]) < 1e-6
+        assert [s.category for s in suggestions[3]] == [s.category for s in optimization_agent._heuristic_suggestions(records[3], emissions[3])]
+        assert optimization_agent.batcher.stats["fallback_rows"] == 2
+
+    asyncio.run(scenario())
+
+class FakeMalformedLLM(FakeBatchLLM):
+    """Answers every row, but with a non-string explanation for the ids in bad_ids"""
+
+    def __init__(self, bad_ids=()):
+        super().__init__()
+        self.bad_ids = set(bad_ids)
+
+    def generate_content(self, prompt):
+        items = json.loads(strip_code_fence(super().generate_content(prompt).text))
+        for item in items:
+            if item["row_id"] in self.bad_ids:
+                item["explanation"] = {"text": "not a string"}
+        return FakeResponse(json.dumps(items))
+
+def test_malformed_batch_answers_fall_back_and_are_not_cached():
+    from services.llm_cache import LLMCache
+
+    async def scenario():
+        llm = FakeMalformedLLM(bad_ids={0})
+        prediction_agent, _ = make_agents(llm, LLMGateway(max_concurrency=2, timeout_seconds=5))
+        prediction_agent.cache = prediction_agent.batcher.cache = LLMCache(max_entries=100, ttl_seconds=60)
+        records = [{**DATA, 'energy_usage_kwh': 1000 * (i + 1)} for i in range(3)]
+        emissions = [1500.0, 1600.0, 1700.0]
+
+        first = await prediction_agent.explain_batch(records, emissions)
+        assert first[0] == prediction_agent._heuristic_explanation(records[0], emissions[0],
+                                                                   prediction_agent.attribute_record(records[0]))
+        assert first[1:] == ["LLM explanation for row 1.", "LLM explanation for row 2."]
+
+        # Only the malformed row is asked for again
+        llm.bad_ids.clear()
+        second = await prediction_agent.explain_batch(records, emissions)
+        assert second[0] == "LLM explanation for row 0." and second[1:] == first[1:]
+        assert prediction_agent.batcher.stats["cached_rows"] == 2
+
+    asyncio.run(scenario())
+
+def test_explanations_are_shared_only_between_nearly_identical_rows():
+    async def scenario():
+        llm = FakeBatchLLM()
+        prediction_agent, optimization_agent = make_agents(llm, LLMGateway(max_concurrency=2, timeout_seconds=5))
+        # Same at 2 significant figures (the suggestion buckets), different at 4
+        records = [{**DATA, 'energy_usage_kwh': value} for value in (1200.0, 1230.0, 1230.04)]
+        emissions = [1500.0, 1500.0, 1500.0]
+        explanations = await prediction_agent.explain_batch(records, emissions)
+        await optimization_agent.suggest_batch(records, emissions)
+        assert explanations[1] == explanations[2] != explanations[0]
+        assert prediction_agent.batcher.stats["unique_rows"] == 2
+        assert optimization_agent.batcher.stats["unique_rows"] == 1
+
+    asyncio.run(scenario())
+
+def test_batch_packing_respects_token_budget():
+    from services.llm_batcher import LLMBatcher, estimate_tokens
+    batcher = LLMBatcher(LLMGateway(), max_rows=100, max_prompt_tokens=200)
+    rows = [{"row_id": i, "data": DATA, "predicted_emission_kg": 1000.0} for i in range(20)]
+    batches = batcher.pack(rows, "instructions")
+    assert sum(len(b) for b in batches) == 20
+    for batch in batches:
+        assert estimate_tokens("instructions") + sum(estimate_tokens(json.dumps(r)) for r in batch) <= 200
+
+if __name__ == "__main__":
+    test_slow_llm_falls_back_without_blocking_loop()
+    test_concurrency_cap_and_llm_text()
+    test_batched_prompts_dedupe_and_fallback()
+    test_malformed_batch_answers_fall_back_and_are_not_cached()
+    test_explanations_are_shared_only_between_nearly_identical_rows()
+    test_batch_packing_respects_token_budget()
+    print("Async LLM tests passed")
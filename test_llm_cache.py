@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+
+from services.llm_cache import LLMCache
+
+def test_sqlite_tier_is_shared_and_purged(tmp_path):
+    path = str(tmp_path / "llm_cache.db")
+    writer = LLMCache(max_entries=10, ttl_seconds=60, db_path=path)
+    writer.set("a", "cached text")
+
+    # A second worker misses in memory and finds the row on disk
+    reader = LLMCache(max_entries=10, ttl_seconds=60, db_path=path)
+    assert reader.get("a") == "cached text" and reader.get("b") is None
+    assert reader.get_stats()["disk_hits"] == 1 and reader.get_stats()["misses"] == 1
+
+    # Expired rows are deleted on the next write once the purge interval has passed
+    short = LLMCache(max_entries=10, ttl_seconds=0.01, db_path=path, purge_seconds=0)
+    short.set_many([("old1", "x"), ("old2", "y")])
+    time.sleep(0.05)
+    short.set("new", "z")
+    keys = {row[0] for row in sqlite3.connect(path).execute("SELECT key FROM llm_cache")}
+    assert keys == {"a", "new"}
+    assert short.get_stats()["purged"] == 2
+
+def test_async_lookups_match_sync(tmp_path):
+    cache = LLMCache(max_entries=2, ttl_seconds=60, db_path=str(tmp_path / "llm_cache.db"))
+
+    async def scenario():
+        await cache.set_many_async([(f"k{i}", f"v{i}") for i in range(5)])
+        # Only two stay in memory; the rest come back from SQLite in one worker-thread lookup
+        found = await cache.get_many_async([f"k{i}" for i in range(6)])
+        assert found == {f"k{i}": f"v{i}" for i in range(5)}
+        assert await cache.get_async("missing") is None
+
+    asyncio.run(scenario())
+    stats = cache.get_stats()
+    assert stats["memory_hits"] == 2 and stats["disk_hits"] == 3 and stats["misses"] == 2
+
+def test_keys_change_with_the_emission_model():
+    features = {"energy_usage_kwh": 1200, "company_size": 50}
+    v1 = LLMCache.make_key("explain", features, 1500.0, "gemini", "v1")
+    assert v1 == LLMCache.make_key("explain", features, 1500.004, "gemini", "v1")
+    assert v1 != LLMCache.make_key("explain", features, 1500.0, "gemini", "v2")
+    assert v1 != LLMCache.make_key("explain", features, 1500.0, "gemini")
+
+class CountingGateway:
+    """Stands in for LLMGateway: counts calls and answers like the model would"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, llm_model, prompt: str):
+        self.calls += 1
+        if "Sustainability Consultant" in prompt:
+            return json.dumps([{"category": "Fuel", "suggestion": "Switch to EVs.", "potential_saving_kg": 120.0}])
+        return "Fuel use drives most of this facility's emissions."
+
+def test_identical_agent_requests_skip_the_llm():
+    from agents.optimization_agent import OptimizationAgent
+    from agents.prediction_agent import EmissionPredictionAgent
+
+    gateway, cache = CountingGateway(), LLMCache(max_entries=10, ttl_seconds=60)
+    prediction_agent = EmissionPredictionAgent(gateway=gateway, cache=cache)
+    prediction_agent.llm_model, prediction_agent.llm_polish = object(), True
+    optimization_agent = OptimizationAgent(gateway=gateway, cache=cache)
+    optimization_agent.llm_model = object()
+    data = {'energy_usage_kwh': 1200, 'fuel_consumption_liters': 600, 'distance_traveled_km': 800,
+            'waste_generated_kg': 50, 'company_size': 50}
+
+    async def scenario():
+        first = (await prediction_agent.explain_async(data, 1500.0), await optimization_agent.optimize_async(data, 1500.0))
+        assert gateway.calls == 2
+        # Same features, same prediction up to rounding, an equal but separate dict: served from the cache
+        second = (await prediction_agent.explain_async(dict(data), 1500.001),
+                  await optimization_agent.optimize_async(dict(data), 1500.001))
+        assert gateway.calls == 2 and second == first
+        # A different prediction is a different prompt
+        await prediction_agent.explain_async(data, 1600.0)
+        assert gateway.calls == 3
+
+    asyncio.run(scenario())
+    assert cache.get_stats()["hits"] == 2
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    for test in (test_sqlite_tier_is_shared_and_purged, test_async_lookups_match_sync):
+        with tempfile.TemporaryDirectory() as d:
+            test(pathlib.Path(d))
+    test_keys_change_with_the_emission_model()
+    test_identical_agent_requests_skip_the_llm()
+    print("LLM cache tiers, purge and async lookups work")
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+
+from services.memory_service import MemoryBank
+
+def test_aggregates_match_python(tmp_path):
+    bank = MemoryBank(str(tmp_path / "bank.db"), batch_size=50, flush_interval=0)
+    rng = np.random.default_rng(0)
+    emissions = rng.uniform(10, 1000, 300)
+    bank.save_emission_records([
+        {"company": f"c{i % 3}", "timestamp": 1000.0 + 10 * i, "emission": float(e), "input": {}}
+        for i, e in enumerate(emissions)
+    ])
+
+    trend = bank.emission_trend(bucket_seconds=1000)
+    assert sum(b["records"] for b in trend) == 300
+    assert np.isclose(sum(b["total_emission_kg"] for b in trend), emissions.sum())
+
+    ordered = np.sort(emissions)
+    p90 = bank.emission_percentiles([90])["p90"]
+    assert p90 == ordered[int(np.ceil(0.9 * 300)) - 1]
+    assert bank.company_totals()[0]["records"] == 100
+
+    with pytest.raises(ValueError):
+        bank.emission_trend(bucket_seconds=0)
+    bank.close()
+
+def test_batch_insert_matches_per_record_insert(tmp_path):
+    bank = MemoryBank(str(tmp_path / "bank.db"), batch_size=100, flush_interval=0)
+    emissions = np.arange(250, dtype=np.float32) * 1.5
+    bank.save_emission_batch([f'{{"row": {i}}}' for i in range(250)], emissions, session_id="s1", company="acme")
+
+    assert bank.get_stats()["total_records"] == 250
+    assert bank.company_totals()[0] == {"company": "acme", "records": 250,
+                                        "total_emission_kg": float(emissions.sum()),
+                                        "mean_emission_kg": float(emissions.mean())}
+    bank.close()
+
+def test_idle_buffer_is_flushed_in_the_background(tmp_path):
+    path = str(tmp_path / "bank.db")
+    bank = MemoryBank(path, batch_size=1000, flush_interval=0.05)
+    bank.save_emission_record({"company": "acme", "emission": 12.5, "input": {}})
+
+    # Another connection sees the row without any further write or read on this bank
+    deadline = time.time() + 5
+    count = 0
+    while time.time() < deadline and count == 0:
+        time.sleep(0.05)
+        count = sqlite3.connect(path).execute("SELECT COUNT(*) FROM emissions").fetchone()[0]
+    assert count == 1
+    bank.close()
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    for test in (test_aggregates_match_python, test_batch_insert_matches_per_record_insert,
+                 test_idle_buffer_is_flushed_in_the_background):
+        with tempfile.TemporaryDirectory() as d:
+            test(pathlib.Path(d))
+    print("Memory bank aggregates and background flush work")
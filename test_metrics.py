@@ -0,0 +1,82 @@
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+os.environ.setdefault("MEMORY_BANK_DB", ":memory:")
+os.environ.setdefault("MODEL_REGISTRY_POLL_SECONDS", "0")
+
+from fastapi.testclient import TestClient
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*\})? (\S+)$')
+
+def parse_exposition(text: str):
+    """Minimal Prometheus text-format parser: {family: type} and [(name, labels, value)]"""
+    types, samples = {}, []
+    for line in text.splitlines():
+        if not line:
+            continue
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ", 3)
+            assert name not in types, f"duplicate TYPE for {name}"
+            types[name] = kind
+            continue
+        if line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match, f"unparseable line: {line!r}"
+        name, labels, value = match.groups()
+        float(value)
+        base = re.sub(r"_(bucket|sum|count)$", "", name)
+        assert name in types or types.get(base) == "histogram", f"sample before its TYPE: {line!r}"
+        samples.append((name, dict(re.findall(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"', labels or "")), float(value)))
+    return types, samples
+
+def test_metrics_parse_and_routes_use_templates():
+    import main
+    client = TestClient(main.app)
+    client.get("/jobs/does-not-exist")
+    client.get("/history/companies")
+
+    types, samples = parse_exposition(client.get("/metrics").text)
+    assert types["carbon_http_requests_total"] == "counter"
+    assert types["carbon_http_request_duration_seconds"] == "histogram"
+
+    routes = {labels["route"] for name, labels, _ in samples if name == "carbon_http_requests_total"}
+    assert {"/jobs/{job_id}", "/history/companies"} <= routes
+    assert "unmatched" not in routes
+
+    # Histogram buckets are cumulative and end at the sample count
+    buckets = [(labels, value) for name, labels, value in samples
+               if name == "carbon_http_request_duration_seconds_bucket" and labels["route"] == "/history/companies"]
+    values = [value for _, value in buckets]
+    assert values == sorted(values) and buckets[-1][0]["le"] == "+Inf"
+    count = [value for name, labels, value in samples
+             if name == "carbon_http_request_duration_seconds_count" and labels["route"] == "/history/companies"]
+    assert count == [values[-1]]
+
+def test_pool_render_timings_are_recorded_in_the_parent():
+    from services.metrics_service import metrics
+    from services.report_service import ReportService
+
+    def render_count():
+        _, samples = parse_exposition(metrics.render())
+        return sum(value for name, labels, value in samples
+                   if name == "carbon_stage_duration_seconds_count" and labels.get("stage") == "report_render")
+
+    facility = {"name": "Plant 1", "emission_kg": 1200.0, "explanation": "Fuel dominates.",
+                "suggestions": [], "total_potential_savings": 0.0}
+    service = ReportService()
+    before = render_count()
+    try:
+        archive = b"".join(service.iter_batch_zip([facility, {**facility, "name": "Plant 2"}]))
+    finally:
+        service._pool.shutdown()
+    assert archive[:2] == b"PK"
+    assert render_count() - before == 2
+
+if __name__ == "__main__":
+    test_metrics_parse_and_routes_use_templates()
+    test_pool_render_timings_are_recorded_in_the_parent()
+    print("Metrics exposition parses")
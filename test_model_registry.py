@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+
+from services.model_registry import ModelRegistry
+from services.shadow_service import ShadowScorer
+from agents.prediction_agent import EmissionPredictionAgent
+
+FEATURES = ["energy_usage_kwh", "fuel_consumption_liters", "distance_traveled_km", "waste_generated_kg", "company_size"]
+
+def train(path, scale: float) -> str:
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.uniform(0, 1000, (200, len(FEATURES))), columns=FEATURES)
+    y = scale * (0.5 * X["energy_usage_kwh"] + 2.7 * X["fuel_consumption_liters"])
+    joblib.dump(RandomForestRegressor(n_estimators=5, max_depth=6, random_state=0).fit(X, y), path)
+    return str(path)
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    registry.register(train(tmp_path / "v1.pkl", 1.0), "v1")
+    registry.register(train(tmp_path / "v2.pkl", 2.0), "v2")
+    registry.activate("v1")
+    yield registry
+    registry.stop()
+
+def test_register_activate_and_swap(registry):
+    assert [m["version"] for m in registry.versions()] == ["v1", "v2"]
+    assert os.path.exists(os.path.join(registry.root, "v2", "model.forest", "manifest.json"))
+    with pytest.raises(ValueError):
+        registry.activate("missing")
+
+    agent = EmissionPredictionAgent(model_path=registry.active_model_path(), model_version=registry.active_version())
+    row = pd.DataFrame([[500.0, 300.0, 100.0, 20.0, 10.0]], columns=FEATURES)
+    before = agent._loaded
+    old = agent.predict_batch_uncached(row)[0]
+
+    agent.swap_model(registry.model_path("v2"), "v2")
+    assert agent.model_version == "v2"
+    assert np.isclose(agent.predict_batch_uncached(row)[0], 2 * old)
+    # Requests that started on the old model finish on it
+    assert np.isclose(before.predict_frame(row)[0], old)
+
+def test_load_version_leaves_the_served_model_alone(registry, tmp_path):
+    agent = EmissionPredictionAgent(model_path=registry.active_model_path(), model_version="v1")
+    candidate = agent.load_version(registry.model_path("v2"), "v2")
+    assert candidate.is_ready and candidate.version == "v2"
+    assert agent.model_version == "v1"
+    with pytest.raises(ValueError):
+        agent.load_version(str(tmp_path / "missing.pkl"), "v3")
+
+def test_watch_follows_activation_from_another_process(registry):
+    seen = threading.Event()
+    versions = []
+    registry.watch(lambda version: versions.append(version) or seen.set(), interval=0.05)
+    # Another worker writes the pointer; this process only sees the file change
+    ModelRegistry(registry.root).activate("v2")
+    assert seen.wait(5)
+    assert versions == ["v2"]
+
+def test_stopped_shadow_drops_samples_quietly(registry):
+    agent = EmissionPredictionAgent(model_path=registry.model_path("v2"), model_version="v2")
+    shadow = ShadowScorer(agent._loaded, sample_rate=1.0)
+    shadow.stop()
+    row = dict(zip(FEATURES, [500.0, 300.0, 100.0, 20.0, 10.0]))
+    shadow.observe_record(row, 1000.0)
+    shadow.observe_frame(pd.DataFrame([row]), np.array([1000.0]))
+    stats = shadow.get_stats()
+    assert stats["pending"] == 0 and stats["dropped"] == 2 and stats["submitted"] == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
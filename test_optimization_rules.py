@@ -0,0 +1,45 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+
+from agents.optimization_rules import DEFAULT_FALLBACK, DEFAULT_RULES, OptimizationRuleEngine
+
+def with_change(**change):
+    return [{**DEFAULT_RULES[0], **change}] + DEFAULT_RULES[1:]
+
+@pytest.mark.parametrize("rules", [
+    with_change(feature=None),
+    with_change(feature=""),
+    with_change(operator="=="),
+    with_change(threshold="1000"),
+    with_change(threshold=float("nan")),
+    with_change(saving_fraction=-0.1),
+    with_change(saving_fraction=None),
+    with_change(reduction=1.5),
+])
+def test_malformed_rules_are_rejected_on_load(rules):
+    with pytest.raises(ValueError):
+        OptimizationRuleEngine(rules=rules)
+
+def test_fallback_is_validated_too(tmp_path):
+    with pytest.raises(ValueError):
+        OptimizationRuleEngine(fallback={**DEFAULT_FALLBACK, "saving_fraction": -1})
+
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rules": DEFAULT_RULES, "fallback": {"category": "General", "suggestion": "Audit."}}))
+    with pytest.raises(ValueError):
+        OptimizationRuleEngine.from_file(str(path))
+
+def test_default_rules_load_and_fire():
+    engine = OptimizationRuleEngine()
+    suggestions = engine.evaluate_record({"energy_usage_kwh": 1500, "fuel_consumption_liters": 100}, 1000.0)
+    assert [s.category for s in suggestions] == ["Energy"]
+    assert suggestions[0].potential_saving_kg == pytest.approx(100.0)
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
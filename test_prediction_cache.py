@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+
+from services.prediction_cache import PredictionCache
+
+FEATURES = ["energy_usage_kwh", "company_size"]
+
+class CountingModel:
+    def __init__(self):
+        self.scored = []
+
+    def score(self, matrix):
+        self.scored.append(len(matrix))
+        return matrix.sum(axis=1)
+
+def test_only_unique_misses_are_scored():
+    cache = PredictionCache(max_entries=100, quantum="")
+    model = CountingModel()
+    matrix = np.array([[1.0, 10], [2.0, 10], [1.0, 10], [2.0, 10]], dtype=np.float32)
+
+    np.testing.assert_allclose(cache.predict(model, FEATURES, matrix, model.score), [11, 12, 11, 12])
+    np.testing.assert_allclose(cache.predict(model, FEATURES, matrix[:1], model.score), [11])
+    assert model.scored == [2]
+    assert cache.get_stats()["hits"] == 3
+
+    # Quantized features share an entry
+    coarse = PredictionCache(quantum="energy_usage_kwh=1")
+    coarse.predict(model, FEATURES, np.array([[0.9, 10], [1.2, 10]], dtype=np.float32), model.score)
+    assert model.scored == [2, 1]
+
+    # A different model object invalidates everything
+    other = CountingModel()
+    cache.predict(other, FEATURES, matrix, other.score)
+    assert other.scored == [2]
+    assert cache.get_stats()["invalidations"] == 1
+
+def test_mostly_unique_batches_bypass_the_lru():
+    cache = PredictionCache(max_entries=100, quantum="", bypass_unique_fraction=0.5, bypass_min_rows=10)
+    model = CountingModel()
+    unique = np.column_stack([np.arange(20), np.full(20, 10)]).astype(np.float32)
+
+    np.testing.assert_allclose(cache.predict(model, FEATURES, unique, model.score), unique.sum(axis=1))
+    assert cache.get_stats()["entries"] == 0 and cache.get_stats()["bypassed_rows"] == 20
+
+    # Repetitive batches are still cached, and a re-sent batch with cached rows is served from them
+    repeated = np.repeat(unique[:5], 4, axis=0)
+    cache.predict(model, FEATURES, repeated, model.score)
+    assert cache.get_stats()["entries"] == 5
+    cache.predict(model, FEATURES, unique, model.score)
+    assert cache.get_stats()["entries"] == 20 and model.scored == [20, 5, 15]
+
+if __name__ == "__main__":
+    test_only_unique_misses_are_scored()
+    test_mostly_unique_batches_bypass_the_lru()
+    print("Prediction cache scores only unique misses")
@@ -0,0 +1,31 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+
+from services.report_service import ReportService, facility_models
+
+# LLM text with characters ReportLab's paragraph parser treats as markup
+UNSAFE = 'Fuel <font is > half & the <b>waste</i> "rest"'
+
+def facility(name: str = "Plant <1>"):
+    return {"name": name, "emission_kg": 1200.0, "explanation": UNSAFE,
+            "suggestions": [{"category": "Fuel", "suggestion": UNSAFE, "potential_saving_kg": 120.0}],
+            "total_potential_savings": 120.0}
+
+def test_llm_text_is_escaped_in_every_report():
+    service = ReportService()
+    try:
+        prediction, optimization = facility_models(facility())
+        assert service.generate_pdf(UNSAFE, prediction, optimization)[:4] == b"%PDF"
+        # Consolidated reports render in the pool, like the per-facility ZIP
+        assert service.generate_consolidated_pdf(UNSAFE, [facility(), facility("Plant 2")])[:4] == b"%PDF"
+        assert service._pool is not None
+    finally:
+        if service._pool is not None:
+            service._pool.shutdown()
+
+if __name__ == "__main__":
+    test_llm_text_is_escaped_in_every_report()
+    print("Reports escape LLM text")
@@ -0,0 +1,82 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+
+from agents.scenario_engine import ScenarioEngine
+
+RECORD = {"energy_usage_kwh": 1000.0, "fuel_consumption_liters": 500.0, "distance_traveled_km": 200.0,
+          "waste_generated_kg": 50.0, "company_size": 10}
+
+def linear_emissions(frame):
+    # Stand-in model: 0.5 kg per kWh plus 2.7 kg per liter
+    return 0.5 * frame["energy_usage_kwh"].to_numpy() + 2.7 * frame["fuel_consumption_liters"].to_numpy()
+
+def test_what_if_grid_and_budget():
+    engine = ScenarioEngine()
+    calls = []
+    result = engine.evaluate(RECORD, lambda frame: calls.append(len(frame)) or linear_emissions(frame), budget=6.0)
+
+    assert calls == [4 ** 4]
+    assert np.isclose(result.baseline_emission_kg, 0.5 * 1000 + 2.7 * 500)
+    energy = result.levers[0]
+    assert np.isclose(energy.options[1].saving_kg, 0.5 * 1000 * 0.2)
+
+    # Best combination within 6 cost units: fuel -30% (5) plus energy -10% (1)
+    best = result.best[0]
+    assert best.cost <= 6.0
+    assert np.isclose(best.saving_kg, 2.7 * 500 * 0.3 + 0.5 * 1000 * 0.1)
+    assert abs(best.interaction_kg) < 1e-9
+
+def test_equal_savings_prefer_cheaper_scenarios():
+    # The stand-in model ignores distance and waste, so adding those levers only adds cost
+    result = ScenarioEngine().evaluate(RECORD, linear_emissions, top_k=3)
+    assert set(result.best[0].changes) == {"energy_efficiency", "fleet_electrification"}
+    assert [s.cost for s in result.best] == sorted(s.cost for s in result.best)
+
+def test_savings_fall_back_to_rule_fractions_without_a_model():
+    from agents.optimization_agent import OptimizationAgent
+    # An unloaded model scores everything as zero, which would zero out every saving
+    agent = OptimizationAgent(predictor=lambda frame: np.zeros(len(frame)), model_ready=lambda: False)
+    suggestions = agent._heuristic_suggestions(RECORD, 2000.0)
+    assert suggestions and all(s.potential_saving_kg > 0 for s in suggestions)
+
+def test_malformed_levers_are_rejected_on_load(tmp_path):
+    import json
+    from agents.scenario_engine import DEFAULT_LEVERS
+
+    def with_change(**change):
+        return [{**DEFAULT_LEVERS[0], **change}] + DEFAULT_LEVERS[1:]
+
+    for levers in (
+        with_change(feature="energy_kwh"),
+        with_change(name=""),
+        with_change(steps=[]),
+        with_change(steps=[0.1, 0.2, 1.5]),
+        with_change(steps=[-0.1, 0.2, 0.3]),
+        with_change(steps=["0.1", 0.2, 0.3]),
+        with_change(cost=[1.0, 3.0]),
+        with_change(cost=[1.0, -3.0, 6.0]),
+        with_change(name=DEFAULT_LEVERS[1]["name"]),
+    ):
+        with pytest.raises(ValueError):
+            ScenarioEngine(levers)
+
+    path = tmp_path / "levers.json"
+    path.write_text(json.dumps({"levers": with_change(feature="headcount")}))
+    with pytest.raises(ValueError):
+        ScenarioEngine.from_file(str(path))
+    assert len(ScenarioEngine(with_change(steps=[0.0, 1.0], cost=[0, 2]))) == 3 * 4 ** 3
+
+if __name__ == "__main__":
+    test_what_if_grid_and_budget()
+    test_equal_savings_prefer_cheaper_scenarios()
+    test_savings_fall_back_to_rule_fractions_without_a_model()
+    import pathlib
+    import tempfile
+    with tempfile.TemporaryDirectory() as d:
+        test_malformed_levers_are_rejected_on_load(pathlib.Path(d))
+    print("What-if grid scored in one call")
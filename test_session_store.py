@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+
+from services.memory_service import InMemorySessionService, SQLiteSessionService
+
+def make_stores(**limits):
+    return [InMemorySessionService(**limits), SQLiteSessionService(":memory:", **limits)]
+
+def test_idle_sessions_expire():
+    for store in make_stores(ttl_seconds=0.05):
+        session_id = store.create_session()
+        assert store.get_session(session_id) is not None
+        time.sleep(0.1)
+        assert store.get_session(session_id) is None
+        assert store.get_stats()["evictions"]["expired"] == 1
+
+def test_least_recently_used_session_is_evicted():
+    for store in make_stores(max_sessions=2):
+        first, second = store.create_session(), store.create_session()
+        time.sleep(0.01)
+        store.get_session(first)
+        third = store.create_session()
+        assert store.get_session(second) is None
+        assert store.get_session(first) is not None and store.get_session(third) is not None
+        assert store.get_stats()["evictions"]["lru"] == 1
+
+def test_byte_budget_evicts_other_sessions():
+    frame = pd.DataFrame({"energy_usage_kwh": np.arange(20_000, dtype=np.float64)})
+    for store in make_stores(max_bytes=300_000):
+        first, second = store.create_session(), store.create_session()
+        store.update_session(first, "data_frame", frame)
+        store.update_session(second, "data_frame", frame)
+        # The session being written survives even though it alone nearly fills the budget
+        assert store.get_session(first) is None
+        assert store.get_session(second)["data_frame"].equals(frame)
+        assert store.get_stats()["evictions"]["size"] == 1
+
+def test_sqlite_reads_large_values_lazily():
+    store = SQLiteSessionService(":memory:")
+    session_id = store.create_session()
+    store.update_session(session_id, "data", {"energy_usage_kwh": 1.0})
+    store.update_session(session_id, "data_frame", pd.DataFrame({"a": [1, 2]}))
+
+    session = store.get_session(session_id)
+    # Not unpickled until it is read
+    assert "data_frame" in session and not isinstance(dict.__getitem__(session, "data_frame"), pd.DataFrame)
+    assert session["data"] == {"energy_usage_kwh": 1.0}
+    assert list(session.get("data_frame")["a"]) == [1, 2]
+    assert session.get("missing") is None
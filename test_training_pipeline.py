@@ -0,0 +1,64 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+sys.path.append(os.path.join(ROOT, 'ml'))
+
+from training_pipeline import FEATURES, TARGET, SpilledDataset, fit_early_stopped, iter_file_chunks
+
+def raw_frame(n_rows: int = 300) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "energy_consumption_kwh": rng.uniform(100, 5000, n_rows),   # upload alias of energy_usage_kwh
+        "fuel_consumption_liters": rng.uniform(50, 2000, n_rows),
+        "distance_traveled_km": rng.uniform(10, 3000, n_rows),
+        "waste_generated_kg": rng.uniform(1, 500, n_rows),
+        "renewable_energy_pct": rng.uniform(0, 1, n_rows),           # not a feature; dropped
+    })
+    df.loc[::7, "fuel_consumption_liters"] = np.nan
+    df[TARGET] = 0.5 * df["energy_consumption_kwh"] + 2.7 * df["fuel_consumption_liters"].fillna(500)
+    return df
+
+def test_csv_and_parquet_chunks_round_trip(tmp_path):
+    df = raw_frame()
+    df.to_csv(tmp_path / "data.csv", index=False)
+    df.to_parquet(tmp_path / "data.parquet", index=False)
+
+    from_csv = pd.concat(list(iter_file_chunks(str(tmp_path / "data.csv"), chunk_size=64)), ignore_index=True)
+    from_parquet = pd.concat(list(iter_file_chunks(str(tmp_path / "data.parquet"), chunk_size=64)), ignore_index=True)
+
+    assert list(from_csv.columns) == FEATURES + [TARGET]
+    pd.testing.assert_frame_equal(from_csv, from_parquet, rtol=1e-6)
+    np.testing.assert_allclose(from_csv["energy_usage_kwh"], df["energy_consumption_kwh"], rtol=1e-6)
+    # company_size is missing from the file and takes the upload default
+    assert (from_csv["company_size"] == 10.0).all()
+
+    # Imputation uses training-row means only
+    dataset = SpilledDataset(str(tmp_path)).build(iter([from_csv]), test_fraction=0.3)
+    train_fuel = np.asarray(dataset.frame("X_train")["fuel_consumption_liters"])
+    assert not np.isnan(train_fuel).any()
+    test = np.random.default_rng(42).random(len(from_csv)) < 0.3
+    expected = np.nanmean(from_csv["fuel_consumption_liters"].to_numpy()[~test])
+    assert np.isclose(dataset.means[FEATURES.index("fuel_consumption_liters")], expected, rtol=1e-5)
+
+def test_early_stopping_scores_the_chosen_forest_on_the_validation_fold():
+    df = raw_frame().rename(columns={"energy_consumption_kwh": "energy_usage_kwh"}).fillna(0)
+    df["company_size"] = 10.0
+    X, y = df[FEATURES], df[TARGET].to_numpy()
+    result = fit_early_stopped({"max_depth": 6}, X.iloc[:240], y[:240], X.iloc[240:], y[240:],
+                               tol=0.5, max_trees=50, seed=0)
+    assert result["n_estimators"] in (25, 50)
+    # Trees were chosen on a split of the training fold, not on the fold that is scored
+    assert result["mse"] != result["stop_mse"]
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    with tempfile.TemporaryDirectory() as d:
+        test_csv_and_parquet_chunks_round_trip(pathlib.Path(d))
+    test_early_stopping_scores_the_chosen_forest_on_the_validation_fold()
+    print("Training data round-trips through CSV and Parquet")